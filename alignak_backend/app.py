@@ -25,7 +25,7 @@ except ImportError:
     from urllib.parse import urlparse
 
 from collections import OrderedDict
-from datetime import datetime, timedelta
+from datetime import datetime
 
 import logging
 from logging.config import dictConfig as logger_dictConfig
@@ -48,7 +48,7 @@ from eve.methods.post import post_internal
 from eve.utils import debug_error_message
 from eve_swagger import swagger
 from flask import current_app, g, request, abort, jsonify, make_response, send_from_directory, \
-    redirect
+    redirect, has_request_context
 from flask_apscheduler import APScheduler
 from flask_bootstrap import Bootstrap
 from werkzeug.security import check_password_hash, generate_password_hash
@@ -56,11 +56,21 @@ from bson.objectid import ObjectId
 
 import alignak_backend
 from alignak_backend import manifest
+from alignak_backend.bulk import bulk_find, bulk_patch_internal, bulk_post_internal, \
+    prepare_insert
+from alignak_backend.cache import VersionedCache
+from alignak_backend.carbonpool import CarbonPool
 from alignak_backend.grafana import Grafana
+from alignak_backend.influxdbpool import InfluxdbPool
 from alignak_backend.livesynthesis import Livesynthesis
 from alignak_backend.models import register_models
+from alignak_backend.names import Names
+from alignak_backend.overall import Overall
+from alignak_backend.perfdata import Metric
+from alignak_backend.realmtree import RealmTree
 from alignak_backend.template import Template
-from alignak_backend.timeseries import Timeseries
+from alignak_backend.timeseries import Timeseries, TimeseriesExport
+from alignak_backend.writebehind import WriteBehind
 
 _subcommands = OrderedDict()
 
@@ -69,15 +79,15 @@ class MyTokenAuth(TokenAuth):
     """
     Class to manage authentication
     """
-    children_realms = {}
-    parent_realms = {}
-
     """Authentication token class"""
     def check_auth(self, token, allowed_roles, resource, method):
-        # pylint: disable=too-many-locals
         """
         Check if account exist and get roles for this user
 
+        The user rights resolved for a token are cached (see AUTH_CACHE_TTL and AUTH_CACHE_SIZE
+        settings) to avoid resolving them again for each request. The cache is cleared in all
+        the backend processes when an user, a restriction role or a realm is modified.
+
         :param token: token for auth
         :type token: str
         :param allowed_roles:
@@ -89,69 +99,91 @@ class MyTokenAuth(TokenAuth):
         :return: True if user exist and password is ok or if no roles defined, otherwise False
         :rtype: bool
         """
-        user = current_app.data.driver.db['user'].find_one({'token': token})
-        if user:
-            # We get all resources we have in the backend for the userrestrictrole with *
-            resource_list = list(current_app.config['DOMAIN'])
+        if not token:
+            # Users without a token have an empty token
+            return False
+
+        auth_cache.check_version()
+        rights = auth_cache.get(token)
+        if rights is None:
+            user = current_app.data.driver.db['user'].find_one({'token': token})
+            if not user:
+                return False
+            rights = self.get_user_rights(user)
+            auth_cache.set(token, rights)
 
-            g.updateRealm = False
-            g.updateGroup = False
-            g.user_realm = user['_realm']
+        g.updateRealm = False
+        g.updateGroup = False
+        for key, value in iteritems(rights):
+            # Copy the rights because some hooks update them during the request
+            if isinstance(value, dict):
+                value = dict((res, list(realms)) for res, realms in iteritems(value))
+            setattr(g, key, value)
+        self.set_request_auth_value(rights['users_id'])
+        return True
+
+    def get_user_rights(self, user):
+        # pylint: disable=too-many-locals
+        """
+        Get the rights of an user from its userrestrictrole
 
-            # get children of realms for rights
-            realmsdrv = current_app.data.driver.db['realm']
-            allrealms = realmsdrv.find()
-            self.children_realms = {}
-            self.parent_realms = {}
-            for realm in allrealms:
-                self.children_realms[realm['_id']] = realm['_all_children']
-                self.parent_realms[realm['_id']] = realm['_tree_parents']
-
-            g.back_role_super_admin = user['back_role_super_admin']
-            g.can_submit_commands = user['can_submit_commands']
-            userrestrictroles = current_app.data.driver.db['userrestrictrole']
-            userrestrictrole = userrestrictroles.find({'user': user['_id']})
-            g.resources_get = {}
-            g.resources_get_parents = {}
-            get_parents = {}
-            g.resources_get_custom = {}
-            g.resources_post = {}
-            g.resources_post_parents = {}
-            g.resources_patch = {}
-            g.resources_patch_parents = {}
-            g.resources_patch_custom = {}
-            g.resources_delete = {}
-            g.resources_delete_parents = {}
-            g.resources_delete_custom = {}
-            for rights in userrestrictrole:
-                self.add_resources_realms('read', rights, False, g.resources_get, resource_list,
-                                          get_parents)
-                self.add_resources_realms('read', rights, True, g.resources_get_custom,
-                                          resource_list)
-                self.add_resources_realms('create', rights, False, g.resources_post, resource_list)
-                self.add_resources_realms('update', rights, False, g.resources_patch,
-                                          resource_list)
-                self.add_resources_realms('update', rights, True, g.resources_patch_custom,
-                                          resource_list)
-                self.add_resources_realms('delete', rights, False, g.resources_delete,
-                                          resource_list)
-                self.add_resources_realms('delete', rights, True, g.resources_delete_custom,
-                                          resource_list)
-            for res in g.resources_get:
-                g.resources_get[res] = list(set(g.resources_get[res]))
-                if res in g.resources_get_custom:
-                    g.resources_get_custom[res] = list(set(g.resources_get_custom[res]))
-                g.resources_get_parents[res] = [item for item in get_parents[res]
-                                                if item not in g.resources_get[res]]
-            for res in g.resources_post:
-                g.resources_post[res] = list(set(g.resources_post[res]))
-            for res in g.resources_patch:
-                g.resources_patch[res] = list(set(g.resources_patch[res]))
-            for res in g.resources_delete:
-                g.resources_delete[res] = list(set(g.resources_delete[res]))
-            g.users_id = user['_id']
-            self.set_request_auth_value(user['_id'])
-        return user
+        :param user: the user (from mongo)
+        :type user: dict
+        :return: the user rights to set in the request context
+        :rtype: dict
+        """
+        # We get all resources we have in the backend for the userrestrictrole with *
+        resource_list = list(current_app.config['DOMAIN'])
+
+        rights = {
+            'user_realm': user['_realm'],
+            'back_role_super_admin': user['back_role_super_admin'],
+            'can_submit_commands': user['can_submit_commands'],
+            'users_id': user['_id'],
+            'resources_get': {},
+            'resources_get_parents': {},
+            'resources_get_custom': {},
+            'resources_post': {},
+            'resources_post_parents': {},
+            'resources_patch': {},
+            'resources_patch_parents': {},
+            'resources_patch_custom': {},
+            'resources_delete': {},
+            'resources_delete_parents': {},
+            'resources_delete_custom': {}
+        }
+        get_parents = {}
+        userrestrictroles = current_app.data.driver.db['userrestrictrole']
+        userrestrictrole = userrestrictroles.find({'user': user['_id']})
+        for urr in userrestrictrole:
+            self.add_resources_realms('read', urr, False, rights['resources_get'], resource_list,
+                                      get_parents)
+            self.add_resources_realms('read', urr, True, rights['resources_get_custom'],
+                                      resource_list)
+            self.add_resources_realms('create', urr, False, rights['resources_post'],
+                                      resource_list)
+            self.add_resources_realms('update', urr, False, rights['resources_patch'],
+                                      resource_list)
+            self.add_resources_realms('update', urr, True, rights['resources_patch_custom'],
+                                      resource_list)
+            self.add_resources_realms('delete', urr, False, rights['resources_delete'],
+                                      resource_list)
+            self.add_resources_realms('delete', urr, True, rights['resources_delete_custom'],
+                                      resource_list)
+        for res in rights['resources_get']:
+            rights['resources_get'][res] = list(set(rights['resources_get'][res]))
+            if res in rights['resources_get_custom']:
+                rights['resources_get_custom'][res] = \
+                    list(set(rights['resources_get_custom'][res]))
+            rights['resources_get_parents'][res] = [item for item in get_parents[res]
+                                                    if item not in rights['resources_get'][res]]
+        for res in rights['resources_post']:
+            rights['resources_post'][res] = list(set(rights['resources_post'][res]))
+        for res in rights['resources_patch']:
+            rights['resources_patch'][res] = list(set(rights['resources_patch'][res]))
+        for res in rights['resources_delete']:
+            rights['resources_delete'][res] = list(set(rights['resources_delete'][res]))
+        return rights
 
     def add_resources_realms(self, right, data, custom, resource, resource_list, parents=None):
         """
@@ -187,9 +219,9 @@ class MyTokenAuth(TokenAuth):
                     parents[my_resource] = []
                 resource[my_resource].append(data['realm'])
                 if right == 'read' and not custom:
-                    parents[my_resource].extend(self.parent_realms[data['realm']])
+                    parents[my_resource].extend(RealmTree.get_tree_parents(data['realm']))
                 if data['sub_realm']:
-                    resource[my_resource].extend(self.children_realms[data['realm']])
+                    resource[my_resource].extend(RealmTree.get_all_children(data['realm']))
 
 
 class MyValidator(Validator):
@@ -234,6 +266,21 @@ def notify_alignak(event=None, parameters=None, notification=None):
         current_app.logger.error("Alignak notification log failed: %s" % str(exp))
 
 
+def invalidate_auth_cache(resource, *args):
+    """Hook called when an item is inserted, updated, replaced or deleted
+
+    The cached users rights are computed from the user, userrestrictrole and realm resources.
+    When one of them changes, the cache is cleared in all the backend processes.
+
+    :param resource: name of the modified resource
+    :type resource: str
+    :return: None
+    """
+    # pylint: disable=unused-argument
+    if resource in ['user', 'userrestrictrole', 'realm']:
+        auth_cache.invalidate()
+
+
 # Hooks used to check user's rights
 def pre_get(resource, user_request, lookup):
     """Hook before get data. Add filter depend on roles of user
@@ -432,22 +479,29 @@ def pre_history_post(items):
 
     If host _id is not provided, search for an host with host_name. Same for service and user.
 
+    The hosts, services and users of all the items are resolved with one names cache lookup
+    per resource (see Names.find), so that a batch of history events only needs at most one
+    database request per resource.
+
     :param items: history fields
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
-    services_drv = current_app.data.driver.db['service']
-    users_drv = current_app.data.driver.db['user']
+    # Resolve the hosts
+    hosts = Names.find('host',
+                       ids=[item['host'] for item in items if item.get('host')],
+                       names=[item['host_name'] for item in items
+                              if not item.get('host') and item.get('host_name')])
+    items_with_host = []
     for dummy, item in enumerate(items):
         if 'host' in item and item['host']:
-            host = hosts_drv.find_one({'_id': item['host']})
+            host = hosts.get(item['host'])
             if host:
                 item['host_name'] = host['name']
             else:
                 continue
         elif 'host_name' in item and item['host_name']:
-            host = hosts_drv.find_one({'name': item['host_name']})
+            host = hosts.get(Names.get_name_key('host', item['host_name']))
             if host:
                 item['host'] = host['_id']
             else:
@@ -455,28 +509,42 @@ def pre_history_post(items):
         else:
             continue
 
-        host = hosts_drv.find_one({'_id': item['host']})
         # Set _realm as host's _realm
         item['_realm'] = host['_realm']
         item['_sub_realm'] = host['_sub_realm']
-
+        items_with_host.append(item)
+
+    # Resolve the services of the items with an host
+    services = Names.find('service',
+                          ids=[item['service'] for item in items_with_host
+                               if item.get('service')],
+                          names=[(item['host'], item['service_name']) for item in items_with_host
+                                 if not item.get('service') and item.get('service_name')])
+    for dummy, item in enumerate(items_with_host):
         # Find service and service_name
         if 'service' in item and item['service']:
-            service = services_drv.find_one({'_id': item['service']})
+            service = services.get(item['service'])
             if service:
                 item['service_name'] = service['name']
         elif 'service_name' in item and item['service_name']:
-            service = services_drv.find_one({'host': item['host'], 'name': item['service_name']})
+            service = services.get(Names.get_name_key('service',
+                                                      (item['host'], item['service_name'])))
             if service:
                 item['service'] = service['_id']
 
+    # Resolve the users of the items with an host
+    users = Names.find('user',
+                       ids=[item['user'] for item in items_with_host if item.get('user')],
+                       names=[item['user_name'] for item in items_with_host
+                              if not item.get('user') and item.get('user_name')])
+    for dummy, item in enumerate(items_with_host):
         # Find user and user_name
         if 'user' in item and item['user']:
-            user = users_drv.find_one({'_id': item['user']})
+            user = users.get(item['user'])
             if user:
                 item['user_name'] = user['name']
         elif 'user_name' in item and item['user_name']:
-            user = users_drv.find_one({'name': item['user_name']})
+            user = users.get(Names.get_name_key('user', item['user_name']))
             if user:
                 item['user'] = user['_id']
         else:
@@ -485,30 +553,81 @@ def pre_history_post(items):
 
 
 # Log checks results
+# Hosts and services fields used when a logcheckresult is posted
+LCR_LIVESTATE_FIELDS = ['name', 'host', '_realm', 'ls_state', 'ls_state_type', 'ls_acknowledged',
+                        'ls_downtimed', 'ls_last_check']
+
+
 def pre_logcheckresult_post(items):
     """
     Hook before adding new logcheckresult
 
+    The names of the concerned hosts and services are resolved with the names cache, then the
+    hosts and services are searched for with one request for all the items. Only their
+    LCR_LIVESTATE_FIELDS fields are fetched.
+
+    The live state is not updated by a log check result older than the last check of its host
+    or service. This is decided for each item of the posted items, and stored in the request
+    context as a list in the items order.
+
     :param items: logcheckresult fields
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
-    services_drv = current_app.data.driver.db['service']
+    # Find all the concerned hosts
+    host_names = []
     for dummy, item in enumerate(items):
         current_app.logger.debug("LCR - got a check result: %s" % item)
 
         if not item.get('host') and not item.get('host_name'):
             abort(make_response("Posting LCR without host information is not accepted.", 412))
 
-        # Find the concerned host
         if not item.get('host'):
-            host = hosts_drv.find_one({'name': item['host_name']})
+            host_names.append(item['host_name'])
+
+    names = Names.find('host', names=host_names)
+    for dummy, item in enumerate(items):
+        if not item.get('host'):
+            host = names.get(Names.get_name_key('host', item['host_name']))
+            if host is None:
+                abort(make_response("Posting LCR for an unknown host is not accepted.", 412))
             item['host'] = host['_id']
-        else:
-            host = hosts_drv.find_one({'_id': item['host']})
-            item['host_name'] = host['name']
-        item_last_check = host['ls_last_check']
+
+    hosts = bulk_find('host', [item['host'] for item in items], LCR_LIVESTATE_FIELDS)
+
+    # Find all the concerned services
+    service_names = []
+    for dummy, item in enumerate(items):
+        host = hosts.get(item['host'])
+        if host is None:
+            abort(make_response("Posting LCR for an unknown host is not accepted.", 412))
+        item['host_name'] = host['name']
+
+        if item.get('service_name') and not item.get('service'):
+            service_names.append((item['host'], item['service_name']))
+
+    names = Names.find('service', names=service_names)
+    for dummy, item in enumerate(items):
+        if item.get('service_name') and not item.get('service'):
+            service = names.get(Names.get_name_key('service',
+                                                   (item['host'], item['service_name'])))
+            if service is None:
+                abort(make_response("Posting LCR for an unknown service is not accepted.", 412))
+            item['service'] = service['_id']
+
+    services = bulk_find('service', [item['service'] for item in items if item.get('service')],
+                         LCR_LIVESTATE_FIELDS)
+
+    # Last check and live state of each host / service, including the previous items of the batch
+    last_checks = {}
+    previous_states = {}
+    # Live state update and history event creation for each item
+    g.lcr_update_livestate = []
+    g.lcr_history = []
+    for dummy, item in enumerate(items):
+        host = hosts[item['host']]
+        item_last_check = last_checks.get(host['_id'], host['ls_last_check'])
+        previous = previous_states.get(host['_id'], host)
 
         if not item.get('service') and not item.get('service_name'):
             # This is valid for an host check result
@@ -516,123 +635,241 @@ def pre_logcheckresult_post(items):
             item['service_name'] = ''
         else:
             # We got a service check result
-            if item.get('service_name') and not item.get('service'):
-                service = services_drv.find_one(
-                    {'host': item['host'], 'name': item['service_name']})
-                item['service'] = service['_id']
-
-            if item.get('service') and not item.get('service_name'):
-                service = services_drv.find_one({'_id': item['service']})
-                item['service_name'] = service['name']
-            item_last_check = service['ls_last_check']
+            service = services.get(item['service'])
+            if service is None:
+                abort(make_response("Posting LCR for an unknown service is not accepted.", 412))
+            item['service'] = service['_id']
+            item['service_name'] = service['name']
+            item_last_check = last_checks.get(service['_id'], service['ls_last_check'])
+            previous = previous_states.get(service['_id'], service)
 
         # Set _realm as host's _realm
         item['_realm'] = host['_realm']
 
-        g.updateLivestate = True
+        g.lcr_history.append(is_logcheckresult_history(item, previous))
+
         # If the log check result is older than the item last check, do not update the livestate
         if item_last_check and item['last_check'] < item_last_check:
             current_app.logger.debug("LCR - will not update the livestate: %s / %s",
                                      item['last_check'], item_last_check)
-            g.updateLivestate = False
+            g.lcr_update_livestate.append(False)
+        else:
+            g.lcr_update_livestate.append(True)
+            last_checks[item['service'] or item['host']] = item['last_check']
+            # The next items of the batch are compared with this one
+            previous_states[item['service'] or item['host']] = {
+                'ls_state': item['state'],
+                'ls_state_type': item['state_type'],
+                'ls_acknowledged': item['acknowledged'],
+                'ls_downtimed': item['downtimed'],
+                'ls_last_check': item['last_check']
+            }
 
         current_app.logger.debug("LCR - inserting an LCR for %s/%s...",
                                  item['host_name'], item['service_name'])
 
 
+def is_logcheckresult_history(item, previous):
+    """
+    Get if an history event must be created for a logcheckresult
+
+    This depends upon the history_check_result policy of the item realm:
+    - all: always create an history event
+    - state_change: only if the state, state type, acknowledgement or downtime changed since
+    the previous check
+    - heartbeat: also for the first check of each period of history_heartbeat minutes
+
+    :param item: logcheckresult fields
+    :type item: dict
+    :param previous: live state of the host or service before this logcheckresult
+    :type previous: dict
+    :return: True if an history event must be created
+    :rtype: bool
+    """
+    realm = RealmTree.get_realm(item['_realm'])
+    if realm is None or realm['history_check_result'] == 'all':
+        return True
+
+    if item['state'] != previous['ls_state'] \
+            or item['state_type'] != previous['ls_state_type'] \
+            or item['acknowledged'] != previous['ls_acknowledged'] \
+            or item['downtimed'] != previous['ls_downtimed']:
+        return True
+
+    if realm['history_check_result'] == 'heartbeat':
+        period = realm['history_heartbeat'] * 60
+        return item['last_check'] // period != (previous['ls_last_check'] or 0) // period
+
+    return False
+
+
+def get_logcheckresult_livestate(item):
+    """
+    Get the host or service live state fields updated by a logcheckresult
+
+    :param item: logcheckresult fields
+    :type item: dict
+    :return: live state fields
+    :rtype: dict
+    """
+    data = {
+        'ls_state': item['state'],
+        'ls_state_type': item['state_type'],
+        'ls_state_id': item['state_id'],
+        'ls_acknowledged': item['acknowledged'],
+        'ls_acknowledgement_type': item['acknowledgement_type'],
+        'ls_downtimed': item['downtimed'],
+        'ls_last_check': item['last_check'],
+        'ls_last_state': item['last_state'],
+        'ls_last_state_type': item['last_state_type'],
+        'ls_output': item['output'],
+        'ls_long_output': item['long_output'],
+        'ls_perf_data': item['perf_data'],
+        'ls_current_attempt': item['current_attempt'],
+        'ls_latency': item['latency'],
+        'ls_execution_time': item['execution_time'],
+        'ls_passive_check': item['passive_check'],
+        'ls_state_changed': item.get('state_changed'),
+        'ls_last_state_changed': item['last_state_changed'],
+        'ls_last_hard_state_changed': item['last_hard_state_changed'],
+        'ls_last_time_unreachable': item['last_time_4']
+    }
+    if item['service']:
+        data.update({
+            'ls_last_time_ok': item['last_time_0'],
+            'ls_last_time_warning': item['last_time_1'],
+            'ls_last_time_critical': item['last_time_2'],
+            'ls_last_time_unknown': item['last_time_3']
+        })
+    else:
+        data.update({
+            'ls_last_time_up': item['last_time_0'],
+            'ls_last_time_down': item['last_time_1']
+        })
+    return data
+
+
+def get_logcheckresult_history(item):
+    """
+    Get the history event created for a logcheckresult
+
+    :param item: logcheckresult fields
+    :type item: dict
+    :return: history fields
+    :rtype: dict
+    """
+    message = "%s[%s] (%s/%s): %s" % (item['state'], item['state_type'],
+                                      item['acknowledged'], item['downtimed'],
+                                      item['output'])
+    return {
+        'host': item['host'],
+        'host_name': item['host_name'],
+        'service': item['service'],
+        'service_name': item['service_name'],
+        'user': None,
+        'type': 'check.result',
+        'message': message,
+        'logcheckresult': item['_id']
+    }
+
+
 def after_insert_logcheckresult(items):
     """
     Hook after logcheckresult inserted.
 
+    If LCR_BULK_INGESTION is set, the live state of all the services and then of all the hosts
+    is updated with one request per collection and all the history events are inserted with
+    one request.
+
     :param items: realm fields
     :type items: dict
     :return: None
     """
-    for dummy, item in enumerate(items):
+    if current_app.config.get('LCR_BULK_INGESTION', False):
+        bulk_insert_logcheckresult(items)
+        return
+
+    for index, item in enumerate(items):
         current_app.logger.debug("LCR - inserted an LCR for %s/%s...",
                                  item['host_name'], item['service_name'])
         current_app.logger.debug("    -> %s..." % item)
 
-        if g.updateLivestate:
+        if g.lcr_update_livestate[index]:
             # Update the livestate...
+            data = get_logcheckresult_livestate(item)
             if item['service']:
                 # ...for a service
                 lookup = {"_id": item['service']}
-                data = {
-                    'ls_state': item['state'],
-                    'ls_state_type': item['state_type'],
-                    'ls_state_id': item['state_id'],
-                    'ls_acknowledged': item['acknowledged'],
-                    'ls_acknowledgement_type': item['acknowledgement_type'],
-                    'ls_downtimed': item['downtimed'],
-                    'ls_last_check': item['last_check'],
-                    'ls_last_state': item['last_state'],
-                    'ls_last_state_type': item['last_state_type'],
-                    'ls_output': item['output'],
-                    'ls_long_output': item['long_output'],
-                    'ls_perf_data': item['perf_data'],
-                    'ls_current_attempt': item['current_attempt'],
-                    'ls_latency': item['latency'],
-                    'ls_execution_time': item['execution_time'],
-                    'ls_passive_check': item['passive_check'],
-                    'ls_state_changed': item.get('state_changed'),
-                    'ls_last_state_changed': item['last_state_changed'],
-                    'ls_last_hard_state_changed': item['last_hard_state_changed'],
-                    'ls_last_time_ok': item['last_time_0'],
-                    'ls_last_time_warning': item['last_time_1'],
-                    'ls_last_time_critical': item['last_time_2'],
-                    'ls_last_time_unknown': item['last_time_3'],
-                    'ls_last_time_unreachable': item['last_time_4']
-                }
                 (pi_a, pi_b, pi_c, pi_d) = patch_internal('service', data, False, False, **lookup)
             else:
                 # ...for an host
                 lookup = {"_id": item['host']}
-                data = {
-                    'ls_state': item['state'],
-                    'ls_state_type': item['state_type'],
-                    'ls_state_id': item['state_id'],
-                    'ls_acknowledged': item['acknowledged'],
-                    'ls_acknowledgement_type': item['acknowledgement_type'],
-                    'ls_downtimed': item['downtimed'],
-                    'ls_last_check': item['last_check'],
-                    'ls_last_state': item['last_state'],
-                    'ls_last_state_type': item['last_state_type'],
-                    'ls_output': item['output'],
-                    'ls_long_output': item['long_output'],
-                    'ls_perf_data': item['perf_data'],
-                    'ls_current_attempt': item['current_attempt'],
-                    'ls_latency': item['latency'],
-                    'ls_execution_time': item['execution_time'],
-                    'ls_passive_check': item['passive_check'],
-                    'ls_state_changed': item.get('state_changed'),
-                    'ls_last_state_changed': item['last_state_changed'],
-                    'ls_last_hard_state_changed': item['last_hard_state_changed'],
-                    'ls_last_time_up': item['last_time_0'],
-                    'ls_last_time_down': item['last_time_1'],
-
-                    'ls_last_time_unreachable': item['last_time_4']
-                }
                 (pi_a, pi_b, pi_c, pi_d) = patch_internal('host', data, False, False, **lookup)
 
             current_app.logger.debug("LCR - updated the livestate: %s, %s, %s, %s",
                                      pi_a, pi_b, pi_c, pi_d)
 
-        # Create an history event for the new logcheckresult
-        message = "%s[%s] (%s/%s): %s" % (item['state'], item['state_type'],
-                                          item['acknowledged'], item['downtimed'],
-                                          item['output'])
-        data = {
-            'host': item['host'],
-            'host_name': item['host_name'],
-            'service': item['service'],
-            'service_name': item['service_name'],
-            'user': None,
-            'type': 'check.result',
-            'message': message,
-            'logcheckresult': item['_id']
-        }
-        post_internal("history", data, True)
+    post_logcheckresult_history(items)
+
+
+def bulk_insert_logcheckresult(items):
+    """
+    Update the live state and create the history events for some logcheckresult
+
+    The services are updated before the hosts because the host overall state depends upon its
+    services overall state.
+
+    :param items: logcheckresult fields
+    :type items: dict
+    :return: None
+    """
+    fresh_items = [item for index, item in enumerate(items) if g.lcr_update_livestate[index]]
+
+    # The update hooks need the whole documents
+    services = bulk_find('service', [item['service'] for item in fresh_items if item['service']])
+    patches = [(services[item['service']], get_logcheckresult_livestate(item))
+               for item in fresh_items if item['service']]
+    count = bulk_patch_internal('service', patches)
+    current_app.logger.debug("LCR - updated the livestate of %d services", count)
+
+    # Services updates may have changed their hosts, get the current hosts
+    host_ids = [item['host'] for item in fresh_items if not item['service']]
+    if host_ids:
+        hosts = bulk_find('host', host_ids)
+        patches = [(hosts[item['host']], get_logcheckresult_livestate(item))
+                   for item in fresh_items if not item['service']]
+        count = bulk_patch_internal('host', patches)
+        current_app.logger.debug("LCR - updated the livestate of %d hosts", count)
+
+    post_logcheckresult_history(items)
+
+
+def post_logcheckresult_history(items):
+    """
+    Create the history events for some logcheckresult
+
+    The history events are only created for the items selected by the realm history policy
+    (see is_logcheckresult_history).
+
+    If HISTORY_WRITE_BEHIND is set, the history events are queued to be inserted by a
+    background thread. Else, if LCR_BULK_INGESTION is set, they are inserted with one request.
+
+    :param items: logcheckresult fields
+    :type items: dict
+    :return: None
+    """
+    documents = [get_logcheckresult_history(item) for index, item in enumerate(items)
+                 if g.lcr_history[index]]
+    if not documents:
+        return
+    if current_app.config.get('HISTORY_WRITE_BEHIND', False):
+        prepare_insert('history', documents)
+        history_queue.put(documents)
+    elif current_app.config.get('LCR_BULK_INGESTION', False):
+        bulk_post_internal('history', documents)
+    else:
+        for document in documents:
+            post_internal('history', document, True)
 
 
 # Actions
@@ -668,10 +905,9 @@ def pre_actionacknowledge_post(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
     for dummy, item in enumerate(items):
         # Set _realm as host's _realm
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = Names.get('host', _id=item['host'])
         item['_realm'] = host['_realm']
         item['_sub_realm'] = host['_sub_realm']
 
@@ -684,14 +920,12 @@ def after_insert_actionacknowledge(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
-    services_drv = current_app.data.driver.db['service']
     for dummy, item in enumerate(items):
         # Get concerned host
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = Names.get('host', _id=item['host'])
         service_name = ''
         if item['service']:
-            service = services_drv.find_one({'_id': item['service']})
+            service = Names.get('service', _id=item['service'])
             service_name = service['name']
 
         # Create an history event for the new acknowledge
@@ -718,14 +952,11 @@ def after_update_actionacknowledge(updated, original):
     :return: None
     """
     if 'processed' in updated and updated['processed']:
-        hosts_drv = current_app.data.driver.db['host']
-        services_drv = current_app.data.driver.db['service']
-
         # Get concerned host
-        host = hosts_drv.find_one({'_id': original['host']})
+        host = Names.get('host', _id=original['host'])
         service_name = ''
         if original['service']:
-            service = services_drv.find_one({'_id': original['service']})
+            service = Names.get('service', _id=original['service'])
             service_name = service['name']
 
         # Create an history event for the changed acknowledge
@@ -752,10 +983,9 @@ def pre_actiondowntime_post(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
     for dummy, item in enumerate(items):
         # Set _realm as host's _realm
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = Names.get('host', _id=item['host'])
         item['_realm'] = host['_realm']
         item['_sub_realm'] = host['_sub_realm']
 
@@ -768,14 +998,12 @@ def after_insert_actiondowntime(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
-    services_drv = current_app.data.driver.db['service']
     for dummy, item in enumerate(items):
         # Get concerned host
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = Names.get('host', _id=item['host'])
         service_name = ''
         if item['service']:
-            service = services_drv.find_one({'_id': item['service']})
+            service = Names.get('service', _id=item['service'])
             service_name = service['name']
 
         # Create an history event for the new downtime
@@ -802,14 +1030,11 @@ def after_update_actiondowntime(updated, original):
     :return: None
     """
     if 'processed' in updated and updated['processed']:
-        hosts_drv = current_app.data.driver.db['host']
-        services_drv = current_app.data.driver.db['service']
-
         # Get concerned host
-        host = hosts_drv.find_one({'_id': original['host']})
+        host = Names.get('host', _id=original['host'])
         service_name = ''
         if original['service']:
-            service = services_drv.find_one({'_id': original['service']})
+            service = Names.get('service', _id=original['service'])
             service_name = service['name']
 
         # Create an history event for the changed downtime
@@ -836,10 +1061,9 @@ def pre_actionforcecheck_post(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
     for dummy, item in enumerate(items):
         # Set _realm as host's _realm
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = Names.get('host', _id=item['host'])
         item['_realm'] = host['_realm']
         item['_sub_realm'] = host['_sub_realm']
 
@@ -852,14 +1076,12 @@ def after_insert_actionforcecheck(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
-    services_drv = current_app.data.driver.db['service']
     for dummy, item in enumerate(items):
         # Get concerned host
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = Names.get('host', _id=item['host'])
         service_name = ''
         if item['service']:
-            service = services_drv.find_one({'_id': item['service']})
+            service = Names.get('service', _id=item['service'])
             service_name = service['name']
 
         # Create an history event for the new forcecheck
@@ -886,14 +1108,11 @@ def after_update_actionforcecheck(updated, original):
     :return: None
     """
     if 'processed' in updated and updated['processed']:
-        hosts_drv = current_app.data.driver.db['host']
-        services_drv = current_app.data.driver.db['service']
-
         # Get concerned host
-        host = hosts_drv.find_one({'_id': original['host']})
+        host = Names.get('host', _id=original['host'])
         service_name = ''
         if original['service']:
-            service = services_drv.find_one({'_id': original['service']})
+            service = Names.get('service', _id=original['service'])
             service_name = service['name']
 
         # Create an history event for the changed forcecheck
@@ -1142,7 +1361,6 @@ def pre_timeseries_post(items):
     """
     graphite_drv = current_app.data.driver.db['graphite']
     influxdb_drv = current_app.data.driver.db['influxdb']
-    realm_drv = current_app.data.driver.db['realm']
     for dummy, item in enumerate(items):
         if 'grafana' in item and item['grafana'] is not None:
             # search graphite with grafana id in this realm
@@ -1154,13 +1372,13 @@ def pre_timeseries_post(items):
                     {'_realm': item['_realm'], 'grafana': item['grafana']}) > 0:
                 abort(make_response("A timeserie is yet attached to grafana in this realm", 412))
             # get parent realms
-            tsrealms = realm_drv.find_one({'_id': item['_realm']})
+            tree_parents = RealmTree.get_tree_parents(item['_realm'])
             if graphite_drv.count(
-                    {'_realm': {'$in': tsrealms['_tree_parents']}, 'grafana': item['grafana'],
+                    {'_realm': {'$in': tree_parents}, 'grafana': item['grafana'],
                      '_sub_realm': True}) > 0:
                 abort(make_response("A timeserie is yet attached to grafana in parent realm", 412))
             if influxdb_drv.count(
-                    {'_realm': {'$in': tsrealms['_tree_parents']}, 'grafana': item['grafana'],
+                    {'_realm': {'$in': tree_parents}, 'grafana': item['grafana'],
                      '_sub_realm': True}) > 0:
                 abort(make_response("A timeserie is yet attached to grafana in parent realm", 412))
 
@@ -1267,6 +1485,9 @@ def after_insert_realm(items):
         # Notify Alignak
         notify_alignak(event='creation', parameters='realm:%s' % item['name'])
 
+    # The realms tree changed
+    RealmTree.invalidate()
+
 
 def after_update_realm(updated, original):
     """
@@ -1278,6 +1499,9 @@ def after_update_realm(updated, original):
     :type original: dict
     :return: None
     """
+    # The realms tree changed
+    RealmTree.invalidate()
+
     if g.updateRealm:
         if '_all_children' in updated and updated['_all_children'] != original['_all_children']:
             s = set(original['_all_children'])
@@ -1342,6 +1566,9 @@ def after_delete_realm(item):
         }, False, False, **lookup)
         g.updateRealm = False
 
+    # The realms tree changed
+    RealmTree.invalidate()
+
     # Notify Alignak
     notify_alignak(event='deletion', parameters='realm:%s' % item['name'])
 
@@ -1362,6 +1589,9 @@ def after_delete_resource_realm():
     }, False, False, **lookup)
     g.updateRealm = False
 
+    # The realms tree changed
+    RealmTree.invalidate()
+
 
 # Hosts deletion
 def pre_delete_host(item):
@@ -1519,16 +1749,16 @@ def pre_host_patch(updates, original):
                 overall_state = 5
             else:
                 if overall_state <= 2:
-                    services_drv = current_app.data.driver.db['service']
-                    services = services_drv.find({'host': original['_id']})
-                    for service in services:
-                        # Only for HARD states and monitored services
-                        if service['ls_state_type'] == 'HARD' and service['_overall_state_id'] < 5:
-                            overall_state = max(overall_state, service['_overall_state_id'])
+                    # Only for HARD states and monitored services
+                    overall_state = max(overall_state, Overall.get_worst_state(original))
 
             # Get the host services overall states
             updates['_overall_state_id'] = overall_state
 
+            # The host overall state is up to date with its services overall states
+            if original['_id'] in g.get('overall_hosts', []):
+                g.overall_hosts.remove(original['_id'])
+
         # Only some live state fields, do not change _updated field
         del updates['_updated']
 
@@ -1746,10 +1976,60 @@ def after_updated_service(updated, original):
     :type original: dict
     :return: None
     """
+    # Update the host services overall states counters
+    Overall.on_updated_service(updated, original)
+
     if '_overall_state_id' in updated:
         # Service overall was updated, we should update its host overall state
-        lookup = {"_id": original['host']}
-        patch_internal('host', {"_overall_state_id": -1}, False, False, **lookup)
+        if not has_request_context():
+            lookup = {"_id": original['host']}
+            patch_internal('host', {"_overall_state_id": -1}, False, False, **lookup)
+            return
+
+        # Only once for all the host services updated in the request
+        hosts = g.get('overall_hosts', [])
+        if original['host'] not in hosts:
+            hosts.append(original['host'])
+        g.overall_hosts = hosts
+
+
+def after_request_overall(response):
+    """
+    Called after each request
+
+    Update the overall state of the hosts for which some services overall state changed
+    during the request, and that were not yet updated since then. Nothing is updated if the
+    request failed.
+
+    :param response: the request response
+    :type response: flask.Response
+    :return: the request response
+    """
+    hosts = g.get('overall_hosts', [])
+    g.overall_hosts = []
+    if not 200 <= response.status_code < 300:
+        return response
+    for host in hosts:
+        lookup = {"_id": host}
+        try:
+            patch_internal('host', {"_overall_state_id": -1}, False, False, **lookup)
+        except Exception as exp:  # pylint: disable=broad-except
+            current_app.logger.error("Host %s overall state update failed: %s", host, exp)
+    return response
+
+
+def teardown_request_overall(exception):
+    """
+    Called at the end of each request, even if it was aborted
+
+    Forget the hosts for which the overall state was not updated.
+
+    :param exception: the exception that aborted the request, if any
+    :type exception: Exception
+    :return: None
+    """
+    # pylint: disable=unused-argument
+    g.overall_hosts = []
 
 
 # Users
@@ -2067,11 +2347,66 @@ settings['SCHEDULER_TIMESERIES_LIMIT'] = 100
 settings['SCHEDULER_GRAFANA_ACTIVE'] = False
 settings['SCHEDULER_GRAFANA_PERIOD'] = 120
 settings['SCHEDULER_LIVESYNTHESIS_HISTORY'] = 0
+settings['SCHEDULER_LIVESYNTHESIS_RECONCILE_ACTIVE'] = False
+settings['SCHEDULER_LIVESYNTHESIS_RECONCILE_PERIOD'] = 60
+settings['SCHEDULER_LIVESYNTHESIS_METRICS_ACTIVE'] = False
+settings['SCHEDULER_LIVESYNTHESIS_METRICS_PERIOD'] = 60
 settings['SCHEDULER_TIMEZONE'] = 'Etc/GMT'
 settings['JOBS'] = []
 
 settings['ALIGNAK_URL'] = ''
 
+# Users rights cache: entries time to live (seconds, 0 to disable) and maximum entries count.
+# The cache is only cleared in the process that modified an user, the other processes may
+# accept a revoked token until their cached rights expire
+settings['AUTH_CACHE_TTL'] = 30
+settings['AUTH_CACHE_SIZE'] = 1000
+
+# Hosts, services and users names cache: entries time to live (seconds, 0 to disable) and
+# maximum entries count. The cache is only cleared in the process that modified an item, the
+# other processes may resolve a former name or realm until their entries expire
+settings['NAME_CACHE_TTL'] = 60
+settings['NAME_CACHE_SIZE'] = 100000
+
+# Perfdata labels cache: maximum number of labels, 0 to disable
+settings['PERFDATA_CACHE_SIZE'] = 10000
+
+# Timeseries sanitized names cache: maximum number of names, 0 to disable
+settings['TIMESERIES_NAME_CACHE_SIZE'] = 100000
+
+# Log checks results: update the live state and create the history with bulk requests
+settings['LCR_BULK_INGESTION'] = False
+
+# Check results history: insert the history events from a background thread. The queue size,
+# the maximum number of events per insertion and the insertion period (milliseconds)
+settings['HISTORY_WRITE_BEHIND'] = False
+settings['HISTORY_QUEUE_SIZE'] = 10000
+settings['HISTORY_FLUSH_ITEMS'] = 500
+settings['HISTORY_FLUSH_INTERVAL'] = 1000
+
+# Timeseries: send the log checks results metrics from a background thread. The queue size,
+# the maximum number of log checks results per export and the export period (milliseconds)
+settings['TIMESERIES_WRITE_BEHIND'] = True
+settings['TIMESERIES_QUEUE_SIZE'] = 10000
+settings['TIMESERIES_FLUSH_ITEMS'] = 500
+settings['TIMESERIES_FLUSH_INTERVAL'] = 1000
+
+# Graphite: persistent connections to the carbon daemons (pickle protocol). The maximum number
+# of buffered metrics for each carbon, the maximum number of metrics per batch, the sending
+# period (milliseconds) and the delay before a new connection after an error (seconds)
+settings['CARBON_QUEUE_SIZE'] = 100000
+settings['CARBON_BATCH_SIZE'] = 500
+settings['CARBON_FLUSH_INTERVAL'] = 1000
+settings['CARBON_RETRY_DELAY'] = 10
+
+# InfluxDB: cached clients, the points are written with the line protocol. The maximum number
+# of buffered points for each InfluxDB, the maximum number of points per write, the writing
+# period (milliseconds) and the delay before a new client after an error (seconds)
+settings['INFLUXDB_QUEUE_SIZE'] = 100000
+settings['INFLUXDB_BATCH_SIZE'] = 500
+settings['INFLUXDB_FLUSH_INTERVAL'] = 1000
+settings['INFLUXDB_RETRY_DELAY'] = 10
+
 # Read configuration file to update/complete the configuration
 configuration_file = get_settings(settings)
 print("Application configuration file: %s" % configuration_file)
@@ -2129,6 +2464,26 @@ if settings['SCHEDULER_LIVESYNTHESIS_HISTORY'] > 0:
             'seconds': settings['SCHEDULER_LIVESYNTHESIS_HISTORY']
         }
     )
+if settings['SCHEDULER_LIVESYNTHESIS_RECONCILE_ACTIVE']:
+    jobs.append(
+        {
+            'id': 'cron_livesynthesis_reconcile',
+            'func': 'alignak_backend.scheduler:cron_livesynthesis_reconcile',
+            'args': (),
+            'trigger': 'interval',
+            'seconds': settings['SCHEDULER_LIVESYNTHESIS_RECONCILE_PERIOD']
+        }
+    )
+if settings['SCHEDULER_LIVESYNTHESIS_METRICS_ACTIVE']:
+    jobs.append(
+        {
+            'id': 'cron_livesynthesis_metrics',
+            'func': 'alignak_backend.scheduler:cron_livesynthesis_metrics',
+            'args': (),
+            'trigger': 'interval',
+            'seconds': settings['SCHEDULER_LIVESYNTHESIS_METRICS_PERIOD']
+        }
+    )
 if settings['SCHEDULER_ALIGNAK_ACTIVE']:
     jobs.append(
         {
@@ -2142,6 +2497,15 @@ if settings['SCHEDULER_ALIGNAK_ACTIVE']:
 
 settings['JOBS'] = jobs
 
+# Users rights cache
+auth_cache = VersionedCache('auth',
+                            settings['AUTH_CACHE_SIZE'] if settings['AUTH_CACHE_TTL'] > 0 else 0,
+                            settings['AUTH_CACHE_TTL'])
+Names.configure(settings['NAME_CACHE_SIZE'] if settings['NAME_CACHE_TTL'] > 0 else 0,
+                settings['NAME_CACHE_TTL'])
+Metric.configure(settings['PERFDATA_CACHE_SIZE'])
+Timeseries.configure(settings['TIMESERIES_NAME_CACHE_SIZE'])
+
 print("Application settings: %s" % settings)
 print('MongoDB connection string: %s' % settings['MONGO_URI'])
 
@@ -2158,6 +2522,26 @@ app = Eve(
     static_folder=base_path
 )
 
+# Check results history events write-behind queue
+history_queue = WriteBehind(app, 'history', settings['HISTORY_QUEUE_SIZE'],
+                            settings['HISTORY_FLUSH_ITEMS'], settings['HISTORY_FLUSH_INTERVAL'])
+
+# Log checks results metrics export write-behind queue
+Timeseries.export_queue = TimeseriesExport(app, settings['TIMESERIES_QUEUE_SIZE'],
+                                           settings['TIMESERIES_FLUSH_ITEMS'],
+                                           settings['TIMESERIES_FLUSH_INTERVAL'])
+
+# Carbon daemons connections pool
+Timeseries.carbon = CarbonPool(app.logger, settings['CARBON_QUEUE_SIZE'],
+                               settings['CARBON_BATCH_SIZE'], settings['CARBON_FLUSH_INTERVAL'],
+                               retry_delay=settings['CARBON_RETRY_DELAY'])
+
+# InfluxDB clients pool
+Timeseries.influxdb = InfluxdbPool(app.logger, settings['INFLUXDB_QUEUE_SIZE'],
+                                   settings['INFLUXDB_BATCH_SIZE'],
+                                   settings['INFLUXDB_FLUSH_INTERVAL'],
+                                   retry_delay=settings['INFLUXDB_RETRY_DELAY'])
+
 if settings.get('LOGGER', None):
     # Alignak backend logging feature
     def log_endpoint(_resource, _request, _payload):  # pylint: disable=unused-argument
@@ -2238,6 +2622,16 @@ app.on_pre_GET += pre_get
 app.on_pre_POST += pre_post
 app.on_pre_PATCH += pre_patch
 app.on_pre_DELETE += pre_delete
+app.on_inserted += invalidate_auth_cache
+app.on_updated += invalidate_auth_cache
+app.on_replaced += invalidate_auth_cache
+app.on_deleted_item += invalidate_auth_cache
+app.on_deleted_resource += invalidate_auth_cache
+app.on_inserted += Names.on_inserted
+app.on_updated += Names.on_updated
+app.on_replaced += Names.on_replaced
+app.on_deleted_item += Names.on_deleted_item
+app.on_deleted_resource += Names.on_deleted_resource
 app.on_insert_user += pre_user_post
 
 # Manage alias when insert
@@ -2247,11 +2641,18 @@ app.on_update_user += pre_user_patch
 app.on_inserted_user += after_insert_user
 app.on_inserted_host += after_insert_host
 app.on_post_POST_host += update_etag
+app.on_inserted_service += Overall.on_inserted_service
 app.on_inserted_service += after_insert_service
 app.on_post_POST_service += update_etag
 app.on_update_host += pre_host_patch
 app.on_update_service += pre_service_patch
 app.on_updated_service += after_updated_service
+app.after_request(after_request_overall)
+app.teardown_request(teardown_request_overall)
+app.on_replaced_service += Overall.on_replaced_service
+app.on_replaced_host += Overall.on_replaced_host
+app.on_deleted_item_service += Overall.on_deleted_item_service
+app.on_deleted_resource_service += Overall.on_deleted_resource_service
 app.on_delete_item_host += pre_delete_host
 app.on_deleted_item_host += after_delete_host
 app.on_delete_item_realm += pre_delete_realm
@@ -2428,6 +2829,8 @@ with app.test_request_context():
             "===============================================================================")
 
     # Live synthesis management
+    app.on_inserted_realm += Livesynthesis.on_inserted_realm
+    app.on_deleted_item_realm += Livesynthesis.on_deleted_realm
     app.on_inserted_host += Livesynthesis.on_inserted_host
     app.on_inserted_service += Livesynthesis.on_inserted_service
     app.on_updated_host += Livesynthesis.on_updated_host
@@ -2455,13 +2858,19 @@ with app.test_request_context():
     app.on_update_user += Template.on_update_user
     app.on_updated_user += Template.on_updated_user
 
+    # Services overall states counters of the hosts created by a former version
+    Overall.initialize()
+
     # Initial livesynthesis
+    Livesynthesis.create_realm_index()
     Livesynthesis.recalculate()
+    Livesynthesis.migrate_history()
 
 # hooks post-init
 app.on_insert_realm += pre_realm_post
 app.on_inserted_realm += after_insert_realm
 app.on_updated_realm += after_update_realm
+app.on_updated_realm += Livesynthesis.on_updated_realm
 
 app.on_insert_usergroup += pre_usergroup_post
 app.on_insert_hostgroup += pre_hostgroup_post
@@ -2493,6 +2902,16 @@ app.on_delete_item += keep_default_items_item
 
 app.on_insert_service += pre_service_post
 
+# Live synthesis writes in progress, once the hosts and services are completed by the other hooks.
+# Only needed by the live synthesis reconciliation
+if settings['SCHEDULER_LIVESYNTHESIS_RECONCILE_ACTIVE']:
+    app.on_insert_host += Livesynthesis.on_insert_element
+    app.on_insert_service += Livesynthesis.on_insert_element
+    app.on_update_host += Livesynthesis.on_update_host
+    app.on_update_service += Livesynthesis.on_update_service
+    app.on_delete_item_host += Livesynthesis.on_delete_element
+    app.on_delete_item_service += Livesynthesis.on_delete_element
+
 # hook for tree resources
 app.on_fetched_resource += on_fetched_resource_tree
 app.on_fetched_item += on_fetched_item_tree
@@ -2538,6 +2957,8 @@ def login_app():  # pylint: disable=inconsistent-return-statements
                     if posted_data['action'] == 'generate' or not user['token']:
                         token = generate_token()
                         _users.update({'_id': user['_id']}, {'$set': {'token': token}})
+                        # The former token is no more valid
+                        auth_cache.invalidate()
                         return jsonify({'token': token})
                 elif not user['token']:
                     token = generate_token()
@@ -2565,6 +2986,29 @@ def backend_config():
     return jsonify(my_config)
 
 
+@app.route("/backendstats")
+def backend_stats():
+    """
+    Offer route to get the backend internal counters
+    """
+    my_stats = {
+        "caches": {
+            "auth": auth_cache.stats(),
+            "names": Names.cache.stats(),
+            "perfdata": Metric.cache.stats(),
+            "timeseries_names": {'size': len(Timeseries.names),
+                                 'maxsize': Timeseries.names_maxsize}
+        },
+        "queues": {
+            "history": history_queue.stats(),
+            "timeseries": Timeseries.export_queue.stats(),
+            "carbon": Timeseries.carbon.stats(),
+            "influxdb": Timeseries.influxdb.stats()
+        }
+    }
+    return jsonify(my_stats)
+
+
 @app.route("/version")
 def backend_version():
     """
@@ -3217,25 +3661,38 @@ def cron_livesynthesis_history():
     minutes = settings['SCHEDULER_LIVESYNTHESIS_HISTORY']
     with app.test_request_context():
         # for each livesynthesis, add into internal livesynthesisretention endpoint
-        livesynthesis_db = current_app.data.driver.db['livesynthesis']
-        livesynthesisretention_db = current_app.data.driver.db['livesynthesisretention']
-        livesynthesis = livesynthesis_db.find()
-        for livesynth in livesynthesis:
-            livesynth['livesynthesis'] = livesynth['_id']
-            for prop in ['_id', '_created', '_updated', '_realm', '_users_read']:
-                if prop in livesynth:
-                    del livesynth[prop]
-            post_internal("livesynthesisretention", livesynth, True)
-            # delete older data
-            if minutes > 0:
-                items = livesynthesisretention_db.find(
-                    {"_created": {"$lt": (datetime.utcnow() - timedelta(seconds=60 * minutes))}})
-                for item in items:
-                    lookup = {"_id": item['_id']}
-                    deleteitem_internal('livesynthesisretention', False, False, **lookup)
+        Livesynthesis.store_history(minutes)
         return jsonify({})
 
 
+@app.route('/cron_livesynthesis_reconcile')
+def cron_livesynthesis_reconcile():
+    """
+    Cron used to check and correct the livesynthesis counters of a realm
+
+    :return: the checked realm and the counters drift
+    :rtype: dict
+    """
+    with app.test_request_context():
+        reconciled = Livesynthesis.reconcile()
+        if reconciled is None:
+            return jsonify({})
+        realm, drift = reconciled
+        return jsonify({'realm': str(realm), 'drift': drift})
+
+
+@app.route('/cron_livesynthesis_metrics')
+def cron_livesynthesis_metrics():
+    """
+    Cron used to send the livesynthesis counters of all the realms to the TSDB
+
+    :return: the number of sent livesynthesis
+    :rtype: dict
+    """
+    with app.test_request_context():
+        return jsonify({'livesynthesis': Livesynthesis.publish_metrics()})
+
+
 @app.route('/docs')
 def redir_index():
     """
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.bulk`` module
+
+    This module provides bulk versions of the Eve internal post and patch methods. They run
+    the same database event hooks as post_internal and patch_internal but they store all the
+    documents with a single database request. It also provides a projected read of several
+    documents.
+
+    The documents are not validated against the resource schema, so the callers must only
+    provide data they built from previously validated documents.
+"""
+from __future__ import print_function
+from copy import deepcopy
+from datetime import datetime
+
+from flask import current_app
+from pymongo import UpdateOne
+from eve.defaults import resolve_default_values
+from eve.methods.common import resolve_document_etag
+
+
+def bulk_find(resource, ids, fields=None):
+    """Get several documents with a single find request
+
+    Only the `fields` of the documents are fetched, unless `fields` is None.
+
+    :param resource: name of the resource
+    :type resource: str
+    :param ids: documents identifiers
+    :type ids: list
+    :param fields: fetched fields
+    :type fields: list
+    :return: documents indexed by their identifier
+    :rtype: dict
+    """
+    documents = {}
+    if not ids:
+        return documents
+    cursor = current_app.data.driver.db[resource].find({'_id': {'$in': list(set(ids))}},
+                                                       projection=fields)
+    for document in cursor:
+        documents[document['_id']] = document
+    return documents
+
+
+def prepare_insert(resource, documents):
+    """Prepare some documents for their insertion
+
+    Set the default values, creation and update dates, run the before insertion hooks and set
+    the documents etag
+
+    :param resource: name of the resource
+    :type resource: str
+    :param documents: documents to insert
+    :type documents: list
+    :return: None
+    """
+    config = current_app.config
+    resource_def = config['DOMAIN'][resource]
+    now = datetime.utcnow().replace(microsecond=0)
+    for document in documents:
+        resolve_default_values(document, resource_def['defaults'])
+        document[config['LAST_UPDATED']] = now
+        document[config['DATE_CREATED']] = now
+
+    getattr(current_app, "on_insert")(resource, documents)
+    getattr(current_app, "on_insert_%s" % resource)(documents)
+
+    resolve_document_etag(documents, resource)
+
+
+def notify_inserted(resource, documents):
+    """Run the after insertion hooks
+
+    :param resource: name of the resource
+    :type resource: str
+    :param documents: inserted documents
+    :type documents: list
+    :return: None
+    """
+    getattr(current_app, "on_inserted")(resource, documents)
+    getattr(current_app, "on_inserted_%s" % resource)(documents)
+
+
+def bulk_post_internal(resource, documents):
+    """Insert several documents with a single insert_many request
+
+    :param resource: name of the resource
+    :type resource: str
+    :param documents: documents to insert
+    :type documents: list
+    :return: inserted documents identifiers
+    :rtype: list
+    """
+    if not documents:
+        return []
+
+    prepare_insert(resource, documents)
+    result = current_app.data.driver.db[resource].insert_many(documents)
+    notify_inserted(resource, documents)
+    return result.inserted_ids
+
+
+def bulk_patch_internal(resource, patches):
+    """Update several documents with a single bulk_write request
+
+    `patches` is a list of (original, updates) tuples. When the same document is updated
+    several times, the updates are applied in the list order.
+
+    :param resource: name of the resource
+    :type resource: str
+    :param patches: list of the documents to update and their updates
+    :type patches: list
+    :return: number of updated documents
+    :rtype: int
+    """
+    if not patches:
+        return 0
+
+    config = current_app.config
+    now = datetime.utcnow().replace(microsecond=0)
+
+    # Current state of the updated documents
+    documents = {}
+    # Fields to set for each updated document
+    to_set = {}
+    # (updates, original) for the after update hooks
+    updated = []
+    for original, updates in patches:
+        original = documents.get(original['_id'], original)
+        updates = dict(updates)
+        updates[config['LAST_UPDATED']] = now
+
+        getattr(current_app, "on_update")(resource, updates, original)
+        getattr(current_app, "on_update_%s" % resource)(updates, original)
+
+        document = deepcopy(original)
+        document.update(updates)
+        resolve_document_etag(document, resource)
+        updates[config['ETAG']] = document[config['ETAG']]
+
+        documents[original['_id']] = document
+        to_set.setdefault(original['_id'], {}).update(updates)
+        updated.append((updates, original))
+
+    current_app.data.driver.db[resource].bulk_write(
+        [UpdateOne({'_id': _id}, {'$set': fields}) for _id, fields in to_set.items()],
+        ordered=False)
+
+    for updates, original in updated:
+        getattr(current_app, "on_updated")(resource, updates, original)
+        getattr(current_app, "on_updated_%s" % resource)(updates, original)
+    return len(to_set)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.cache`` module
+
+    This module provides a small in-process cache used to avoid repeating the same
+    database requests on the hot paths of the backend
+"""
+from __future__ import print_function
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g
+
+
+class Cache(object):
+    """
+        Bounded least recently used cache with an optional time to live
+
+        When the cache is full, the least recently used entry is evicted. If `ttl` is set, an
+        entry older than `ttl` seconds is considered as missing. A cache with a `maxsize` of 0
+        is disabled: nothing is stored and every lookup is a miss.
+    """
+    def __init__(self, maxsize=1000, ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._get(key) is not None
+
+    def _get(self, key):
+        """Get an entry, removing it if it expired. The lock must be held by the caller
+
+        :param key: the entry key
+        :return: (timestamp, value) tuple or None if not found
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if self.ttl and entry[0] + self.ttl < time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        """Get the value stored for a key
+
+        :param key: the entry key
+        :param default: value returned if the key is not found
+        :return: the stored value or default
+        """
+        with self._lock:
+            entry = self._get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            # Most recently used entries are kept at the end
+            del self._data[key]
+            self._data[key] = entry
+            return entry[1]
+
+    def set(self, key, value):
+        """Store a value for a key
+
+        :param key: the entry key
+        :param value: the value to store
+        :return: None
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+            self._data[key] = (time.time(), value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove an entry from the cache
+
+        :param key: the entry key
+        :param default: value returned if the key is not found
+        :return: the removed value or default
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            return entry[1]
+
+    def clear(self):
+        """Remove all the entries of the cache
+
+        :return: None
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Get the cache counters
+
+        :return: size, maxsize, hits and misses counters
+        :rtype: dict
+        """
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class VersionedCache(Cache):
+    """
+        Cache shared by the backend processes through a version stored in the database
+
+        Each backend process has its own cache. When the cached data are modified, `invalidate`
+        increments the cache version stored in the `cacheversion` collection. Once per request,
+        `check_version` compares the stored version with the version of the local cache, so
+        that all the backend processes clear their cache after a modification made by another
+        process.
+    """
+    version_collection = 'cacheversion'
+
+    def __init__(self, name, maxsize=1000, ttl=0):
+        super(VersionedCache, self).__init__(maxsize, ttl)
+        self.name = name
+        self.version = None
+
+    def get_version(self):
+        """Get the cache version stored in the database
+
+        :return: cache version
+        :rtype: int
+        """
+        version = current_app.data.driver.db[self.version_collection].find_one(
+            {'_id': self.name})
+        if version is None:
+            return 0
+        return version['version']
+
+    def check_version(self):
+        """Clear the cache if its stored version changed
+
+        The stored version is only requested once per request.
+
+        :return: None
+        """
+        if self.maxsize <= 0:
+            return
+        checked = g.setdefault('cache_versions_checked', set())
+        if self.name in checked:
+            return
+        checked.add(self.name)
+        version = self.get_version()
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def invalidate(self):
+        """Called when the cached data are modified
+
+        Increment the stored version and clear the local cache
+
+        :return: None
+        """
+        if self.maxsize <= 0:
+            return
+        current_app.data.driver.db[self.version_collection].update_one(
+            {'_id': self.name}, {'$inc': {'version': 1}}, upsert=True)
+        self.clear()
+        self.version = None
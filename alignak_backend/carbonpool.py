@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.carbonpool`` module
+
+    This module sends metrics to the carbon daemons with persistent connections
+"""
+from __future__ import print_function
+import atexit
+import logging
+import os
+import pickle
+import socket
+import struct
+import threading
+import time
+
+
+class CarbonConnection(object):
+    """
+        Persistent connection to a carbon daemon (pickle protocol)
+
+        The metrics are appended to a bounded buffer and sent by the pool thread, in pickle
+        batches of at most `batch_size` metrics. The connection is kept open between the batches.
+
+        The connection is opened by the pool thread when the first batch is sent, the metrics
+        are only buffered when they are added. After a connection or send error, the connection
+        is closed and the buffered metrics are kept. During `retry_delay` seconds, the new
+        metrics are refused, then the connection is opened again. A batch rejected by the daemon
+        (see `rejections`) is split in two halves that are sent again, so that only the rejected
+        metrics are dropped, as they would be rejected again.
+    """
+    # Errors raised when the daemon is not available, the batch is sent again later
+    exceptions = (socket.error, socket.timeout)
+    # Errors raised when the daemon rejects a batch, the batch is dropped
+    rejections = ()
+
+    def __init__(self, host, port, maxsize=100000, batch_size=500, timeout=1, retry_delay=10):
+        self.host = host
+        self.port = port
+        self.name = '%s:%s' % (host, port)
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.buffer = []
+        # Buffer lock, and send lock held while a batch is sent
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.sock = None
+        self.failed_at = None
+        self.last_flush = time.time()
+        self.connections = 0
+        self.sent = 0
+        self.batches = 0
+        self.refused = 0
+        self.errors = 0
+        self.dropped = 0
+        self.rejection = None
+
+    def is_failed(self):
+        """Is the carbon daemon not available since the last error?
+
+        :return: True during retry_delay seconds after an error
+        :rtype: bool
+        """
+        return self.failed_at is not None and time.time() - self.failed_at < self.retry_delay
+
+    def add(self, metrics):
+        """Buffer some metrics to send
+
+        :param metrics: metrics to send: [('metric.name', (timestamp, value)), ...]
+        :type metrics: list
+        :return: True if the metrics are buffered, False if they are refused because the
+        carbon daemon is not available or the buffer is full
+        :rtype: bool
+        """
+        with self.lock:
+            if self.is_failed() or len(self.buffer) + len(metrics) > self.maxsize:
+                self.refused += len(metrics)
+                return False
+            self.buffer.extend(metrics)
+            return True
+
+    def is_due(self, flush_interval):
+        """Should the buffered metrics be sent now?
+
+        :param flush_interval: maximum time between two flushes (seconds)
+        :type flush_interval: float
+        :return: True if a batch is full or if the buffer waited for flush_interval
+        :rtype: bool
+        """
+        if not self.buffer or self.is_failed():
+            return False
+        return len(self.buffer) >= self.batch_size \
+            or time.time() - self.last_flush >= flush_interval
+
+    def connect(self):
+        """Open the connection if it is not opened
+
+        :return: None
+        """
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), self.timeout)
+            self.connections += 1
+
+    def close(self):
+        """Close the connection
+
+        :return: None
+        """
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+            self.sock = None
+
+    def send_batch(self, batch):
+        """Send a batch of metrics with the pickle protocol: the length of the pickled metrics
+        list (4 bytes, big endian) followed by the pickled list
+
+        :param batch: metrics to send
+        :type batch: list
+        :return: None
+        """
+        payload = pickle.dumps(batch, protocol=2)
+        self.connect()
+        self.sock.sendall(struct.pack("!L", len(payload)) + payload)
+
+    def flush(self):
+        """Send all the buffered metrics
+
+        :return: True if all the metrics were sent
+        :rtype: bool
+        """
+        with self.send_lock:
+            self.last_flush = time.time()
+            # Halves of the rejected batches, sent before the buffered metrics
+            pending = []
+            while True:
+                if pending:
+                    batch = pending.pop(0)
+                else:
+                    with self.lock:
+                        batch = self.buffer[:self.batch_size]
+                        del self.buffer[:self.batch_size]
+                if not batch:
+                    return True
+                try:
+                    self.send_batch(batch)
+                    self.sent += len(batch)
+                    self.batches += 1
+                    self.failed_at = None
+                except self.rejections as exp:
+                    self.rejection = str(exp)
+                    if len(batch) == 1:
+                        self.dropped += 1
+                    else:
+                        middle = len(batch) // 2
+                        pending[0:0] = [batch[:middle], batch[middle:]]
+                except self.exceptions:
+                    self.close()
+                    self.errors += 1
+                    self.failed_at = time.time()
+                    with self.lock:
+                        # Keep the metrics to send them later, the oldest ones first
+                        self.buffer[0:0] = batch + [metric for half in pending for metric in half]
+                    return False
+
+    def stats(self):
+        """Get the connection counters
+
+        :return: buffered, sent, refused, dropped metrics and connections counters
+        :rtype: dict
+        """
+        return {
+            'buffered': len(self.buffer),
+            'sent': self.sent,
+            'batches': self.batches,
+            'refused': self.refused,
+            'dropped': self.dropped,
+            'connections': self.connections,
+            'errors': self.errors,
+            'available': not self.is_failed()
+        }
+
+
+class CarbonPool(object):
+    """
+        Carbon connections pool
+
+        The pool holds a persistent connection for each carbon daemon (see CarbonConnection).
+        A background thread sends the buffered metrics of each connection as soon as
+        `batch_size` metrics are buffered, or every `flush_interval` milliseconds.
+
+        The connections and the thread belong to a backend process: they are created again in
+        a forked process. The buffered metrics are sent when the process exits.
+    """
+    name = 'carbon-pool'
+
+    def __init__(self, logger=None, maxsize=100000, batch_size=500, flush_interval=1000,
+                 timeout=1, retry_delay=10):
+        self.logger = logger or logging.getLogger(__name__)
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval / 1000.0
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.connections = {}
+        self.thread = None
+        self.pid = None
+        self.stopping = threading.Event()
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the background thread if it is not yet running in this process
+
+        The connections inherited from the parent process are dropped.
+
+        :return: None
+        """
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+                return
+            if self.pid != os.getpid():
+                self.connections = {}
+                atexit.register(self.stop)
+            self.pid = os.getpid()
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run, name=self.name)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def get_connection(self, host, port):
+        """Get the connection to a carbon daemon
+
+        :param host: carbon daemon address
+        :type host: str
+        :param port: carbon daemon pickle port
+        :type port: int
+        :return: the connection
+        :rtype: CarbonConnection
+        """
+        self.start()
+        with self.lock:
+            connection = self.connections.get((host, port))
+            if connection is None:
+                connection = CarbonConnection(host, port, self.maxsize, self.batch_size,
+                                              self.timeout, self.retry_delay)
+                self.connections[(host, port)] = connection
+            return connection
+
+    def add(self, connection, metrics):
+        """Buffer some metrics to send with a connection
+
+        :param connection: the connection
+        :type connection: CarbonConnection
+        :param metrics: metrics to send
+        :type metrics: list
+        :return: True if the metrics are buffered, False if they are refused
+        :rtype: bool
+        """
+        if not connection.add(metrics):
+            self.logger.warning("[tsdb] %s - not available, refused %d metrics",
+                                connection.name, len(metrics))
+            return False
+        if len(connection.buffer) >= self.batch_size:
+            self.wakeup.set()
+        return True
+
+    def send(self, host, port, metrics):
+        """Buffer some metrics to send to a carbon daemon
+
+        :param host: carbon daemon address
+        :type host: str
+        :param port: carbon daemon pickle port
+        :type port: int
+        :param metrics: metrics to send: [('metric.name', (timestamp, value)), ...]
+        :type metrics: list
+        :return: True if the metrics are buffered, False if they are refused
+        :rtype: bool
+        """
+        return self.add(self.get_connection(host, port), metrics)
+
+    def flush(self, force=False):
+        """Send the buffered metrics of the connections
+
+        :param force: send the metrics of all the connections, even if they are not due
+        :type force: bool
+        :return: None
+        """
+        with self.lock:
+            connections = list(self.connections.values())
+        for connection in connections:
+            if force and connection.buffer or connection.is_due(self.flush_interval):
+                dropped = connection.dropped
+                if not connection.flush():
+                    self.logger.warning("[tsdb] %s - send failed, %d metrics buffered",
+                                        connection.name, len(connection.buffer))
+                if connection.dropped > dropped:
+                    self.logger.error("[tsdb] %s - rejected, dropped %d metrics: %s",
+                                      connection.name, connection.dropped - dropped,
+                                      connection.rejection)
+
+    def run(self):
+        """Background thread main loop
+
+        :return: None
+        """
+        while not self.stopping.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def stop(self, timeout=10):
+        """Stop the background thread and send the buffered metrics
+
+        :param timeout: maximum time to wait for the thread (seconds)
+        :type timeout: int
+        :return: None
+        """
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            self.thread.join(timeout)
+        self.flush(force=True)
+        with self.lock:
+            for connection in self.connections.values():
+                connection.close()
+
+    def stats(self):
+        """Get the counters of each connection
+
+        :return: connections counters, indexed by connection name
+        :rtype: dict
+        """
+        with self.lock:
+            return dict((connection.name, connection.stats())
+                        for connection in self.connections.values())
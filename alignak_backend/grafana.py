@@ -14,6 +14,7 @@ from bson.objectid import ObjectId
 from flask import current_app
 from eve.methods.patch import patch_internal
 from alignak_backend.perfdata import PerfDatas
+from alignak_backend.realmtree import RealmTree
 from alignak_backend.timeseries import Timeseries
 
 
@@ -34,11 +35,9 @@ class Grafana(object):
         self.dashboard_data = data
 
         # get the realms of this grafana instance
-        realm_db = current_app.data.driver.db['realm']
-        realm = realm_db.find_one({'_id': data['_realm']})
-        self.realms = [realm['_id']]
+        self.realms = [data['_realm']]
         if data['_sub_realm']:
-            self.realms.extend(realm['_all_children'])
+            self.realms.extend(RealmTree.get_all_children(data['_realm']))
 
         # get graphite / influx for each realm of the grafana
         self.timeseries = {}
@@ -77,8 +76,7 @@ class Grafana(object):
             graphite['type'] = 'graphite'
             self.timeseries[graphite['_realm']] = graphite
             if graphite['_sub_realm']:
-                realm = realm_db.find_one({'_id': graphite['_realm']})
-                for child_realm in realm['_all_children']:
+                for child_realm in RealmTree.get_all_children(graphite['_realm']):
                     if child_realm not in self.realms:
                         current_app.logger.error("[grafana-%s] linked graphite %s, "
                                                  "ignore sub-realm: %s",
@@ -116,8 +114,7 @@ class Grafana(object):
             influxdb['type'] = 'influxdb'
             self.timeseries[influxdb['_realm']] = influxdb
             if influxdb['_sub_realm']:
-                realm = realm_db.find_one({'_id': influxdb['_realm']})
-                for child_realm in realm['_all_children']:
+                for child_realm in RealmTree.get_all_children(influxdb['_realm']):
                     if child_realm not in self.realms:
                         current_app.logger.error("[grafana-%s] linked influxdb %s, "
                                                  "ignore sub-realm: %s",
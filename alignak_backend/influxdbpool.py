@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.influxdbpool`` module
+
+    This module writes points to the InfluxDB databases with cached clients
+"""
+from __future__ import print_function
+import math
+import socket
+from influxdb import InfluxDBClient
+from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
+from requests.exceptions import RequestException
+
+from alignak_backend.carbonpool import CarbonConnection, CarbonPool
+
+
+def escape_key(value):
+    """Escape a tag key or value for the line protocol
+
+    :param value: tag key or value
+    :type value: str
+    :return: escaped value
+    :rtype: str
+    """
+    return value.replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=') \
+        .replace(' ', '\\ ').replace('\n', '\\n')
+
+
+def make_line(measurement, tags, value, timestamp):
+    """Get the line protocol representation of a point
+
+    The tags with an empty value are not included, as the line protocol does not allow them.
+    A not finite value (nan, inf) would be rejected by InfluxDB, the point is ignored.
+
+    :param measurement: measurement name
+    :type measurement: str
+    :param tags: tags of the point
+    :type tags: list of (key, value)
+    :param value: value of the point (stored in the 'value' field)
+    :type value: float
+    :param timestamp: point time (seconds)
+    :type timestamp: int
+    :return: the point line, None if the value is not finite
+    :rtype: str
+    """
+    value = float(value)
+    if math.isnan(value) or math.isinf(value):
+        return None
+    line = [measurement.replace('\\', '\\\\').replace(',', '\\,').replace(' ', '\\ ')
+            .replace('\n', '\\n')]
+    for key, tag in tags:
+        if tag:
+            line.append('%s=%s' % (escape_key(key), escape_key(tag)))
+    return '%s value=%r %d' % (','.join(line), value, int(timestamp) * 1000000000)
+
+
+class InfluxdbConnection(CarbonConnection):
+    """
+        Cached client of an InfluxDB database
+
+        The points are buffered as line protocol strings and written by the pool thread, in
+        batches of at most `batch_size` points (see CarbonConnection). The client is created by
+        the pool thread, and the database is pinged so that a not available database is
+        detected before writing the points.
+    """
+    exceptions = (socket.error, RequestException, InfluxDBServerError)
+    # The database rejected the points (4xx status code: bad points, database or credentials)
+    rejections = (InfluxDBClientError,)
+
+    def __init__(self, influxdb, maxsize=100000, batch_size=500, timeout=1, retry_delay=10):
+        super(InfluxdbConnection, self).__init__(influxdb['address'], influxdb['port'], maxsize,
+                                                 batch_size, timeout, retry_delay)
+        self.name = influxdb['name']
+        self.params = InfluxdbConnection.get_params(influxdb)
+        self.client = None
+
+    @staticmethod
+    def get_params(influxdb):
+        """Get the connection parameters of an InfluxDB
+
+        :param influxdb: influxdb properties dictionary
+        :type influxdb: dict
+        :return: address, port, login, password and database
+        :rtype: tuple
+        """
+        return (influxdb['address'], influxdb['port'], influxdb['login'],
+                influxdb['password'], influxdb['database'])
+
+    def connect(self):
+        """Create the client if it is not created and ping the database
+
+        :return: None
+        """
+        if self.client is None:
+            client = InfluxDBClient(*self.params, timeout=self.timeout)
+            client.ping()
+            self.client = client
+            self.connections += 1
+
+    def close(self):
+        """Close the client
+
+        :return: None
+        """
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception:  # pylint: disable=broad-except
+                pass
+            self.client = None
+
+    def send_batch(self, batch):
+        """Write a batch of points with the line protocol
+
+        :param batch: points lines
+        :type batch: list
+        :return: None
+        """
+        self.connect()
+        self.client.write_points(batch, protocol='line')
+
+
+class InfluxdbPool(CarbonPool):
+    """
+        InfluxDB clients pool
+
+        The pool holds a client for each influxdb and a background thread that writes the
+        buffered points as soon as `batch_size` points are buffered, or every `flush_interval`
+        milliseconds (see CarbonPool).
+    """
+    name = 'influxdb-pool'
+
+    def get_connection(self, influxdb):  # pylint: disable=arguments-differ
+        """Get the client of an influxdb
+
+        The client is created again when the influxdb connection parameters are updated, the
+        buffered points are kept.
+
+        :param influxdb: influxdb properties dictionary
+        :type influxdb: dict
+        :return: the connection
+        :rtype: InfluxdbConnection
+        """
+        self.start()
+        with self.lock:
+            connection = self.connections.get(influxdb['_id'])
+            if connection is None or connection.name != influxdb['name'] or \
+                    connection.params != InfluxdbConnection.get_params(influxdb):
+                previous = connection
+                connection = InfluxdbConnection(influxdb, self.maxsize, self.batch_size,
+                                                self.timeout, self.retry_delay)
+                if previous is not None:
+                    with previous.send_lock, previous.lock:
+                        connection.buffer = previous.buffer
+                        previous.buffer = []
+                        previous.close()
+                self.connections[influxdb['_id']] = connection
+            return connection
+
+    def send(self, influxdb, points):  # pylint: disable=arguments-differ
+        """Buffer some points to write to an influxdb
+
+        :param influxdb: influxdb properties dictionary
+        :type influxdb: dict
+        :param points: points lines (see make_line)
+        :type points: list
+        :return: True if the points are buffered, False if they are refused
+        :rtype: bool
+        """
+        return self.add(self.get_connection(influxdb), points)
@@ -8,10 +8,15 @@
 """
 from __future__ import print_function
 import os
+import time
+from array import array
+from calendar import timegm
+from datetime import datetime
 import pymongo
-from flask import current_app, g, request
+from flask import current_app, g, request, abort
 from eve.methods.patch import patch_internal
 
+from alignak_backend.realmtree import RealmTree
 from alignak_backend.timeseries import Timeseries
 
 
@@ -19,342 +24,635 @@ class Livesynthesis(object):
     """
         Livesynthesis class
     """
+    # Last realm for which the counters were reconciled
+    reconciled_realm = None
+
+    # Period of the history stored in a retention document (seconds)
+    history_bucket = 3600
+
+    # Live states counted in the live synthesis
+    states = {
+        'hosts': ['up', 'down', 'unreachable'],
+        'services': ['ok', 'warning', 'critical', 'unknown', 'unreachable']
+    }
+
+    @staticmethod
+    def get_new_counters(type_check):
+        """Get the live synthesis counters of a realm without any host or service
+
+        :param type_check: hosts | services
+        :type type_check: str
+        :return: live synthesis counters
+        :rtype: dict
+        """
+        counters = {
+            '%s_total' % type_check: 0,
+            '%s_not_monitored' % type_check: 0
+        }
+        for state_type in ['hard', 'soft']:
+            for state in Livesynthesis.states[type_check]:
+                counters['%s_%s_%s' % (type_check, state, state_type)] = 0
+        counters['%s_acknowledged' % type_check] = 0
+        counters['%s_in_downtime' % type_check] = 0
+        return counters
+
+    @staticmethod
+    def get_new_livesynthesis():
+        """Get all the live synthesis counters of a realm without any host or service
+
+        :return: hosts and services live synthesis counters
+        :rtype: dict
+        """
+        counters = Livesynthesis.get_new_counters('hosts')
+        counters['hosts_flapping'] = 0
+        counters.update(Livesynthesis.get_new_counters('services'))
+        counters['services_flapping'] = 0
+        return counters
+
+    @staticmethod
+    def aggregate(type_check, realm=None):
+        """Compute the live synthesis counters of all the realms, or of one realm
+
+        The hosts or services are grouped by realm, monitoring and live state with an
+        aggregation request, then the counters are computed from the groups (see get_counted).
+
+        :param type_check: hosts | services
+        :type type_check: str
+        :param realm: realm identifier, None for all the realms
+        :type realm: ObjectId
+        :return: live synthesis counters indexed by realm identifier
+        :rtype: dict
+        """
+        resource = 'host' if type_check == 'hosts' else 'service'
+        match = {'_is_template': False}
+        if realm is not None:
+            match['_realm'] = realm
+        groups = current_app.data.driver.db[resource].aggregate([
+            {'$match': match},
+            {'$group': {
+                '_id': {
+                    'realm': '$_realm',
+                    'active': '$active_checks_enabled',
+                    'passive': '$passive_checks_enabled',
+                    'state': '$ls_state',
+                    'state_type': '$ls_state_type',
+                    'acknowledged': '$ls_acknowledged',
+                    'downtimed': '$ls_downtimed'
+                },
+                'count': {'$sum': 1}
+            }}
+        ])
+
+        counters = {}
+        for group in groups:
+            key = group['_id']
+            count = group['count']
+            if key.get('realm') not in counters:
+                counters[key.get('realm')] = Livesynthesis.get_new_counters(type_check)
+            realm_counters = counters[key.get('realm')]
+
+            realm_counters['%s_total' % type_check] += count
+            item = {
+                'active_checks_enabled': key.get('active'),
+                'passive_checks_enabled': key.get('passive'),
+                'ls_state': key.get('state'),
+                'ls_state_type': key.get('state_type'),
+                'ls_acknowledged': key.get('acknowledged'),
+                'ls_downtimed': key.get('downtimed')
+            }
+            for counter in Livesynthesis.get_counted(type_check, item):
+                realm_counters[counter] += count
+
+        return counters
+
+    @staticmethod
+    def create_realm_index():
+        """Create the unique realm index of the live synthesis
+
+        A former backend version could create several live synthesis documents for a realm,
+        they would prevent the unique index creation. Only the first live synthesis of each
+        realm is kept, the history of the removed ones is moved to the kept one. The counters
+        of the kept live synthesis must be recalculated.
+
+        :return: None
+        """
+        livesynthesis_db = current_app.data.driver.db['livesynthesis']
+        livesynthesisretention_db = current_app.data.driver.db['livesynthesisretention']
+        duplicates = livesynthesis_db.aggregate([
+            {'$group': {'_id': '$_realm', 'lives': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}}
+        ])
+        for duplicate in duplicates:
+            lives = sorted(duplicate['lives'])
+            livesynthesisretention_db.update_many({'livesynthesis': {'$in': lives[1:]}},
+                                                  {'$set': {'livesynthesis': lives[0]}})
+            livesynthesis_db.delete_many({'_id': {'$in': lives[1:]}})
+            current_app.logger.warning("LS - removed %d duplicated live synthesis of the realm "
+                                       "%s", len(lives) - 1, duplicate['_id'])
+
+        livesynthesis_db.create_index([('_realm', pymongo.ASCENDING)], name='index_realm',
+                                      unique=True)
+
     @staticmethod
     def recalculate():
         """
             Recalculate all the live synthesis counters
+
+            The counters of all the realms are computed with one aggregation request for the
+            hosts and one for the services
         """
         current_app.logger.debug("LS - Recalculating...")
         livesynthesis = current_app.data.driver.db['livesynthesis']
         realmsdrv = current_app.data.driver.db['realm']
-        allrealms = realmsdrv.find()
+        allrealms = realmsdrv.find({}, projection=['name'])
+
+        lives = {}
+        for live_current in livesynthesis.find({}, projection=['_realm']):
+            lives[live_current['_realm']] = live_current
+
+        hosts_counters = Livesynthesis.aggregate('hosts')
+        services_counters = Livesynthesis.aggregate('services')
+
         for _, realm in enumerate(allrealms):
-            live_current = livesynthesis.find_one({'_realm': realm['_id']})
+            live_current = lives.get(realm['_id'])
             if live_current is None:
                 current_app.logger.debug("     new LS for realm %s", realm['name'])
-                data = {
-                    'hosts_total': 0,
-                    'hosts_not_monitored': 0,
-                    'hosts_up_hard': 0,
-                    'hosts_up_soft': 0,
-                    'hosts_down_hard': 0,
-                    'hosts_down_soft': 0,
-                    'hosts_unreachable_hard': 0,
-                    'hosts_unreachable_soft': 0,
-                    'hosts_acknowledged': 0,
-                    'hosts_in_downtime': 0,
-                    'hosts_flapping': 0,
-                    'services_total': 0,
-                    'services_not_monitored': 0,
-                    'services_ok_hard': 0,
-                    'services_ok_soft': 0,
-                    'services_warning_hard': 0,
-                    'services_warning_soft': 0,
-                    'services_critical_hard': 0,
-                    'services_critical_soft': 0,
-                    'services_unreachable_hard': 0,
-                    'services_unreachable_soft': 0,
-                    'services_unknown_hard': 0,
-                    'services_unknown_soft': 0,
-                    'services_acknowledged': 0,
-                    'services_in_downtime': 0,
-                    'services_flapping': 0,
-                    '_realm': realm['_id']
-                }
-                livesynthesis.insert(data)
-                live_current = livesynthesis.find_one({'_realm': realm['_id']})
-
-            # Update hosts live synthesis
-            hosts = current_app.data.driver.db['host']
-            hosts_count = hosts.count({'_is_template': False, '_realm': realm['_id']})
-            data = {'hosts_total': hosts_count}
-
-            data['hosts_not_monitored'] = hosts.count({
-                '_is_template': False,
-                'active_checks_enabled': False, 'passive_checks_enabled': False,
-                '_realm': realm['_id']
-            })
-            data['hosts_up_hard'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UP', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['hosts_down_hard'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'DOWN', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['hosts_unreachable_hard'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNREACHABLE', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-
-            data['hosts_up_soft'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UP', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['hosts_down_soft'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'DOWN', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['hosts_unreachable_soft'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNREACHABLE', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-
-            data['hosts_acknowledged'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_acknowledged': True, '_realm': realm['_id']
-            })
-            data['hosts_in_downtime'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_downtimed': True, '_realm': realm['_id']
-            })
-
-            current_app.logger.debug("     realm %s, hosts LS: %s", realm['name'], data)
+                live_current = Livesynthesis.create(realm['_id'])
 
-            lookup = {"_id": live_current['_id']}
-            patch_internal('livesynthesis', data, False, False, **lookup)
+            # Update hosts and services live synthesis
+            data = hosts_counters.get(realm['_id'], Livesynthesis.get_new_counters('hosts'))
+            data.update(services_counters.get(realm['_id'],
+                                              Livesynthesis.get_new_counters('services')))
 
-            # Send livesynthesis to TSDB
-            Timeseries.send_livesynthesis_metrics(realm['_id'], data)
-
-            # Update services live synthesis
-            services = current_app.data.driver.db['service']
-            services_count = services.count({'_is_template': False, '_realm': realm['_id']})
-            data = {'services_total': services_count}
-
-            data['services_not_monitored'] = services.count({
-                '_is_template': False,
-                'active_checks_enabled': False, 'passive_checks_enabled': False,
-                '_realm': realm['_id']
-            })
-            data['services_ok_hard'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'OK', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_warning_hard'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'WARNING', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_critical_hard'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'CRITICAL', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_unknown_hard'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNKNOWN', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_unreachable_hard'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNREACHABLE', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-
-            data['services_ok_soft'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'OK', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_warning_soft'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'WARNING', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_critical_soft'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'CRITICAL', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_unknown_soft'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNKNOWN', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_unreachable_soft'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNREACHABLE', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-
-            data['services_acknowledged'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_acknowledged': True, '_realm': realm['_id']
-            })
-            data['services_in_downtime'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_downtimed': True, '_realm': realm['_id']
-            })
-
-            current_app.logger.debug("     realm %s, services LS: %s", realm['name'], data)
+            current_app.logger.debug("     realm %s, LS: %s", realm['name'], data)
 
             lookup = {"_id": live_current['_id']}
             patch_internal('livesynthesis', data, False, False, **lookup)
 
             # Send livesynthesis to TSDB
-            Timeseries.send_livesynthesis_metrics(realm['_id'], data)
+            Livesynthesis.send_metrics(realm['_id'], data)
+
+        Livesynthesis.rollup()
+
+    @staticmethod
+    def rollup(realms=None):
+        """Compute the live synthesis counters of the realms subtrees
+
+        The counters of a realm subtree (the realm and all its children) are stored in the
+        realm live synthesis, in the `_subtree` field. They are set only if they changed.
+
+        :param realms: identifiers of the realms to compute, None for all the realms
+        :type realms: list
+        :return: None
+        """
+        livesynthesis_db = current_app.data.driver.db['livesynthesis']
+        tree = RealmTree.get_realms()
+        if realms is None:
+            realms = list(tree)
+        realms = [realm for realm in realms if realm in tree]
+
+        needed = set(realms)
+        for realm in realms:
+            needed.update(tree[realm]['_all_children'])
+        counters = Livesynthesis.get_new_livesynthesis()
+        lives = {}
+        for live in livesynthesis_db.find({'_realm': {'$in': list(needed)}},
+                                          projection=list(counters) + ['_realm', '_subtree']):
+            lives[live['_realm']] = live
+
+        for realm in realms:
+            if realm not in lives:
+                continue
+            subtree = Livesynthesis.get_new_livesynthesis()
+            for child in [realm] + tree[realm]['_all_children']:
+                live = lives.get(child)
+                if live is None:
+                    continue
+                for counter in subtree:
+                    subtree[counter] += live.get(counter) or 0
+            if lives[realm].get('_subtree') != subtree:
+                livesynthesis_db.update_one({'_id': lives[realm]['_id']},
+                                            {'$set': {'_subtree': subtree}})
+
+    @staticmethod
+    def reconcile():
+        """
+            Check the live synthesis counters of a realm and correct them if they drifted
+
+            The realms are checked one after the other, each time this function is called.
+            The counters of the realm are computed as when the live synthesis is recalculated,
+            and only the counters that differ are set.
+
+            The write generation of the realm is incremented when one of its hosts or services
+            is about to be written (see begin_write) and when its counters are incremented. If
+            it changed while the counters were computed, the realm is not corrected this time.
+            The counters are only set if the generation is still unchanged.
+
+            The drift (sum of the counters differences) is sent to the TSDB as the
+            livesynthesis_drift metric.
+
+            :return: the realm identifier and the drift (None if the realm was not checked),
+            None if there is no realm
+            :rtype: tuple
+        """
+        realmsdrv = current_app.data.driver.db['realm']
+        livesynthesis_db = current_app.data.driver.db['livesynthesis']
+
+        realm = None
+        if Livesynthesis.reconciled_realm is not None:
+            realm = realmsdrv.find_one({'_id': {'$gt': Livesynthesis.reconciled_realm}},
+                                       projection=['name'], sort=[('_id', pymongo.ASCENDING)])
+        if realm is None:
+            realm = realmsdrv.find_one({}, projection=['name'], sort=[('_id', pymongo.ASCENDING)])
+        if realm is None:
+            return None
+        Livesynthesis.reconciled_realm = realm['_id']
+
+        live_current = livesynthesis_db.find_one({'_realm': realm['_id']})
+        if live_current is None:
+            live_current = Livesynthesis.create(realm['_id'])
+
+        expected = Livesynthesis.aggregate('hosts', realm['_id']).get(
+            realm['_id'], Livesynthesis.get_new_counters('hosts'))
+        expected.update(Livesynthesis.aggregate('services', realm['_id']).get(
+            realm['_id'], Livesynthesis.get_new_counters('services')))
+
+        generation = livesynthesis_db.find_one({'_id': live_current['_id']},
+                                               projection=['_generation'])
+        if generation is None or \
+                generation.get('_generation') != live_current.get('_generation'):
+            current_app.logger.debug("LS - realm %s, written meanwhile, not reconciled",
+                                     realm['name'])
+            return realm['_id'], None
+
+        data = {}
+        drift = 0
+        for counter, value in expected.items():
+            if live_current.get(counter) != value:
+                data[counter] = value
+                drift += abs(value - (live_current.get(counter) or 0))
+
+        if data:
+            current_app.logger.warning("LS - realm %s, drifted counters: %s", realm['name'],
+                                       dict((counter, live_current.get(counter))
+                                            for counter in data))
+            # Only if no host or service was written since the counters were got
+            lookup = {'_id': live_current['_id'], '_generation': live_current.get('_generation')}
+            for counter in data:
+                lookup[counter] = live_current.get(counter)
+            result = livesynthesis_db.update_one(lookup, {'$set': data})
+            if result.modified_count:
+                live_current.update(data)
+                Livesynthesis.send_metrics(realm['_id'], live_current)
+
+                # Update the subtrees counters of the realm and of its parents
+                Livesynthesis.rollup([realm['_id']] + RealmTree.get_tree_parents(realm['_id']))
+
+        Timeseries.send_livesynthesis_metrics(realm['_id'], {'livesynthesis_drift': drift})
+        return realm['_id'], drift
+
+    @staticmethod
+    def send_metrics(realm, live_current):
+        """Send the live synthesis counters of a realm to the TSDB
+
+        Nothing is sent if the counters of all the realms are sent periodically by the live
+        synthesis metrics scheduler (see publish_metrics).
+
+        :param realm: realm identifier
+        :type realm: ObjectId
+        :param live_current: live synthesis counters
+        :type live_current: dict
+        :return: None
+        """
+        if current_app.config.get('SCHEDULER_LIVESYNTHESIS_METRICS_ACTIVE', False):
+            return
+        Timeseries.send_livesynthesis_metrics(realm, live_current)
+
+    @staticmethod
+    def publish_metrics():
+        """Send the live synthesis counters of all the realms to the TSDB
+
+        The counters of all the realms are got with one request, then sent with one write for
+        each TSDB.
+
+        :return: number of sent live synthesis
+        :rtype: int
+        """
+        livesynthesis_db = current_app.data.driver.db['livesynthesis']
+        lives = list(livesynthesis_db.find(
+            {}, projection=list(Livesynthesis.get_new_livesynthesis()) + ['_realm']))
+        Timeseries.send_livesynthesis_snapshot(lives)
+        return len(lives)
+
+    @staticmethod
+    def create(realm):
+        """Create the live synthesis of a realm, with all its counters (and its subtree
+        counters) set to 0
+
+        There is only one live synthesis for a realm (unique index), even if it is created
+        concurrently by several backend processes. If it already exists, it is not modified.
+
+        :param realm: realm identifier
+        :type realm: ObjectId
+        :return: the realm live synthesis
+        :rtype: dict
+        """
+        livesynthesis_db = current_app.data.driver.db['livesynthesis']
+        data = Livesynthesis.get_new_livesynthesis()
+        data['_subtree'] = Livesynthesis.get_new_livesynthesis()
+        data['_realm'] = realm
+        try:
+            return livesynthesis_db.find_one_and_update(
+                {'_realm': realm}, {'$setOnInsert': data}, upsert=True,
+                return_document=pymongo.ReturnDocument.AFTER)
+        except pymongo.errors.DuplicateKeyError:
+            # Created meanwhile by another process
+            return livesynthesis_db.find_one({'_realm': realm})
+
+    @staticmethod
+    def on_inserted_realm(items):
+        """
+            What to do when a realm is inserted in the backend ...
+
+            Create the realm live synthesis
+        """
+        for _, item in enumerate(items):
+            Livesynthesis.create(item['_id'])
+
+    @staticmethod
+    def on_updated_realm(updated, original):
+        """
+            What to do when a realm is updated in the backend ...
+
+            If the realm children changed, compute again the subtrees counters
+        """
+        if '_all_children' in updated and updated['_all_children'] != original['_all_children']:
+            Livesynthesis.rollup()
+
+    @staticmethod
+    def on_deleted_realm(item):
+        """
+            What to do when a realm is deleted in the backend ...
+
+            Compute again the subtrees counters
+        """
+        current_app.logger.debug("LS - Deleted realm %s", item['name'])
+        Livesynthesis.rollup()
+
+    @staticmethod
+    def begin_write(realm):
+        """Record that an host or a service of a realm is being written, and that the realm
+        counters will be incremented once it is written
+
+        The write generation of the realm is incremented, so that the realm counters are not
+        reconciled meanwhile (see reconcile). Only used when the reconciliation is active.
+
+        :param realm: realm identifier
+        :type realm: ObjectId
+        :return: None
+        """
+        livesynthesis_db = current_app.data.driver.db['livesynthesis']
+        livesynthesis_db.update_one({'_realm': realm}, {'$inc': {'_generation': 1}})
+
+    @staticmethod
+    def on_insert_element(items):
+        """
+            What to do before hosts or services are inserted in the backend ...
+        """
+        for realm in set(item.get('_realm') for item in items if not item.get('_is_template')):
+            if realm is not None:
+                Livesynthesis.begin_write(realm)
+
+    @staticmethod
+    def on_update_host(updated, original):
+        """
+            What to do before an host is updated ...
+        """
+        if Livesynthesis.get_update_increments('hosts', updated, original):
+            Livesynthesis.begin_write(original['_realm'])
+
+    @staticmethod
+    def on_update_service(updated, original):
+        """
+            What to do before a service is updated ...
+        """
+        if Livesynthesis.get_update_increments('services', updated, original):
+            Livesynthesis.begin_write(original['_realm'])
+
+    @staticmethod
+    def on_delete_element(item):
+        """
+            What to do before an host or a service is deleted ...
+        """
+        if not item['_is_template']:
+            Livesynthesis.begin_write(item['_realm'])
+
+    @staticmethod
+    def update_counters(realm, increments):
+        """Increment some live synthesis counters of a realm and send the new counters to TSDB
+
+        The counters are incremented and got back with one request, then the subtree counters
+        of the realm parents are incremented with another one. If the realm has no live
+        synthesis (it was deleted), the live synthesis of all the realms is recalculated.
+
+        The write generation of the realm is incremented with the counters (see reconcile).
+
+        :param realm: realm identifier
+        :type realm: ObjectId
+        :param increments: increment of the counters
+        :type increments: dict
+        :return: None
+        """
+        increments = dict((counter, value) for counter, value in increments.items() if value)
+        if not increments:
+            return
+
+        subtree = dict(('_subtree.%s' % counter, value) for counter, value in increments.items())
+        update = subtree.copy()
+        update.update(increments)
+        update['_generation'] = 1
+
+        livesynthesis_db = current_app.data.driver.db['livesynthesis']
+        live_current = livesynthesis_db.find_one_and_update(
+            {'_realm': realm}, {"$inc": update},
+            return_document=pymongo.ReturnDocument.AFTER)
+        if live_current is None:
+            ls = Livesynthesis()
+            ls.recalculate()
+            return
+
+        # The realm is also counted in the subtrees of its parents
+        parents = RealmTree.get_tree_parents(realm)
+        if parents:
+            livesynthesis_db.update_many({'_realm': {'$in': parents}}, {"$inc": subtree})
+
+        # Send livesynthesis to TSDB
+        Livesynthesis.send_metrics(realm, live_current)
+
+    @staticmethod
+    def get_counted(type_check, item):
+        """Get the live synthesis counters in which an host or a service is counted, as they
+        are computed when the live synthesis is recalculated:
+        - not_monitored, the elements with no active nor passive checks
+        - <state>_<state type>, the monitored and not acknowledged elements in this state
+        - acknowledged and in_downtime, the monitored elements acknowledged / in a downtime
+
+        Only the booleans are considered, as in the database requests.
+
+        :param type_check: hosts | services
+        :type type_check: str
+        :param item: fields of the item (the host | the service)
+        :type item: dict
+        :return: counters in which the item is counted
+        :rtype: list
+        """
+        active = item.get('active_checks_enabled')
+        passive = item.get('passive_checks_enabled')
+        if active is False and passive is False:
+            return ["%s_not_monitored" % type_check]
+        if active is not True and passive is not True:
+            return []
+
+        counted = []
+        state = item.get('ls_state')
+        state_type = item.get('ls_state_type')
+        if item.get('ls_acknowledged') is False:
+            if state in [known.upper() for known in Livesynthesis.states[type_check]] \
+                    and state_type in ['HARD', 'SOFT']:
+                counted.append("%s_%s_%s" % (type_check, state.lower(), state_type.lower()))
+        elif item.get('ls_acknowledged') is True:
+            counted.append("%s_acknowledged" % type_check)
+        if item.get('ls_downtimed') is True:
+            counted.append("%s_in_downtime" % type_check)
+        return counted
+
+    @staticmethod
+    def get_monitoring_increments(type_check, updated, original):
+        """Get the live synthesis counters increments when the monitoring of an host or
+        a service is enabled or disabled
+
+        :param type_check: hosts | services
+        :type type_check: str
+        :param updated: updated fields
+        :type updated: dict
+        :param original: original fields
+        :type original: dict
+        :return: counters increments
+        :rtype: dict
+        """
+        item = original.copy()
+        item.update(updated)
+
+        increments = {}
+        for counter in Livesynthesis.get_counted(type_check, original):
+            increments[counter] = increments.get(counter, 0) - 1
+        for counter in Livesynthesis.get_counted(type_check, item):
+            increments[counter] = increments.get(counter, 0) + 1
+        return increments
+
+    @staticmethod
+    def get_update_increments(type_check, updated, original):
+        """Get the live synthesis counters increments when an host or a service is updated
+
+        If the monitored state is changing, the element moves from / to the not monitored
+        counter, else only the live state counters are updated.
+
+        :param type_check: hosts | services
+        :type type_check: str
+        :param updated: updated fields
+        :type updated: dict
+        :param original: original fields
+        :type original: dict
+        :return: counters increments, empty if no counter changes
+        :rtype: dict
+        """
+        if original['_is_template']:
+            return {}
+
+        # If the element is not monitored and we do not change its monitoring state
+        if not original['active_checks_enabled'] and not original['passive_checks_enabled'] \
+                and 'active_checks_enabled' not in updated \
+                and 'passive_checks_enabled' not in updated:
+            return {}
+
+        if 'active_checks_enabled' in updated or 'passive_checks_enabled' in updated:
+            return Livesynthesis.get_monitoring_increments(type_check, updated, original)
+
+        minus, plus = Livesynthesis.livesynthesis_to_update(type_check, updated, original)
+        if minus is False:
+            return {}
+        data = {minus: -1}
+        if plus is not False:
+            data = {minus: -1, plus: 1}
+        return data
 
     @staticmethod
     def on_inserted_host(items):
         """
             What to do when an host is inserted in the backend ...
         """
-        livesynthesis_db = current_app.data.driver.db['livesynthesis']
         for _, item in enumerate(items):
             if item['_is_template']:
                 continue
 
-            live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-            if live_current is None:
-                ls = Livesynthesis()
-                ls.recalculate()
+            typecheck = 'hosts'
+            if not item['active_checks_enabled'] and not item['passive_checks_enabled']:
+                data = {"%s_not_monitored" % typecheck: 1,
+                        "%s_total" % typecheck: 1}
             else:
-                typecheck = 'hosts'
-                if not item['active_checks_enabled'] and not item['passive_checks_enabled']:
-                    data = {"$inc": {"%s_not_monitored" % typecheck: 1,
-                                     "%s_total" % typecheck: 1}}
-                else:
-                    data = {"$inc": {"%s_%s_%s" % (typecheck, item['ls_state'].lower(),
-                                                   item['ls_state_type'].lower()): 1,
-                                     "%s_total" % typecheck: 1}}
-                current_app.logger.debug("LS - inserted host %s: %s...", item['name'], data)
-                current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-                # Send livesynthesis to TSDB
-                live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-                Timeseries.send_livesynthesis_metrics(item['_realm'], live_current)
+                data = {"%s_%s_%s" % (typecheck, item['ls_state'].lower(),
+                                      item['ls_state_type'].lower()): 1,
+                        "%s_total" % typecheck: 1}
+            current_app.logger.debug("LS - inserted host %s: %s...", item['name'], data)
+            Livesynthesis.update_counters(item['_realm'], data)
 
     @staticmethod
     def on_inserted_service(items):
         """
             What to do when a service is inserted in the backend ...
         """
-        livesynthesis_db = current_app.data.driver.db['livesynthesis']
         for _, item in enumerate(items):
             if item['_is_template']:
                 continue
 
-            live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-            if live_current is None:
-                ls = Livesynthesis()
-                ls.recalculate()
+            typecheck = 'services'
+            if not item['active_checks_enabled'] and not item['passive_checks_enabled']:
+                data = {"%s_not_monitored" % typecheck: 1,
+                        "%s_total" % typecheck: 1}
             else:
-                typecheck = 'services'
-                if not item['active_checks_enabled'] and not item['passive_checks_enabled']:
-                    data = {"$inc": {"%s_not_monitored" % typecheck: 1,
-                                     "%s_total" % typecheck: 1}}
-                else:
-                    data = {"$inc": {"%s_%s_%s" % (typecheck, item['ls_state'].lower(),
-                                                   item['ls_state_type'].lower()): 1,
-                                     "%s_total" % typecheck: 1}}
-                current_app.logger.debug("LS - inserted service %s: %s...", item['name'], data)
-                current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-                # Send livesynthesis to TSDB
-                live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-                Timeseries.send_livesynthesis_metrics(item['_realm'], live_current)
+                data = {"%s_%s_%s" % (typecheck, item['ls_state'].lower(),
+                                      item['ls_state_type'].lower()): 1,
+                        "%s_total" % typecheck: 1}
+            current_app.logger.debug("LS - inserted service %s: %s...", item['name'], data)
+            Livesynthesis.update_counters(item['_realm'], data)
 
     @staticmethod
     def on_updated_host(updated, original):
         """
             What to do when an host live state is updated ...
 
-            If the host monitored state is changing, recalculate the live synthesis, else
-            simply update the livesynthesis
+            If the host monitored state is changing, move the host from / to the not monitored
+            counter, else simply update the live state counters
         """
-        if original['_is_template']:
-            return
-
-        # If the host is not monitored and we do not change its monitoring state
-        if not original['active_checks_enabled'] and not original['passive_checks_enabled'] \
-                and 'active_checks_enabled' not in updated \
-                and 'passive_checks_enabled' not in updated:
+        data = Livesynthesis.get_update_increments('hosts', updated, original)
+        if not data:
             return
-
-        minus, plus = Livesynthesis.livesynthesis_to_update('hosts', updated, original)
-        if minus is not False:
-            livesynthesis_db = current_app.data.driver.db['livesynthesis']
-            live_current = livesynthesis_db.find_one({'_realm': original['_realm']})
-            if live_current is None or 'not_monitored' in minus \
-                    or (plus and 'not_monitored' in plus):
-                ls = Livesynthesis()
-                ls.recalculate()
-            else:
-                data = {"$inc": {minus: -1}}
-                if plus is not False:
-                    data = {"$inc": {minus: -1, plus: 1}}
-                current_app.logger.debug("LS - updated host %s: %s...", original['name'], data)
-                current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-                # Send livesynthesis to TSDB
-                live_current = livesynthesis_db.find_one({'_realm': original['_realm']})
-                Timeseries.send_livesynthesis_metrics(original['_realm'], live_current)
+        current_app.logger.debug("LS - updated host %s: %s...", original['name'], data)
+        Livesynthesis.update_counters(original['_realm'], data)
 
     @staticmethod
     def on_updated_service(updated, original):
         """
             What to do when a service live state is updated ...
 
-            If the service monitored state is changing, recalculate the live synthesis, else
-            simply update the livesynthesis
+            If the service monitored state is changing, move the service from / to the not
+            monitored counter, else simply update the live state counters
         """
-        if original['_is_template']:
+        data = Livesynthesis.get_update_increments('services', updated, original)
+        if not data:
             return
-
-        # If the service is not monitored and we do not change its monitoring state
-        if not original['active_checks_enabled'] and not original['passive_checks_enabled'] \
-                and 'active_checks_enabled' not in updated \
-                and 'passive_checks_enabled' not in updated:
-            return
-
-        minus, plus = Livesynthesis.livesynthesis_to_update('services', updated, original)
-        if minus is not False:
-            livesynthesis_db = current_app.data.driver.db['livesynthesis']
-            live_current = livesynthesis_db.find_one({'_realm': original['_realm']})
-            if live_current is None \
-                    or (not isinstance(minus, bool) and 'not_monitored' in minus) \
-                    or (not isinstance(plus, bool) and 'not_monitored' in plus):
-                ls = Livesynthesis()
-                ls.recalculate()
-            else:
-                data = {"$inc": {minus: -1}}
-                if plus is not False:
-                    data = {"$inc": {minus: -1, plus: 1}}
-                current_app.logger.debug("LS - updated service %s: %s...",
-                                         original['name'], data)
-                current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-                # Send livesynthesis to TSDB
-                live_current = livesynthesis_db.find_one({'_realm': original['_realm']})
-                Timeseries.send_livesynthesis_metrics(original['_realm'], live_current)
+        current_app.logger.debug("LS - updated service %s: %s...", original['name'], data)
+        Livesynthesis.update_counters(original['_realm'], data)
 
     @staticmethod
     def on_deleted_host(item):
@@ -367,20 +665,10 @@ class Livesynthesis(object):
         if item['_is_template']:
             return
 
-        livesynthesis_db = current_app.data.driver.db['livesynthesis']
-        live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-        if live_current is None:
-            ls = Livesynthesis()
-            ls.recalculate()
-        else:
-            minus = Livesynthesis.livesynthesis_to_delete('hosts', item)
-            data = {"$inc": {minus: -1, 'hosts_total': -1}}
-            current_app.logger.debug("LS - Deleted host %s: %s", item['name'], data)
-            current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-            # Send livesynthesis to TSDB
-            live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-            Timeseries.send_livesynthesis_metrics(item['_realm'], live_current)
+        minus = Livesynthesis.livesynthesis_to_delete('hosts', item)
+        data = {minus: -1, 'hosts_total': -1}
+        current_app.logger.debug("LS - Deleted host %s: %s", item['name'], data)
+        Livesynthesis.update_counters(item['_realm'], data)
 
     @staticmethod
     def on_deleted_resource_host():
@@ -403,20 +691,10 @@ class Livesynthesis(object):
         if item['_is_template']:
             return
 
-        livesynthesis_db = current_app.data.driver.db['livesynthesis']
-        live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-        if live_current is None:
-            ls = Livesynthesis()
-            ls.recalculate()
-        else:
-            minus = Livesynthesis.livesynthesis_to_delete('services', item)
-            data = {"$inc": {minus: -1, 'services_total': -1}}
-            current_app.logger.debug("LS - Deleted service %s: %s", item['name'], data)
-            current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-            # Send livesynthesis to TSDB
-            live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-            Timeseries.send_livesynthesis_metrics(item['_realm'], live_current)
+        minus = Livesynthesis.livesynthesis_to_delete('services', item)
+        data = {minus: -1, 'services_total': -1}
+        current_app.logger.debug("LS - Deleted service %s: %s", item['name'], data)
+        Livesynthesis.update_counters(item['_realm'], data)
 
     @staticmethod
     def on_deleted_resource_service():
@@ -536,22 +814,253 @@ class Livesynthesis(object):
 
         return minus, plus
 
+    @staticmethod
+    def get_bucket(timestamp):
+        """Get the start of the history period of a date
+
+        :param timestamp: date timestamp (seconds)
+        :type timestamp: int
+        :return: start of the history period
+        :rtype: datetime
+        """
+        return datetime.utcfromtimestamp(
+            timestamp // Livesynthesis.history_bucket * Livesynthesis.history_bucket)
+
+    @staticmethod
+    def store_history(minutes):
+        """Add the current live synthesis of all the realms to their history and delete the
+        too old history
+
+        The history of a live synthesis is stored with a retention document per period (see
+        history_bucket) holding the samples dates and a list of values for each counter. The
+        samples are appended to the documents with one bulk request.
+
+        :param minutes: history duration (minutes), 0 to keep all the history
+        :type minutes: int
+        :return: None
+        """
+        livesynthesis_db = current_app.data.driver.db['livesynthesis']
+        livesynthesisretention_db = current_app.data.driver.db['livesynthesisretention']
+
+        now = int(time.time())
+        date = datetime.utcfromtimestamp(now)
+        counters = list(Livesynthesis.get_new_livesynthesis())
+        updates = []
+        for live in livesynthesis_db.find({}, projection=counters):
+            push = {'dates': date}
+            for counter in counters:
+                push[counter] = live.get(counter) or 0
+            updates.append(pymongo.UpdateOne(
+                {'livesynthesis': live['_id'], 'bucket': Livesynthesis.get_bucket(now)},
+                {'$push': push, '$setOnInsert': {'schema_version': 3}}, upsert=True))
+        if updates:
+            livesynthesisretention_db.bulk_write(updates, ordered=False)
+
+        # Delete the too old periods
+        if minutes > 0:
+            livesynthesisretention_db.delete_many(
+                {'bucket': {'$lt': Livesynthesis.get_bucket(now - 60 * minutes)}})
+
+    @staticmethod
+    def migrate_history():
+        """Move the history formerly stored with a retention document per sample to the
+        retention documents of each period
+
+        The samples of a period are inserted before the samples already stored in the period
+        document, as they are older. The former documents are deleted once moved.
+
+        :return: None
+        """
+        livesynthesisretention_db = current_app.data.driver.db['livesynthesisretention']
+        counters = list(Livesynthesis.get_new_livesynthesis())
+
+        def move(key, samples):
+            """Move the samples of a live synthesis period"""
+            push = {'dates': {'$each': [sample['_created'] for sample in samples],
+                              '$position': 0}}
+            for counter in counters:
+                push[counter] = {'$each': [sample.get(counter) or 0 for sample in samples],
+                                 '$position': 0}
+            livesynthesisretention_db.update_one(
+                {'livesynthesis': key[0], 'bucket': key[1]},
+                {'$push': push, '$setOnInsert': {'schema_version': 3}}, upsert=True)
+            livesynthesisretention_db.delete_many(
+                {'_id': {'$in': [sample['_id'] for sample in samples]}})
+
+        moved = 0
+        key = None
+        samples = []
+        for sample in livesynthesisretention_db.find(
+                {'bucket': {'$exists': False}, '_created': {'$exists': True}},
+                projection=['livesynthesis', '_created'] + counters).sort(
+                    [('livesynthesis', pymongo.ASCENDING), ('_created', pymongo.ASCENDING)]):
+            sample_key = (sample.get('livesynthesis'),
+                          Livesynthesis.get_bucket(timegm(sample['_created'].utctimetuple())))
+            if sample_key != key and samples:
+                move(key, samples)
+                moved += len(samples)
+                samples = []
+            key = sample_key
+            samples.append(sample)
+        if samples:
+            move(key, samples)
+            moved += len(samples)
+        if moved:
+            current_app.logger.info("LS - moved %d history samples to the hourly history", moved)
+
+    @staticmethod
+    def get_history_parameters():
+        """Get the history requested with the history_from and history_step parameters
+
+        * history_from: timestamp of the oldest sample
+        * history_step: keep only the most recent sample of each period of history_step seconds
+
+        The history is also limited to the last SCHEDULER_LIVESYNTHESIS_HISTORY minutes.
+
+        :return: oldest sample timestamp and step (seconds), 0 if not limited
+        :rtype: tuple
+        """
+        try:
+            history_from = int(request.args.get('history_from', 0))
+            history_step = int(request.args.get('history_step', 0))
+        except ValueError:
+            abort(400, description='history_from and history_step must be a number of seconds')
+        if history_step < 0:
+            abort(400, description='history_step must be a positive number of seconds')
+
+        minutes = current_app.config.get('SCHEDULER_LIVESYNTHESIS_HISTORY', 0)
+        if minutes > 0:
+            history_from = max(history_from, int(time.time()) - 60 * minutes)
+        return history_from, history_step
+
+    @staticmethod
+    def get_history(livesynthesis_ids, history_from=0, history_step=0):
+        """Get the history of some live synthesis summed together, the most recent sample first
+
+        The retention documents of all the live synthesis are got with one request. The
+        samples are summed by date: the history cron stores the samples of all the realms with
+        the same date. If a step is requested, the most recent sample of each live synthesis
+        in each period is summed, and the sum is dated with the most recent of these samples.
+
+        :param livesynthesis_ids: live synthesis identifiers
+        :type livesynthesis_ids: list
+        :param history_from: timestamp of the oldest sample, 0 for all the history
+        :type history_from: int
+        :param history_step: keep only the most recent sample of each period of history_step
+        seconds, 0 for all the samples
+        :type history_step: int
+        :return: samples with their date (_created) and the counters values
+        :rtype: list
+        """
+        livesynthesisretention_db = current_app.data.driver.db['livesynthesisretention']
+        counters = list(Livesynthesis.get_new_livesynthesis())
+
+        lookup = {'livesynthesis': {'$in': livesynthesis_ids}, 'bucket': {'$exists': True}}
+        if history_from:
+            lookup['bucket'] = {'$gte': Livesynthesis.get_bucket(history_from)}
+        retentions = livesynthesisretention_db.find(
+            lookup, projection=['livesynthesis', 'dates'] + counters).sort(
+                'bucket', pymongo.DESCENDING)
+
+        # Sum of the counters and date of each period (or of each date if no step)
+        sums = {}
+        dates = {}
+        last_step = {}
+        for retention in retentions:
+            # Period of each sample of the document, None if the sample is not kept
+            periods = []
+            for date in retention.get('dates', []):
+                timestamp = timegm(date.utctimetuple())
+                periods.append(None if timestamp < history_from else timestamp)
+                if history_step and periods[-1] is not None:
+                    periods[-1] = timestamp // history_step
+            if history_step:
+                # Keep the most recent sample of each period of this live synthesis
+                seen = last_step.get(retention['livesynthesis'])
+                for index in range(len(periods) - 1, -1, -1):
+                    if periods[index] is None:
+                        continue
+                    if periods[index] == seen:
+                        periods[index] = None
+                    else:
+                        seen = periods[index]
+                last_step[retention['livesynthesis']] = seen
+
+            for index, period in enumerate(periods):
+                if period is None:
+                    continue
+                if period not in sums:
+                    sums[period] = array('l', [0] * len(counters))
+                    dates[period] = retention['dates'][index]
+                elif retention['dates'][index] > dates[period]:
+                    dates[period] = retention['dates'][index]
+            for position, counter in enumerate(counters):
+                for period, value in zip(periods, retention.get(counter, [])):
+                    if period is not None:
+                        sums[period][position] += value
+
+        history = []
+        for period in sorted(sums, reverse=True):
+            sample = dict(zip(counters, sums[period]))
+            sample['_created'] = dates[period]
+            history.append(sample)
+        return history
+
+    @staticmethod
+    def concatenate(realm, realms):
+        """Sum the live synthesis counters of a realm and of some other realms
+
+        When a realm and all its children are summed, their stored subtree counters are used
+        (see rollup), so that the counters of a realm and of all its children are got with only
+        one document.
+
+        :param realm: realm identifier
+        :type realm: ObjectId
+        :param realms: identifiers of the other realms
+        :type realms: list
+        :return: live synthesis counters
+        :rtype: dict
+        """
+        livesynthesis_db = current_app.data.driver.db['livesynthesis']
+        tree = RealmTree.get_realms()
+        selected = set(realms)
+        selected.add(realm)
+
+        # Realms for which all the subtree is summed, and that are not in such a subtree
+        covered = set(realm_id for realm_id in selected.intersection(tree)
+                      if selected.issuperset(tree[realm_id]['_all_children']))
+        tops = set(realm_id for realm_id in covered
+                   if covered.isdisjoint(tree[realm_id]['_tree_parents']))
+        singles = set(selected)
+        for realm_id in tops:
+            singles.discard(realm_id)
+            singles.difference_update(tree[realm_id]['_all_children'])
+
+        counters = Livesynthesis.get_new_livesynthesis()
+        lookup = {'_realm': {'$in': list(tops | singles)}}
+        for live in livesynthesis_db.find(lookup, projection=list(counters) + ['_realm',
+                                                                               '_subtree']):
+            if live['_realm'] in tops:
+                live = live.get('_subtree') or {}
+            for counter in counters:
+                counters[counter] += live.get(counter) or 0
+        return counters
+
     @staticmethod
     def on_fetched_item_history(response):
         # pylint: disable=too-many-locals, too-many-nested-blocks
         """
         Add to response some more information.
         We manage the 2 special parameters:
-         * history
+         * history, the history may be limited with the history_from and history_step
+           parameters (see get_history_parameters)
          * concatenation
 
         :param response: the response
         :type response: dict
         :return: None
         """
-        realm_drv = current_app.data.driver.db['realm']
         livesynthesis_db = current_app.data.driver.db['livesynthesis']
-        livesynthesisretention_db = current_app.data.driver.db['livesynthesisretention']
 
         history = request.args.get('history')
         concatenation = request.args.get('concatenation')
@@ -559,55 +1068,34 @@ class Livesynthesis(object):
         current_app.logger.debug("LS - History: %s / %s", history, concatenation)
         if concatenation is not None:
             # get the realm the user have access
-            realm = realm_drv.find_one({'_id': response['_realm']})
-            livesynthesis_id = []
             if g.get('back_role_super_admin', False):
                 # no restrictions, we are admin
-                livesynthesis = livesynthesis_db.find({'_realm': {'$in': realm['_all_children']}})
-                for lives in livesynthesis:
-                    livesynthesis_id.append(lives['_id'])
-                    for prop in [x for x in lives if not x.startswith('_')]:
-                        if prop in ['hosts_business_impact', 'services_business_impact']:
-                            continue
-                        response[prop] += lives[prop]
-
+                realms = RealmTree.get_all_children(response['_realm'])
             else:
                 resources_get = g.get('resources_get', {})
-                livesynthesis_access = resources_get['livesynthesis']
+                realms = list(resources_get.get('livesynthesis', []))
                 custom_resources = g.get('resources_get_custom', {})
                 if 'livesynthesis' in custom_resources:
-                    livesynthesis_access.extend(custom_resources['livesynthesis'])
-                livesynthesis = livesynthesis_db.find({'_realm': {'$in': livesynthesis_access}})
-                for lives in livesynthesis:
-                    if lives['_id'] != response['_id']:
-                        livesynthesis_id.append(lives['_id'])
-                        for prop in [x for x in lives if not x.startswith('_')]:
-                            if prop in ['hosts_business_impact', 'services_business_impact']:
-                                continue
-                            response[prop] += lives[prop]
+                    realms.extend(custom_resources['livesynthesis'])
+                realms = [realm for realm in realms if realm != response['_realm']]
+            counters = Livesynthesis.concatenate(response['_realm'], realms)
+            for prop in [x for x in counters if x in response]:
+                response[prop] = counters[prop]
+
+            livesynthesis_id = []
+            if history is not None and realms:
+                livesynthesis = livesynthesis_db.find({'_realm': {'$in': realms}},
+                                                      projection=['_id'])
+                livesynthesis_id = [lives['_id'] for lives in livesynthesis
+                                    if lives['_id'] != response['_id']]
 
         if history is not None:
-            response['history'] = []
-            lsretentions = livesynthesisretention_db.find({'livesynthesis': response['_id']}).sort(
-                '_created', pymongo.DESCENDING)
-            for lsretention in lsretentions:
-                for prop in ['livesynthesis', '_id', '_updated', '_etag']:
-                    if prop in lsretention:
-                        del lsretention[prop]
-                for prop in lsretention:
-                    if not prop == '_created':
-                        lsretention[prop] = int(lsretention[prop])
-                response['history'].append(lsretention)
+            history_from, history_step = Livesynthesis.get_history_parameters()
+            livesynthesis_ids = [response['_id']]
             if concatenation is not None:
-                for ls_id in livesynthesis_id:
-                    lsretentions = livesynthesisretention_db.find({'livesynthesis': ls_id}).sort(
-                        '_created', pymongo.DESCENDING)
-                num = 0
-                for lsretention in lsretentions:
-                    for prop in lsretention:
-                        if not prop.startswith('_') and prop != 'livesynthesis':
-                            response['history'][num][prop] += lsretention[prop]
-                    num += 1
+                livesynthesis_ids.extend(livesynthesis_id)
+            response['history'] = Livesynthesis.get_history(livesynthesis_ids, history_from,
+                                                            history_step)
 
         if 'history' in response:
             current_app.logger.debug("LS - History: %s", response['history'])
@@ -55,7 +55,7 @@ def get_schema():
         'schema': {
             'schema_version': {
                 'type': 'integer',
-                'default': 3,
+                'default': 4,
             },
             # Importation source
             'imported_from': {
@@ -989,6 +989,14 @@ def get_schema():
                 'type': 'integer',
                 'default': 3
             },
+            '_overall_services': {
+                'schema_version': 4,
+                'title': 'Services overall states',
+                'comment': 'Number of the host monitored services in a HARD state for each '
+                           'overall state (0 to 4).',
+                'type': 'list',
+                'default': [0, 0, 0, 0, 0]
+            },
 
             # Realm
             '_realm': {
@@ -45,11 +45,8 @@ def get_schema():
     :rtype: dict
     """
     return {
-        'mongo_indexes': {
-            'index_tpl': [('_is_template', 1)],
-            'index_name': [('name', 1)],
-            'index_host': [('host', 1), ('name', 1)],
-        },
+        # The unique realm index is created when the backend starts, once the duplicated live
+        # synthesis of the former versions are removed (see Livesynthesis.create_realm_index)
         'schema': {
             'schema_version': {
                 'type': 'integer',
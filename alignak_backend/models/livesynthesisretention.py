@@ -25,8 +25,12 @@ def get_doc():  # pragma: no cover
     return """
     The ``livesynthesisretention`` model is a cache used internally by the backend to store the
     last computed live synthesis information. If the live synthesis history is configured,
-    a count of ``SCHEDULER_LIVESYNTHESIS_HISTORY`` live synthesis elements will be store in the
-    live synthesis retention data model.
+    the live synthesis elements of the last ``SCHEDULER_LIVESYNTHESIS_HISTORY`` minutes will be
+    stored in the live synthesis retention data model.
+
+    The history of a live synthesis is stored with one element per hour (``bucket``). Each
+    element holds the dates of the history samples and, for each counter, the list of the
+    counter values at these dates.
     """
 
 
@@ -38,175 +42,272 @@ def get_schema():
     """
     return {
         'internal_resource': True,
+        'mongo_indexes': {
+            'index_livesynthesis_bucket': [('livesynthesis', 1), ('bucket', 1)],
+            'index_bucket': [('bucket', 1)],
+        },
         'schema': {
             'schema_version': {
                 'type': 'integer',
-                'default': 2,
+                'default': 3,
             },
-            'hosts_total': {
+            'livesynthesis': {
                 'schema_version': 1,
+                'type': 'objectid',
+                'data_relation': {
+                    'resource': 'livesynthesis',
+                },
+                'required': True,
+            },
+            'bucket': {
+                'schema_version': 3,
+                'title': 'Start of the history period',
+                'type': 'datetime',
+                'required': True,
+            },
+            'dates': {
+                'schema_version': 3,
+                'title': 'Dates of the history samples',
+                'type': 'list',
+                'schema': {
+                    'type': 'datetime',
+                },
+                'default': [],
+            },
+            'hosts_total': {
+                'schema_version': 3,
                 'title': 'Hosts count',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'hosts_not_monitored': {
-                'schema_version': 2,
+                'schema_version': 3,
                 'title': 'Hosts not monitored',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'hosts_up_hard': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Hosts Up hard',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'hosts_up_soft': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Hosts Up soft',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'hosts_down_hard': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Hosts Down hard',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'hosts_down_soft': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Hosts Down soft',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'hosts_unreachable_hard': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Hosts Unreachable hard',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'hosts_unreachable_soft': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Hosts Unreachable soft',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'hosts_acknowledged': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Hosts ackowledged',
-                'type': 'integer',
-                'default': 0
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'hosts_in_downtime': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Hosts in downtime',
-                'type': 'integer',
-                'default': 0
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'hosts_flapping': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Hosts flapping',
-                'type': 'integer',
-                'default': 0
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
 
             'services_total': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services count',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_not_monitored': {
-                'schema_version': 2,
+                'schema_version': 3,
                 'title': 'Services not monitored',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_ok_hard': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services Ok hard',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_ok_soft': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services Ok soft',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_warning_hard': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services Warning hard',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_warning_soft': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services Warning soft',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_critical_hard': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services Critical hard',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_critical_soft': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services Criticl soft',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_unknown_hard': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services Unknown hard',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_unknown_soft': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services Unknown soft',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_unreachable_hard': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services Unreachable hard',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_unreachable_soft': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services Unreachable soft',
-                'type': 'integer',
-                'default': 0,
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_acknowledged': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services acknowledged',
-                'type': 'integer',
-                'default': 0
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_in_downtime': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services in downtime',
-                'type': 'integer',
-                'default': 0
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
+                },
+                'default': [],
             },
             'services_flapping': {
-                'schema_version': 1,
+                'schema_version': 3,
                 'title': 'Services flapping',
-                'type': 'integer',
-                'default': 0
-            },
-            'livesynthesis': {
-                'schema_version': 1,
-                'type': 'objectid',
-                'data_relation': {
-                    'resource': 'livesynthesis',
+                'type': 'list',
+                'schema': {
+                    'type': 'integer',
                 },
-                'required': True,
+                'default': [],
             }
         },
         'schema_deleted': {
@@ -54,7 +54,7 @@ def get_schema():
         'schema': {
             'schema_version': {
                 'type': 'integer',
-                'default': 1,
+                'default': 2,
             },
             # Importation source
             'imported_from': {
@@ -107,6 +107,27 @@ def get_schema():
                 'default': False
             },
 
+            # Check results history
+            'history_check_result': {
+                'schema_version': 2,
+                'title': 'Check results history',
+                'comment': 'Check results recorded in the history for the hosts and services of '
+                           'this realm: all the check results, only the state changes, or the '
+                           'state changes and one check result every history_heartbeat minutes.',
+                'type': 'string',
+                'allowed': ['all', 'state_change', 'heartbeat'],
+                'default': 'all'
+            },
+            'history_heartbeat': {
+                'schema_version': 2,
+                'title': 'Check results history heartbeat',
+                'comment': 'Period (minutes) of the check results recorded in the history when '
+                           'the state did not change.',
+                'type': 'integer',
+                'min': 1,
+                'default': 60
+            },
+
             # todo: check whether this is really useful :/
             'hosts_critical_threshold': {
                 'schema_version': 1,
@@ -42,6 +42,9 @@ def get_schema():
             'index_updated': [('_updated', 1)],
             'index_tpl': [('_is_template', 1)],
             'index_name': [('name', 1)],
+            # Users without a token have an empty token
+            'index_token': ([('token', 1)], {'unique': True,
+                                             'partialFilterExpression': {'token': {'$gt': ''}}}),
         },
         'schema': {
             'schema_version': {
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.names`` module
+
+    This module resolves the hosts, services and users names and identifiers
+"""
+from __future__ import print_function
+from flask import current_app
+
+from alignak_backend.cache import VersionedCache
+
+
+class Names(object):
+    """
+        Names class
+
+        Resolve an host, a service or an user from its identifier or its name. The resolved
+        items are stored in a least recently used cache, and only contain the fields listed
+        in `fields`.
+
+        The cache is cleared in all the backend processes (see VersionedCache) when an item is
+        replaced, deleted or when one of the cached fields is updated. The cache entries of an
+        inserted item are only removed in the current process: another process can not have
+        cached them since the former item with the same name was deleted or renamed.
+    """
+    fields = {
+        'host': ['name', '_realm', '_sub_realm'],
+        'service': ['name', 'host', '_realm', '_sub_realm'],
+        'user': ['name', '_realm', '_sub_realm']
+    }
+    cache = VersionedCache('names', maxsize=0)
+
+    @staticmethod
+    def configure(maxsize, ttl):
+        """Create the names cache
+
+        :param maxsize: maximum number of cache entries, 0 to disable the cache
+        :type maxsize: int
+        :param ttl: cache entries time to live (seconds), 0 for no expiry
+        :type ttl: int
+        :return: None
+        """
+        Names.cache = VersionedCache('names', maxsize, ttl)
+
+    @staticmethod
+    def get_name_key(resource, item):
+        """Get the cache key of an item name
+
+        A service name is only unique for its host.
+
+        :param resource: name of the resource
+        :type resource: str
+        :param item: item (or name for an host or an user, (host, name) tuple for a service)
+        :type item: dict or str or tuple
+        :return: the cache key
+        :rtype: tuple
+        """
+        if isinstance(item, dict):
+            if resource == 'service':
+                return (resource, item.get('host'), item.get('name'))
+            return (resource, item.get('name'))
+        if resource == 'service':
+            return (resource, ) + tuple(item)
+        return (resource, item)
+
+    @staticmethod
+    def store(resource, item):
+        """Store an item in the cache
+
+        :param resource: name of the resource
+        :type resource: str
+        :param item: the item, with at least the cached fields
+        :type item: dict
+        :return: the cached item
+        :rtype: dict
+        """
+        cached = {'_id': item['_id']}
+        for field in Names.fields[resource]:
+            cached[field] = item.get(field)
+        Names.cache.set((resource, item['_id']), cached)
+        Names.cache.set(Names.get_name_key(resource, cached), cached)
+        return cached
+
+    @staticmethod
+    def find(resource, ids=None, names=None):
+        """Find several items from their identifiers or their names
+
+        The items missing from the cache are searched for with one database request.
+
+        :param resource: name of the resource
+        :type resource: str
+        :param ids: items identifiers
+        :type ids: list
+        :param names: items names, (host, name) tuples for the services
+        :type names: list
+        :return: found items indexed by their identifier and by their name key
+        :rtype: dict
+        """
+        Names.cache.check_version()
+        found = {}
+        missing_ids = []
+        missing_names = []
+        for _id in ids or []:
+            item = Names.cache.get((resource, _id))
+            if item is None:
+                missing_ids.append(_id)
+            else:
+                found[_id] = item
+        for name in names or []:
+            key = Names.get_name_key(resource, name)
+            item = Names.cache.get(key)
+            if item is None:
+                missing_names.append(name)
+            else:
+                found[key] = item
+
+        if not missing_ids and not missing_names:
+            return found
+
+        query = []
+        if missing_ids:
+            query.append({'_id': {'$in': missing_ids}})
+        if missing_names and resource == 'service':
+            query.append({'host': {'$in': [host for host, dummy in missing_names]},
+                          'name': {'$in': [name for dummy, name in missing_names]}})
+        elif missing_names:
+            query.append({'name': {'$in': missing_names}})
+        for item in current_app.data.driver.db[resource].find(
+                {'$or': query}, projection=Names.fields[resource]):
+            item = Names.store(resource, item)
+            found[item['_id']] = item
+            found[Names.get_name_key(resource, item)] = item
+        return found
+
+    @staticmethod
+    def get(resource, _id=None, name=None):
+        """Find an item from its identifier or its name
+
+        :param resource: name of the resource
+        :type resource: str
+        :param _id: item identifier
+        :type _id: ObjectId
+        :param name: item name, (host, name) tuple for a service
+        :type name: str or tuple
+        :return: the item or None if not found
+        :rtype: dict
+        """
+        if _id is not None:
+            return Names.find(resource, ids=[_id]).get(_id)
+        return Names.find(resource, names=[name]).get(Names.get_name_key(resource, name))
+
+    @staticmethod
+    def forget(resource, item):
+        """Remove an item from the cache
+
+        :param resource: name of the resource
+        :type resource: str
+        :param item: the item
+        :type item: dict
+        :return: None
+        """
+        cached = Names.cache.pop((resource, item['_id']))
+        if cached is not None:
+            Names.cache.pop(Names.get_name_key(resource, cached))
+        Names.cache.pop(Names.get_name_key(resource, item))
+
+    @staticmethod
+    def on_inserted(resource, items):
+        """Called by EVE HOOK (app.on_inserted)
+
+        A new item may use the name of a deleted item
+
+        :param resource: name of the resource
+        :type resource: str
+        :param items: inserted items
+        :type items: list
+        :return: None
+        """
+        if resource not in Names.fields:
+            return
+        for item in items:
+            Names.forget(resource, item)
+
+    @staticmethod
+    def on_updated(resource, updates, original):
+        """Called by EVE HOOK (app.on_updated)
+
+        :param resource: name of the resource
+        :type resource: str
+        :param updates: updated fields
+        :type updates: dict
+        :param original: original fields
+        :type original: dict
+        :return: None
+        """
+        if resource not in Names.fields:
+            return
+        if any(field in updates and updates[field] != original.get(field)
+               for field in Names.fields[resource]):
+            Names.cache.invalidate()
+
+    @staticmethod
+    def on_replaced(resource, document, original):
+        """Called by EVE HOOK (app.on_replaced)
+
+        :param resource: name of the resource
+        :type resource: str
+        :param document: new item
+        :type document: dict
+        :param original: original item
+        :type original: dict
+        :return: None
+        """
+        # pylint: disable=unused-argument
+        if resource not in Names.fields:
+            return
+        Names.cache.invalidate()
+
+    @staticmethod
+    def on_deleted_item(resource, item):
+        """Called by EVE HOOK (app.on_deleted_item)
+
+        :param resource: name of the resource
+        :type resource: str
+        :param item: deleted item
+        :type item: dict
+        :return: None
+        """
+        # pylint: disable=unused-argument
+        if resource not in Names.fields:
+            return
+        Names.cache.invalidate()
+
+    @staticmethod
+    def on_deleted_resource(resource):
+        """Called by EVE HOOK (app.on_deleted_resource)
+
+        :param resource: name of the resource
+        :type resource: str
+        :return: None
+        """
+        if resource not in Names.fields:
+            return
+        Names.cache.invalidate()
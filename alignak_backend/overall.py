@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.overall`` module
+
+    This module maintains the overall states of the services of each host
+"""
+from __future__ import print_function
+from flask import current_app
+from pymongo import UpdateOne
+
+
+class Overall(object):
+    """
+        Overall class
+
+        For each host, count its services in each overall state (0 to 4). Only the monitored
+        services in a HARD state are counted, as they are the ones used to compute the host
+        overall state.
+
+        The counters are stored in the `_overall_services` field of the host and updated with
+        atomic increments by the services hooks, so that they are shared by all the backend
+        processes and the host overall state is computed without reading its services.
+    """
+    states = 5
+    field = '_overall_services'
+
+    @staticmethod
+    def get_service_state(service):
+        """Get the overall state counted for a service
+
+        :param service: service fields
+        :type service: dict
+        :return: the service overall state or None if it is not counted
+        :rtype: int
+        """
+        if service.get('ls_state_type', 'HARD') != 'HARD':
+            return None
+        state = service.get('_overall_state_id', 3)
+        if state is None or state < 0 or state >= Overall.states:
+            return None
+        return state
+
+    @staticmethod
+    def count(lookup):
+        """Count the services in each overall state
+
+        :param lookup: services lookup
+        :type lookup: dict
+        :return: services count for each overall state, indexed by host
+        :rtype: dict
+        """
+        counters = {}
+        services = current_app.data.driver.db['service'].find(
+            lookup, projection={'_id': 0, 'host': 1, 'ls_state_type': 1, '_overall_state_id': 1})
+        for service in services:
+            host_counters = counters.setdefault(service.get('host'), [0] * Overall.states)
+            state = Overall.get_service_state(service)
+            if state is not None:
+                host_counters[state] += 1
+        return counters
+
+    @staticmethod
+    def initialize():
+        """Count the services of the hosts which do not yet have services overall states
+        counters (hosts created by a former backend version)
+
+        :return: None
+        """
+        hosts_drv = current_app.data.driver.db['host']
+        hosts = [host['_id'] for host in hosts_drv.find({Overall.field: {'$exists': False}},
+                                                        projection={'_id': 1})]
+        if not hosts:
+            return
+        counters = Overall.count({'host': {'$in': hosts}})
+        requests = [UpdateOne({'_id': host, Overall.field: {'$exists': False}},
+                              {'$set': {Overall.field: counters.get(host, [0] * Overall.states)}})
+                    for host in hosts]
+        hosts_drv.bulk_write(requests, ordered=False)
+        current_app.logger.info("Overall - counted the services overall states of %d hosts",
+                                len(hosts))
+
+    @staticmethod
+    def get_worst_state(host):
+        """Get the worst overall state of the services of an host
+
+        :param host: host fields
+        :type host: dict
+        :return: the worst services overall state, 0 if no service is counted
+        :rtype: int
+        """
+        counters = host.get(Overall.field)
+        if counters is None:
+            counters = Overall.count({'host': host['_id']}).get(host['_id'],
+                                                                [0] * Overall.states)
+        for state in range(Overall.states - 1, 0, -1):
+            if counters[state] > 0:
+                return state
+        return 0
+
+    @staticmethod
+    def update(host, previous, state):
+        """Move a service of an host from an overall state to another one
+
+        :param host: host identifier
+        :type host: ObjectId
+        :param previous: previous counted overall state or None
+        :type previous: int
+        :param state: new counted overall state or None
+        :type state: int
+        :return: None
+        """
+        if previous == state or host is None:
+            return
+        increments = {}
+        if previous is not None:
+            increments['%s.%d' % (Overall.field, previous)] = -1
+        if state is not None:
+            increments['%s.%d' % (Overall.field, state)] = 1
+        current_app.data.driver.db['host'].update_one(
+            {'_id': host, Overall.field: {'$exists': True}}, {'$inc': increments})
+
+    @staticmethod
+    def on_inserted_service(items):
+        """Called by EVE HOOK (app.on_inserted_service)
+
+        :param items: inserted services
+        :type items: list
+        :return: None
+        """
+        for item in items:
+            Overall.update(item.get('host'), None, Overall.get_service_state(item))
+
+    @staticmethod
+    def on_updated_service(updates, original):
+        """Called when a service is updated, before its host overall state is computed
+
+        :param updates: updated fields
+        :type updates: dict
+        :param original: original fields
+        :type original: dict
+        :return: None
+        """
+        updated = original.copy()
+        updated.update(updates)
+        if updated.get('host') != original.get('host'):
+            Overall.update(original.get('host'), Overall.get_service_state(original), None)
+            Overall.update(updated.get('host'), None, Overall.get_service_state(updated))
+            return
+        Overall.update(original.get('host'), Overall.get_service_state(original),
+                       Overall.get_service_state(updated))
+
+    @staticmethod
+    def on_replaced_service(document, original):
+        """Called by EVE HOOK (app.on_replaced_service)
+
+        :param document: new service
+        :type document: dict
+        :param original: original service
+        :type original: dict
+        :return: None
+        """
+        Overall.update(original.get('host'), Overall.get_service_state(original), None)
+        Overall.update(document.get('host'), None, Overall.get_service_state(document))
+
+    @staticmethod
+    def on_replaced_host(document, original):
+        """Called by EVE HOOK (app.on_replaced_host)
+
+        The replaced host got the default counters, count its services again
+
+        :param document: new host
+        :type document: dict
+        :param original: original host
+        :type original: dict
+        :return: None
+        """
+        # pylint: disable=unused-argument
+        counters = Overall.count({'host': document['_id']})
+        current_app.data.driver.db['host'].update_one(
+            {'_id': document['_id']},
+            {'$set': {Overall.field: counters.get(document['_id'], [0] * Overall.states)}})
+
+    @staticmethod
+    def on_deleted_item_service(item):
+        """Called by EVE HOOK (app.on_deleted_item_service)
+
+        :param item: deleted service
+        :type item: dict
+        :return: None
+        """
+        Overall.update(item.get('host'), Overall.get_service_state(item), None)
+
+    @staticmethod
+    def on_deleted_resource_service():
+        """Called by EVE HOOK (app.on_deleted_resource_service)
+
+        :return: None
+        """
+        current_app.data.driver.db['host'].update_many(
+            {}, {'$set': {Overall.field: [0] * Overall.states}})
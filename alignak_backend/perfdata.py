@@ -6,12 +6,17 @@ This module provide classes to handle performance data from monitoring plugin ou
 import re
 from six import itervalues
 
+from alignak_backend.cache import Cache
+
 PERFDATA_SPLIT_PATTERN = re.compile(r'([^=]+=\S+)')
 METRIC_PATTERN = \
     re.compile(
         r'^([^=]+)=([\d\.\-\+eE]+)([\w\/%]*)'
         r';?([\d\.\-\+eE:~@]+)?;?([\d\.\-\+eE:~@]+)?;?([\d\.\-\+eE]+)?;?([\d\.\-\+eE]+)?;?\s*'
     )
+# Characters of a value, a minimum / maximum and a threshold in a canonical perfdata
+NUMBER_CHARS = '0123456789.-+eE'
+THRESHOLD_CHARS = NUMBER_CHARS + ':~@'
 
 
 def to_best_int_float(val):
@@ -31,8 +36,8 @@ def to_best_int_float(val):
     >>> to_best_int_float("20")
     20
     """
-    integer = int(float(val))
     flt = float(val)
+    integer = int(flt)
     # If the f is a .0 value,
     # best match is int
     if integer == flt:
@@ -49,6 +54,8 @@ def guess_int_or_float(val):
     :return: value casted into int, float or None
     :rtype: int | float | NoneType
     """
+    if not val:
+        return None
     try:
         return to_best_int_float(val)
     except Exception:
@@ -58,12 +65,98 @@ def guess_int_or_float(val):
 class Metric(object):
     """
     Class providing a small abstraction for one metric of a Perfdatas class
+
+    The canonical form `label=value[uom];warn;crit;min;max` is parsed with a tokenizer, the
+    other forms with a regular expression. The name and the parsed thresholds of a label are
+    stored in a least recently used cache, so that they are reused while the thresholds of the
+    label do not change.
     """
     # pylint: disable=too-few-public-methods
+    cache = Cache(maxsize=10000)
+
     def __init__(self, string):
         self.name = self.value = self.uom = \
             self.warning = self.critical = self.min = self.max = None
         string = string.strip()
+        if not self.parse(string):
+            self.parse_regex(string)
+        if self.uom == '%':
+            self.min = 0
+            self.max = 100
+
+    @staticmethod
+    def configure(maxsize):
+        """Create the perfdata labels cache
+
+        :param maxsize: maximum number of cached labels, 0 to disable the cache
+        :type maxsize: int
+        :return: None
+        """
+        Metric.cache = Cache(maxsize)
+
+    @staticmethod
+    def parse_thresholds(fields):
+        """Parse the warning, critical, min and max fields of a canonical perfdata
+
+        :param fields: thresholds fields
+        :type fields: list
+        :return: warning, critical, min and max, or None if a field is not canonical
+        :rtype: tuple
+        """
+        parsed = [None, None, None, None]
+        for index, field in enumerate(fields):
+            if field.strip(THRESHOLD_CHARS if index < 2 else NUMBER_CHARS):
+                return None
+            parsed[index] = guess_int_or_float(field)
+        return tuple(parsed)
+
+    def parse(self, string):
+        """Parse a canonical perfdata: label=value[uom];warn;crit;min;max
+
+        :param string: perfdata of the metric
+        :type string: str
+        :return: True if the perfdata is canonical and parsed
+        :rtype: bool
+        """
+        label, sep, data = string.partition('=')
+        if not sep or not label:
+            return False
+        end = data.find(';')
+        if end < 0:
+            value, thresholds = data, ''
+        else:
+            value, thresholds = data[:end], data[end:]
+        uom = value.lstrip(NUMBER_CHARS)
+        if len(uom) == len(value):
+            return False
+        if uom and not uom.isalnum() and not uom.replace('_', 'a').replace('/', 'a') \
+                .replace('%', 'a').isalnum():
+            return False
+
+        entry = Metric.cache.get(label)
+        if entry is None or entry[1] != thresholds:
+            fields = thresholds.split(';')[1:]
+            if len(fields) > 4:
+                return False
+            parsed = Metric.parse_thresholds(fields)
+            if parsed is None:
+                return False
+            # Remove all ' in the name
+            entry = (label.replace("'", ""), thresholds, parsed)
+            Metric.cache.set(label, entry)
+        self.name = entry[0]
+        self.warning, self.critical, self.min, self.max = entry[2]
+        self.value = guess_int_or_float(value[:len(value) - len(uom)])
+        self.uom = uom
+        return True
+
+    def parse_regex(self, string):
+        """Parse a perfdata with the regular expression
+
+        :param string: perfdata of the metric
+        :type string: str
+        :return: None
+        """
         matches = METRIC_PATTERN.match(string)
         if matches:
             # Get the name but remove all ' in it
@@ -74,9 +167,6 @@ class Metric(object):
             self.critical = guess_int_or_float(matches.group(5))
             self.min = guess_int_or_float(matches.group(6))
             self.max = guess_int_or_float(matches.group(7))
-            if self.uom == '%':
-                self.min = 0
-                self.max = 100
 
     def __str__(self):  # pragma: no cover, only for debugging purpose
         string = "%s=%s%s" % (self.name, self.value, self.uom)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.realmtree`` module
+
+    This module manages an in-memory snapshot of the realms tree
+"""
+from __future__ import print_function
+from flask import current_app, g
+
+
+class RealmTree(object):
+    """
+        RealmTree class
+
+        The realms tree (names, parents and children of each realm) is loaded once from the
+        database and shared by all the hooks that need it.
+
+        The snapshot is versioned: each modification of a realm increments a version counter
+        stored in the database. Once per request, the stored version is compared with the
+        snapshot version, so that all the backend processes rebuild their snapshot after a
+        modification made by another process.
+    """
+    version_collection = 'realmtree'
+    version = None
+    realms = {}
+
+    @staticmethod
+    def get_version():
+        """Get the realms tree version stored in the database
+
+        :return: realms tree version
+        :rtype: int
+        """
+        version = current_app.data.driver.db[RealmTree.version_collection].find_one(
+            {'_id': 'version'})
+        if version is None:
+            return 0
+        return version['version']
+
+    @staticmethod
+    def invalidate():
+        """Called when a realm is inserted, updated or deleted
+
+        Increment the stored version and drop the local snapshot
+
+        :return: None
+        """
+        current_app.data.driver.db[RealmTree.version_collection].update_one(
+            {'_id': 'version'}, {'$inc': {'version': 1}}, upsert=True)
+        RealmTree.version = None
+
+    @staticmethod
+    def rebuild():
+        """Load the realms tree from the database
+
+        :return: None
+        """
+        version = RealmTree.get_version()
+        realms = {}
+        for realm in current_app.data.driver.db['realm'].find(
+                {}, projection=['name', '_level', '_parent', '_children',
+                                '_tree_parents', '_all_children',
+                                'history_check_result', 'history_heartbeat']):
+            realms[realm['_id']] = {
+                '_id': realm['_id'],
+                'name': realm['name'],
+                '_level': realm['_level'],
+                '_parent': realm.get('_parent'),
+                '_children': realm.get('_children', []),
+                '_tree_parents': realm.get('_tree_parents', []),
+                '_all_children': realm.get('_all_children', []),
+                'history_check_result': realm.get('history_check_result', 'all'),
+                'history_heartbeat': realm.get('history_heartbeat', 60)
+            }
+
+        # Realms path from the top level realm, used as a prefix for the timeseries
+        for realm in realms.values():
+            parents = [realms[parent] for parent in realm['_tree_parents'] if parent in realms]
+            parents.sort(key=lambda parent: parent['_level'])
+            realm['prefix'] = '.'.join([parent['name'] for parent in parents] + [realm['name']])
+
+        current_app.logger.debug("Realms tree - loaded %d realms (version %d)",
+                                 len(realms), version)
+        RealmTree.realms = realms
+        RealmTree.version = version
+
+    @staticmethod
+    def get_realms():
+        """Get the realms tree snapshot, rebuilt if the realms changed
+
+        :return: realms indexed by their identifier
+        :rtype: dict
+        """
+        if RealmTree.version is None:
+            RealmTree.rebuild()
+        elif not g.get('realm_tree_checked', False):
+            if RealmTree.get_version() != RealmTree.version:
+                RealmTree.rebuild()
+        g.realm_tree_checked = True
+        return RealmTree.realms
+
+    @staticmethod
+    def get_realm(realm_id):
+        """Get a realm from the snapshot
+
+        The returned realm must not be modified.
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :return: the realm or None if it does not exist
+        :rtype: dict
+        """
+        realm = RealmTree.get_realms().get(realm_id)
+        if realm is None and RealmTree.get_version() != RealmTree.version:
+            # Created by another process since the snapshot was checked
+            RealmTree.rebuild()
+            realm = RealmTree.realms.get(realm_id)
+        return realm
+
+    @staticmethod
+    def get_tree_parents(realm_id):
+        """Get the parents of a realm
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :return: list of the parent realms identifiers, top level first
+        :rtype: list
+        """
+        realm = RealmTree.get_realm(realm_id)
+        if realm is None:
+            return []
+        return realm['_tree_parents']
+
+    @staticmethod
+    def get_all_children(realm_id):
+        """Get all the children of a realm
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :return: list of the children realms identifiers
+        :rtype: list
+        """
+        realm = RealmTree.get_realm(realm_id)
+        if realm is None:
+            return []
+        return realm['_all_children']
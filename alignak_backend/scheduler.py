@@ -45,3 +45,21 @@ def cron_livesynthesis_history():
     :return: None
     """
     alignak_backend.app.cron_livesynthesis_history()
+
+
+def cron_livesynthesis_reconcile():
+    """
+    It's the scheduler used to correct the livesynthesis counters drift
+
+    :return: None
+    """
+    alignak_backend.app.cron_livesynthesis_reconcile()
+
+
+def cron_livesynthesis_metrics():
+    """
+    It's the scheduler used to send the livesynthesis counters to the TSDB
+
+    :return: None
+    """
+    alignak_backend.app.cron_livesynthesis_metrics()
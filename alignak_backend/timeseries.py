@@ -10,22 +10,75 @@ from __future__ import print_function
 import os
 import re
 import time
+try:
+    from Queue import Full
+except ImportError:
+    from queue import Full
 from flask import current_app
-from influxdb import InfluxDBClient
+from pymongo.errors import PyMongoError
 import statsd
 
 from eve.methods.post import post_internal
-from alignak_backend.carboniface import CarbonIface
+from alignak_backend.bulk import bulk_find
+from alignak_backend.carbonpool import CarbonPool
+from alignak_backend.influxdbpool import InfluxdbPool, make_line
 from alignak_backend.perfdata import PerfDatas, Metric
+from alignak_backend.realmtree import RealmTree
+from alignak_backend.writebehind import WriteBehind
+
+# Metric name ending with a timestamp: name.1475670730
+TIMESTAMP_SUFFIX_PATTERN = re.compile(r'^(.*)\.[\d]{10}$')
+# Characters not allowed in a TSDB name
+UNALLOWED_NAME_PATTERN = re.compile(r'[^a-zA-Z_\-0-9\.\$]')
 
 
 class Timeseries(object):
     """
         Timeseries class
     """
+    # Persistent connections to the carbon daemons and InfluxDB clients, configured when the
+    # application is created
+    carbon = CarbonPool()
+    influxdb = InfluxdbPool()
+    # Metrics export write-behind queue (see TimeseriesExport)
+    export_queue = None
+    # Sanitized hosts, services and metrics names, and their maximum number
+    names = {}
+    names_maxsize = 100000
+
+    @staticmethod
+    def configure(maxsize):
+        """Empty the sanitized names cache and set its maximum size
+
+        :param maxsize: maximum number of cached names, 0 to disable the cache
+        :type maxsize: int
+        :return: None
+        """
+        Timeseries.names = {}
+        Timeseries.names_maxsize = maxsize
 
     @staticmethod
     def sanitize_name(field_name):
+        """Get the sanitized name of a field for a TSDB (see get_sanitized_name)
+
+        The sanitized names are stored in a dictionary, without a lock as the names are the
+        same in all the threads. The dictionary is emptied when it holds `names_maxsize` names.
+
+        :param field_name: Field name to clean
+        :type field_name: string
+        :return: sanitized field name
+        """
+        sanitized = Timeseries.names.get(field_name)
+        if sanitized is None:
+            sanitized = Timeseries.get_sanitized_name(field_name)
+            if Timeseries.names_maxsize > 0:
+                if len(Timeseries.names) >= Timeseries.names_maxsize:
+                    Timeseries.names.clear()
+                Timeseries.names[field_name] = sanitized
+        return sanitized
+
+    @staticmethod
+    def get_sanitized_name(field_name):
         """Sanitize a field name for aTSDB (Graphite or Influx)
         - remove unallowed characters from the field name
 
@@ -47,71 +100,137 @@ class Timeseries(object):
         # % becomes _pct
         sanitized = sanitized.replace("%", "_pct")
         # all character not in [a-zA-Z_-0-9.] is removed
-        sanitized = re.sub(r'[^a-zA-Z_\-0-9\.\$]', '', sanitized)
+        sanitized = UNALLOWED_NAME_PATTERN.sub('', sanitized)
 
         return sanitized
 
     @staticmethod
-    def send_livesynthesis_metrics(realm_uuid, livesynthesis):
-        """Called to send the livesynthesis metrics to the configured TSDB
-
-        :param items: List of logcheckresult inserted
-        :type items: list
-        :return: None
+    def get_livesynthesis_data(realm_uuid, livesynthesis, timestamp):
+        """Get the livesynthesis metrics of a realm to send to the TSDB
+
+        :param realm_uuid: id of the realm
+        :type realm_uuid: str
+        :param livesynthesis: livesynthesis counters
+        :type livesynthesis: dict
+        :param timestamp: timestamp of the metrics
+        :type timestamp: int
+        :return: data to send to the TSDB (see send_to_timeseries_db)
+        :rtype: list
         """
-        ls = {'perf_data': []}
+        realm = Timeseries.get_realms_prefix(realm_uuid)
+        send_data = []
         for counter in livesynthesis:
             if counter.startswith('_'):
                 continue
-            current_app.logger.debug("   - counter: %s", counter)
-            ls['perf_data'].append("%s=%d" % (counter, livesynthesis[counter]))
-
-        ls['perf_data'] = " ".join(ls['perf_data'])
-        current_app.logger.debug("   - perf_data: %s", ls['perf_data'])
-
-        ts = Timeseries.prepare_data(ls)
-        send_data = []
-        for d in ts['data']:
             send_data.append({
-                "realm": Timeseries.get_realms_prefix(realm_uuid),
+                "realm": realm,
                 "host": 'alignak_livesynthesis',
                 "service": '',
-                "timestamp": int(time.time()),
-                "name": d['name'],
+                "timestamp": timestamp,
+                "name": Timeseries.sanitize_name(counter),
                 # Cast as a string to bypass int/float real value
-                "value": str(d['value']),
-                "uom": d['uom']
+                "value": str(livesynthesis[counter]),
+                "uom": ''
             })
+        return send_data
+
+    @staticmethod
+    def send_livesynthesis_metrics(realm_uuid, livesynthesis):
+        """Called to send the livesynthesis metrics to the configured TSDB
+
+        :param realm_uuid: id of the realm
+        :type realm_uuid: str
+        :param livesynthesis: livesynthesis counters
+        :type livesynthesis: dict
+        :return: None
+        """
+        send_data = Timeseries.get_livesynthesis_data(realm_uuid, livesynthesis,
+                                                      int(time.time()))
+        current_app.logger.debug("   - livesynthesis metrics: %s", send_data)
         Timeseries.send_to_timeseries_db(send_data, realm_uuid)
 
+    @staticmethod
+    def send_livesynthesis_snapshot(lives):
+        """Send the livesynthesis metrics of all the realms to the configured TSDB
+
+        The metrics of all the realms are sent with one write for each TSDB. A TSDB gets the
+        metrics of its realm, and of its sub-realms if it is defined for the sub-realms.
+
+        :param lives: livesynthesis of all the realms
+        :type lives: list
+        :return: None
+        """
+        realms = RealmTree.get_realms()
+        timestamp = int(time.time())
+        data = {}
+        for livesynthesis in lives:
+            if livesynthesis['_realm'] in realms:
+                data[livesynthesis['_realm']] = Timeseries.get_livesynthesis_data(
+                    livesynthesis['_realm'], livesynthesis, timestamp)
+
+        for resource in ['graphite', 'influxdb']:
+            for target in current_app.data.driver.db[resource].find():
+                send_data = []
+                for realm, realm_data in data.items():
+                    if realm == target['_realm'] or target.get('_sub_realm') and \
+                            target['_realm'] in realms[realm]['_tree_parents']:
+                        send_data.extend(realm_data)
+                if send_data:
+                    Timeseries.send_to_timeseries_target(resource, send_data, target)
+
     @staticmethod
     def after_inserted_logcheckresult(items):
         """Called by EVE HOOK (app.on_inserted_logcheckresult)
 
+        If TIMESERIES_WRITE_BEHIND is set, the fields used for the metrics are queued to be
+        exported by a background thread (see TimeseriesExport).
+
         :param items: List of logcheckresult inserted
         :type items: list
         :return: None
         """
-        host_db = current_app.data.driver.db['host']
-        service_db = current_app.data.driver.db['service']
-        for dummy, item in enumerate(items):
-            host_info = host_db.find_one({'_id': item['host']})
-            if not host_info['process_perf_data']:
+        if current_app.config.get('TIMESERIES_WRITE_BEHIND', True):
+            Timeseries.export_queue.put([
+                (item['host'], item['service'], item['_realm'], item['last_check'],
+                 item['state_id'], item['perf_data']) for item in items
+            ])
+            return
+        Timeseries.export(items)
+
+    @staticmethod
+    def export(items):
+        """Send the metrics of some log checks results to the timeseries databases
+
+        The metrics are sent with one request for each realm of the hosts / services. The log
+        checks results of the hosts / services deleted meanwhile are ignored.
+
+        :param items: logcheckresult fields
+        :type items: list
+        :return: None
+        """
+        fields = ['name', '_realm', '_overall_state_id', 'process_perf_data']
+        hosts = bulk_find('host', [item['host'] for item in items], fields)
+        services = bulk_find('service', [item['service'] for item in items if item['service']],
+                             fields)
+        realms_data = {}
+        for item in items:
+            host_info = hosts.get(item['host'])
+            if host_info is None or not host_info['process_perf_data']:
                 continue
             item_realm = host_info['_realm']
             item['_overall_state_id'] = host_info['_overall_state_id']
             host_name = Timeseries.sanitize_name(host_info['name'])
             service_name = ''
             if item['service'] is not None:
-                service_info = service_db.find_one({'_id': item['service']})
-                if not service_info['process_perf_data']:
+                service_info = services.get(item['service'])
+                if service_info is None or not service_info['process_perf_data']:
                     continue
                 service_name = Timeseries.sanitize_name(service_info['name'])
                 # todo: really? a service realm may be different from its host's realm ?
                 item_realm = service_info['_realm']
                 item['_overall_state_id'] = service_info['_overall_state_id']
             ts = Timeseries.prepare_data(item)
-            send_data = []
+            send_data = realms_data.setdefault(item_realm, [])
             for d in ts['data']:
                 send_data.append({
                     # todo: sure not to use item_realm?
@@ -124,7 +243,9 @@ class Timeseries(object):
                     "timestamp": item['last_check'],
                     "uom": d['uom']
                 })
-            Timeseries.send_to_timeseries_db(send_data, item_realm)
+        for item_realm, send_data in realms_data.items():
+            if send_data:
+                Timeseries.send_to_timeseries_db(send_data, item_realm)
 
     @staticmethod
     def prepare_data(item):
@@ -157,7 +278,7 @@ class Timeseries(object):
         for measurement in perfdata.metrics:
             fields = perfdata.metrics[measurement].__dict__
             # case we have .timestamp in the name
-            m = re.search(r'^(.*)\.[\d]{10}$', fields['name'])
+            m = TIMESTAMP_SUFFIX_PATTERN.search(fields['name'])
             if m:
                 fields['name'] = m.group(1)
 
@@ -215,15 +336,7 @@ class Timeseries(object):
         :return: realms name separed by .
         :rtype: str
         """
-        prefix_realm = ''
-        realm_db = current_app.data.driver.db['realm']
-        realm_info = realm_db.find_one({'_id': realm_id})
-        if realm_info.get('_tree_parents', []):
-            realms = realm_db.find({'_id': {"$in": realm_info['_tree_parents']}}).sort("_level")
-            for realm in realms:
-                prefix_realm += realm['name'] + "."
-        prefix_realm += realm_info['name']
-        return prefix_realm
+        return RealmTree.get_realm(realm_id)['prefix']
 
     @staticmethod
     def send_to_timeseries_db(data, item_realm):
@@ -250,36 +363,39 @@ class Timeseries(object):
         :type item_realm: str
         :return: None
         """
-        graphite_db = current_app.data.driver.db['graphite']
-        influxdb_db = current_app.data.driver.db['influxdb']
-        realm_db = current_app.data.driver.db['realm']
-
         searches = [{'_realm': item_realm}]
-        realm_info = realm_db.find_one({'_id': item_realm})
-        for realm in realm_info.get('_tree_parents', []):
+        for realm in RealmTree.get_tree_parents(item_realm):
             searches.append({'_realm': realm, '_sub_realm': True})
 
-        # get graphite servers to send to
-        for search in searches:
-            graphites = graphite_db.find(search)
-            for graphite in graphites:
-                if not Timeseries.send_to_timeseries_graphite(data, graphite):
-                    for perf in data:
-                        perf['graphite'] = graphite['_id']
-                    post_internal('timeseriesretention', data)
-                    for perf in data:
-                        del perf['graphite']
-
-        # get influxdb servers to send to
-        for search in searches:
-            influxdbs = influxdb_db.find(search)
-            for influxdb in influxdbs:
-                if not Timeseries.send_to_timeseries_influxdb(data, influxdb):
-                    for perf in data:
-                        perf['influxdb'] = influxdb['_id']
-                    post_internal('timeseriesretention', data)
-                    for perf in data:
-                        del perf['influxdb']
+        for resource in ['graphite', 'influxdb']:
+            for search in searches:
+                for target in current_app.data.driver.db[resource].find(search):
+                    Timeseries.send_to_timeseries_target(resource, data, target)
+
+    @staticmethod
+    def send_to_timeseries_target(resource, data, target):
+        """Send perfdata to a timeseries database.
+
+        If the TSDB is not available, store the perf_data in the internal retention store
+
+        :param resource: graphite | influxdb
+        :type resource: str
+        :param data: Information of data to send to carbon / influxdb
+        :type data: list
+        :param target: graphite or influxdb properties dictionary
+        :type target: dict
+        :return: None
+        """
+        if resource == 'graphite':
+            sent = Timeseries.send_to_timeseries_graphite(data, target)
+        else:
+            sent = Timeseries.send_to_timeseries_influxdb(data, target)
+        if not sent:
+            for perf in data:
+                perf[resource] = target['_id']
+            post_internal('timeseriesretention', data)
+            for perf in data:
+                del perf[resource]
 
     @staticmethod
     def send_to_timeseries_graphite(data, graphite):
@@ -311,17 +427,11 @@ class Timeseries(object):
                                                          (int(d['timestamp']), d['value'])))
             send_data.append(('.'.join([prefix, d['name']]),
                               (int(d['timestamp']), d['value'])))
-        carbon = CarbonIface(graphite['carbon_address'], graphite['carbon_port'])
-        try:
-            current_app.logger.debug("[tsdb] sending %d data to Graphite (%s:%s)...",
-                                     len(send_data),
-                                     graphite['carbon_address'], graphite['carbon_port'])
-            carbon.send_data(send_data)
-            return True
-        except Exception as exp:
-            current_app.logger.warning("Failed sending metrics to Graphite, exception: %s",
-                                       str(exp))
-            return False
+        current_app.logger.debug("[tsdb] sending %d data to Graphite (%s:%s)...",
+                                 len(send_data),
+                                 graphite['carbon_address'], graphite['carbon_port'])
+        return Timeseries.carbon.send(graphite['carbon_address'], graphite['carbon_port'],
+                                      send_data)
 
     @staticmethod
     def send_to_timeseries_influxdb(data, influxdb):
@@ -337,27 +447,18 @@ class Timeseries(object):
         if influxdb['statsd'] is not None:
             return Timeseries.send_to_statsd(data, influxdb['statsd'], '')
 
-        json_body = []
+        points = []
         for d in data:
-            json_body.append({
-                "measurement": str(d['name']),
-                "tags": {
-                    "host": d['host'],
-                    "service": d['service'],
-                    "realm": '.'.join(d['realm'])
-                },
-                "time": d['timestamp'] * 1000000000,
-                "fields": {
-                    "value": float(d['value'])
-                }
-            })
-        influxdbs = InfluxDBClient(influxdb['address'], influxdb['port'], influxdb['login'],
-                                   influxdb['password'], influxdb['database'], timeout=1)
-        try:
-            influxdbs.write_points(json_body)
-            return True
-        except:  # pylint: disable=W0702
-            return False
+            point = make_line(d['name'], [('host', d['host']), ('service', d['service']),
+                                          ('realm', d['realm'])],
+                              d['value'], d['timestamp'])
+            if point is None:
+                current_app.logger.debug("[tsdb] ignored not finite value: %s", d)
+                continue
+            points.append(point)
+        current_app.logger.debug("[tsdb] sending %d data to InfluxDB (%s)...",
+                                 len(points), influxdb['name'])
+        return Timeseries.influxdb.send(influxdb, points)
 
     @staticmethod
     def send_to_statsd(data, statsd_id, prefix):
@@ -393,3 +494,77 @@ class Timeseries(object):
             else:
                 statsd_instance.gauge('.'.join([prefix, d['name']]), float(d['value']))
         return True
+
+
+class TimeseriesExport(WriteBehind):
+    """
+        Metrics export write-behind queue
+
+        The log checks results fields used for the metrics are queued as tuples: host, service,
+        realm, last check, state id and perf data. A background thread builds the metrics of
+        the queued log checks results and sends them to the timeseries databases every
+        `flush_interval` milliseconds, or as soon as `flush_items` log checks results are queued
+        (see WriteBehind). When the queue is full, the new log checks results are dropped.
+
+        The metrics that cannot be sent are stored in the timeseries retention, to be sent again
+        by the timeseries cron. If the database is not available, the log checks results are
+        queued again to be exported later.
+    """
+    def __init__(self, app, maxsize=10000, flush_items=500, flush_interval=1000):
+        super(TimeseriesExport, self).__init__(app, 'timeseries', maxsize, flush_items,
+                                               flush_interval)
+
+    def flush(self, documents):
+        """Send the metrics of some queued log checks results
+
+        :param documents: queued log checks results fields
+        :type documents: list
+        :return: None
+        """
+        if not documents:
+            return
+        items = [{'host': host, 'service': service, '_realm': realm, 'last_check': last_check,
+                  'state_id': state_id, 'perf_data': perf_data}
+                 for host, service, realm, last_check, state_id, perf_data in documents]
+        with self.app.test_request_context():
+            try:
+                Timeseries.export(items)
+                self.flushed += len(documents)
+                self.flushes += 1
+            except PyMongoError as exp:
+                self.errors += 1
+                self.app.logger.error("Write-behind %s - export of %d log checks results "
+                                      "failed, queued again: %s",
+                                      self.resource, len(documents), str(exp))
+                self.requeue(documents)
+            except Exception as exp:  # pylint: disable=broad-except
+                self.errors += 1
+                self.app.logger.error("Write-behind %s - export of %d log checks results "
+                                      "failed: %s", self.resource, len(documents), str(exp))
+
+    def requeue(self, documents):
+        """Queue again some log checks results that could not be exported, and wait for
+        `flush_interval` before the next export
+
+        The log checks results are dropped if the queue is full or if it is stopping.
+
+        :param documents: queued log checks results fields
+        :type documents: list
+        :return: number of queued log checks results, the other ones were dropped
+        :rtype: int
+        """
+        count = 0
+        if not self.stopping.is_set():
+            for document in documents:
+                try:
+                    self.queue.put_nowait(document)
+                    count += 1
+                except Full:
+                    break
+        with self.lock:
+            self.dropped += len(documents) - count
+        if count < len(documents):
+            self.app.logger.warning("Write-behind %s - dropped %d log checks results",
+                                    self.resource, len(documents) - count)
+        self.stopping.wait(self.flush_interval)
+        return count
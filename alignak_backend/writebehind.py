@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.writebehind`` module
+
+    This module inserts documents in the database from a background thread
+"""
+from __future__ import print_function
+import atexit
+import os
+import threading
+import time
+try:
+    from Queue import Queue, Empty, Full
+except ImportError:
+    from queue import Queue, Empty, Full
+
+from alignak_backend.bulk import notify_inserted
+
+
+class WriteBehind(object):
+    """
+        Write-behind queue
+
+        The documents to insert are appended to a bounded queue. A background thread inserts
+        them with an insert_many request every `flush_interval` milliseconds, or as soon as
+        `flush_items` documents are queued. When the queue is full, the new documents are
+        dropped.
+
+        The documents must have been prepared for their insertion (see bulk.prepare_insert).
+        The after insertion hooks are run by the background thread.
+
+        The thread is started when the first documents are queued, so that it is started in
+        each backend process. The queue is drained when the process exits.
+    """
+    def __init__(self, app, resource, maxsize=10000, flush_items=500, flush_interval=1000):
+        self.app = app
+        self.resource = resource
+        self.flush_items = flush_items
+        self.flush_interval = flush_interval / 1000.0
+        self.queue = Queue(maxsize)
+        self.thread = None
+        self.pid = None
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.errors = 0
+
+    def start(self):
+        """Start the background thread if it is not yet running in this process
+
+        :return: None
+        """
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+                return
+            if self.pid != os.getpid():
+                atexit.register(self.stop)
+            self.pid = os.getpid()
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run,
+                                           name='write-behind-%s' % self.resource)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def put(self, documents):
+        """Queue some documents for their insertion
+
+        :param documents: documents to insert
+        :type documents: list
+        :return: number of queued documents, the other ones were dropped
+        :rtype: int
+        """
+        self.start()
+        count = 0
+        for document in documents:
+            try:
+                self.queue.put_nowait(document)
+                count += 1
+            except Full:
+                break
+        with self.lock:
+            self.queued += count
+            self.dropped += len(documents) - count
+        if count < len(documents):
+            self.app.logger.warning("Write-behind %s - queue is full, dropped %d documents",
+                                    self.resource, len(documents) - count)
+        return count
+
+    def get_batch(self):
+        """Get the next documents to insert
+
+        Wait until `flush_items` documents are queued or `flush_interval` is elapsed
+
+        :return: documents to insert
+        :rtype: list
+        """
+        documents = []
+        deadline = time.time() + self.flush_interval
+        while len(documents) < self.flush_items:
+            timeout = deadline - time.time()
+            if timeout <= 0 or self.stopping.is_set():
+                break
+            try:
+                documents.append(self.queue.get(timeout=timeout))
+            except Empty:
+                break
+        # Do not wait anymore for the already queued documents
+        while len(documents) < self.flush_items:
+            try:
+                documents.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return documents
+
+    def flush(self, documents):
+        """Insert some documents and run the after insertion hooks
+
+        :param documents: documents to insert
+        :type documents: list
+        :return: None
+        """
+        if not documents:
+            return
+        with self.app.app_context():
+            try:
+                self.app.data.driver.db[self.resource].insert_many(documents, ordered=False)
+                notify_inserted(self.resource, documents)
+                self.flushed += len(documents)
+                self.flushes += 1
+            except Exception as exp:  # pylint: disable=broad-except
+                self.errors += 1
+                self.app.logger.error("Write-behind %s - insertion of %d documents failed: %s",
+                                      self.resource, len(documents), str(exp))
+
+    def run(self):
+        """Background thread main loop
+
+        :return: None
+        """
+        while not self.stopping.is_set():
+            self.flush(self.get_batch())
+        # Drain the queue
+        documents = self.get_batch()
+        while documents:
+            self.flush(documents)
+            documents = self.get_batch()
+
+    def stop(self, timeout=10):
+        """Stop the background thread after it inserted all the queued documents
+
+        :param timeout: maximum time to wait for the thread (seconds)
+        :type timeout: int
+        :return: None
+        """
+        self.stopping.set()
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            self.thread.join(timeout)
+        else:
+            # No running thread in this process, drain the queue here
+            documents = self.get_batch()
+            while documents:
+                self.flush(documents)
+                documents = self.get_batch()
+
+    def stats(self):
+        """Get the queue counters
+
+        :return: queue depth and queued, dropped, flushed documents counters
+        :rtype: dict
+        """
+        return {
+            'depth': self.queue.qsize(),
+            'maxsize': self.queue.maxsize,
+            'queued': self.queued,
+            'dropped': self.dropped,
+            'flushed': self.flushed,
+            'flushes': self.flushes,
+            'errors': self.errors
+        }
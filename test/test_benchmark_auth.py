@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test measures the users authentication with a lot of users
+"""
+
+from __future__ import print_function
+import os
+import copy
+import time
+import shlex
+import subprocess
+import uuid
+import requests
+import unittest2
+from pymongo import MongoClient
+
+
+class TestBenchmarkAuth(unittest2.TestCase):
+    """This class measures the users authentication"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This method:
+          * deletes mongodb database
+          * starts the backend with uwsgi
+          * creates 10000 users in the database
+
+        :return: None
+        """
+        # Set test mode for Alignak backend
+        os.environ['ALIGNAK_BACKEND_TEST'] = '1'
+        os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'] = 'alignak-backend-test'
+        os.environ['ALIGNAK_BACKEND_CONFIGURATION_FILE'] = './cfg/settings/settings.json'
+
+        # Delete used mongo DBs
+        exit_code = subprocess.call(
+            shlex.split(
+                'mongo %s --eval "db.dropDatabase()"' % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'])
+        )
+        assert exit_code == 0
+
+        cls.p = subprocess.Popen(['uwsgi', '--plugin', 'python', '-w', 'alignak_backend.app:app',
+                                  '--socket', '0.0.0.0:5000',
+                                  '--protocol=http', '--enable-threads', '--pidfile',
+                                  '/tmp/uwsgi.pid'])
+        time.sleep(3)
+
+        cls.endpoint = 'http://127.0.0.1:5000'
+        cls.mongo = MongoClient('localhost', 27017)
+        cls.db = cls.mongo[os.environ['ALIGNAK_BACKEND_MONGO_DBNAME']]
+
+        # Create the users from the admin user
+        admin = cls.db['user'].find_one({'name': 'admin'})
+        users = []
+        for index in range(10000):
+            user = copy.deepcopy(admin)
+            del user['_id']
+            user['name'] = 'user%05d' % index
+            user['token'] = '%d-%s' % (index, uuid.uuid4())
+            users.append(user)
+        cls.db['user'].insert_many(users)
+        cls.tokens = [user['token'] for user in users]
+
+    @classmethod
+    def tearDownClass(cls):
+        """Kill uwsgi
+
+        :return: None
+        """
+        subprocess.call(['uwsgi', '--stop', '/tmp/uwsgi.pid'])
+        time.sleep(2)
+
+    def get_latency(self, tokens):
+        """Get the mean latency of a request for each token
+
+        Each token is used once, so that the user rights are not yet cached
+
+        :param tokens: users tokens
+        :type tokens: list
+        :return: mean latency (milliseconds)
+        :rtype: float
+        """
+        start = time.time()
+        for token in tokens:
+            response = requests.get(self.endpoint + '/realm',
+                                    auth=requests.auth.HTTPBasicAuth(token, ''))
+            self.assertEqual(response.status_code, 200)
+        return (time.time() - start) * 1000 / len(tokens)
+
+    def test_token_index(self):
+        """Users are found from their token with the token index
+
+        :return: None
+        """
+        plan = self.db['user'].find({'token': self.tokens[-1]}).explain()
+        self.assertIn('IXSCAN', str(plan['queryPlanner']['winningPlan']))
+
+        with_index = self.get_latency(self.tokens[-200:])
+
+        self.db['user'].drop_index('index_token')
+        plan = self.db['user'].find({'token': self.tokens[-1]}).explain()
+        self.assertIn('COLLSCAN', str(plan['queryPlanner']['winningPlan']))
+
+        without_index = self.get_latency(self.tokens[-400:-200])
+
+        print("Request latency with 10000 users: %.2f ms, without the token index: %.2f ms"
+              % (with_index, without_index))
+
+    def test_empty_token(self):
+        """An empty token is refused
+
+        :return: None
+        """
+        response = requests.get(self.endpoint + '/realm',
+                                auth=requests.auth.HTTPBasicAuth('', ''))
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test measures the database requests made when posting a batch of history events
+"""
+
+from __future__ import print_function
+import os
+import json
+import time
+import shlex
+import subprocess
+import requests
+import unittest2
+from pymongo import MongoClient
+
+
+class TestBenchmarkHistory(unittest2.TestCase):
+    """This class measures the history events posting"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This method:
+          * deletes mongodb database
+          * starts the backend with uwsgi
+          * logs in the backend and get the token
+          * gets the default realm and creates some hosts and services
+
+        :return: None
+        """
+        # Set test mode for Alignak backend
+        os.environ['ALIGNAK_BACKEND_TEST'] = '1'
+        os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'] = 'alignak-backend-test'
+        os.environ['ALIGNAK_BACKEND_CONFIGURATION_FILE'] = './cfg/settings/settings.json'
+
+        # Delete used mongo DBs
+        exit_code = subprocess.call(
+            shlex.split(
+                'mongo %s --eval "db.dropDatabase()"' % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'])
+        )
+        assert exit_code == 0
+
+        cls.p = subprocess.Popen(['uwsgi', '--plugin', 'python', '-w', 'alignak_backend.app:app',
+                                  '--socket', '0.0.0.0:5000',
+                                  '--protocol=http', '--enable-threads', '--pidfile',
+                                  '/tmp/uwsgi.pid'])
+        time.sleep(3)
+
+        cls.endpoint = 'http://127.0.0.1:5000'
+        cls.mongo = MongoClient('localhost', 27017)
+
+        headers = {'Content-Type': 'application/json'}
+        params = {'username': 'admin', 'password': 'admin', 'action': 'generate'}
+        # get token
+        response = requests.post(cls.endpoint + '/login', json=params, headers=headers)
+        resp = response.json()
+        cls.token = resp['token']
+        cls.auth = requests.auth.HTTPBasicAuth(cls.token, '')
+
+        # Get default realm
+        response = requests.get(cls.endpoint + '/realm', auth=cls.auth)
+        resp = response.json()
+        cls.realm_all = resp['_items'][0]['_id']
+
+        # Add command
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = cls.realm_all
+        requests.post(cls.endpoint + '/command', json=data, headers=headers, auth=cls.auth)
+        response = requests.get(cls.endpoint + '/command?where={"name":"ping"}', auth=cls.auth)
+        resp = response.json()
+        rc = resp['_items']
+
+        # Add 10 hosts with a service
+        for index in range(10):
+            data = json.loads(open('cfg/host_srv001.json').read())
+            data['name'] = 'srv%03d' % index
+            data['check_command'] = rc[0]['_id']
+            if 'realm' in data:
+                del data['realm']
+            data['_realm'] = cls.realm_all
+            response = requests.post(cls.endpoint + '/host', json=data, headers=headers,
+                                     auth=cls.auth)
+            resp = response.json()
+
+            data = json.loads(open('cfg/service_srv001_ping.json').read())
+            data['host'] = resp['_id']
+            data['check_command'] = rc[0]['_id']
+            data['_realm'] = cls.realm_all
+            requests.post(cls.endpoint + '/service', json=data, headers=headers, auth=cls.auth)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Kill uwsgi
+
+        :return: None
+        """
+        subprocess.call(['uwsgi', '--stop', '/tmp/uwsgi.pid'])
+        time.sleep(2)
+
+    def get_queries_count(self):
+        """Get the number of queries served by the database server
+
+        :return: queries count
+        :rtype: int
+        """
+        status = self.mongo['admin'].command('serverStatus')
+        return status['opcounters']['query']
+
+    def test_history_batch(self):
+        """Post 1000 history events with one request
+
+        The hosts, services and users are resolved with one request per resource for the
+        whole batch, instead of several requests for each event.
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        data = []
+        for index in range(1000):
+            data.append({
+                'host_name': 'srv%03d' % (index % 10),
+                'service_name': 'ping',
+                'user_name': 'admin',
+                'type': 'monitoring.alert',
+                'message': "Test event #%d" % index
+            })
+
+        queries = self.get_queries_count()
+        start = time.time()
+        response = requests.post(self.endpoint + '/history',
+                                 json=data, headers=headers, auth=self.auth)
+        duration = time.time() - start
+        queries = self.get_queries_count() - queries
+        resp = response.json()
+        self.assertEqual('OK', resp['_status'], resp)
+        print("Posted 1000 history events in %.3f seconds with %d database queries"
+              % (duration, queries))
+
+        # Formerly, at least 4 queries for each event
+        self.assertLess(queries, 50)
+
+        response = requests.get(self.endpoint + '/history', auth=self.auth,
+                                params={'where': json.dumps({'host_name': 'srv005',
+                                                             'service_name': 'ping'})})
+        resp = response.json()
+        self.assertEqual(resp['_meta']['total'], 100)
+        self.assertIsNotNone(resp['_items'][0]['service'])
+        self.assertIsNotNone(resp['_items'][0]['user'])
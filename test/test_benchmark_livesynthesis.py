@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test measures the live synthesis recalculation with a lot of realms, hosts and services,
+and the concatenated live synthesis and history of a deep realms tree
+"""
+
+from __future__ import print_function
+import os
+import time
+import shlex
+import random
+import subprocess
+from datetime import datetime
+import unittest2
+from pymongo import MongoClient
+from alignak_backend.livesynthesis import Livesynthesis
+from alignak_backend.realmtree import RealmTree
+
+
+class TestBenchmarkLivesynthesis(unittest2.TestCase):
+    """This class measures the live synthesis recalculation"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This method:
+          * deletes mongodb database
+
+        :return: None
+        """
+        # Set test mode for Alignak backend
+        os.environ['ALIGNAK_BACKEND_TEST'] = '1'
+        os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'] = 'alignak-backend-test'
+        os.environ['ALIGNAK_BACKEND_CONFIGURATION_FILE'] = './cfg/settings/settings.json'
+
+        # Delete used mongo DBs
+        exit_code = subprocess.call(
+            shlex.split(
+                'mongo %s --eval "db.dropDatabase()"' % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'])
+        )
+        assert exit_code == 0
+
+        cls.mongo = MongoClient('localhost', 27017)
+        cls.db = cls.mongo[os.environ['ALIGNAK_BACKEND_MONGO_DBNAME']]
+
+    def populate(self, realms_count, hosts_count, services_count):
+        """Create realms with hosts and services in random live states
+
+        The elements are directly created in the database, so that the live synthesis is not
+        updated by the backend hooks.
+
+        :param realms_count: number of realms
+        :type realms_count: int
+        :param hosts_count: number of hosts of each realm
+        :type hosts_count: int
+        :param services_count: number of services of each host
+        :type services_count: int
+        :return: None
+        """
+        # Delete the formerly created elements
+        realms = [realm['_id'] for realm in self.db['realm'].find({'name': {'$regex': '^realm'}})]
+        for resource in ['host', 'service', 'livesynthesis']:
+            self.db[resource].delete_many({'_realm': {'$in': realms}})
+        self.db['realm'].delete_many({'_id': {'$in': realms}})
+
+        checks = [(True, True), (True, False), (False, True), (False, False)]
+        for index in range(realms_count):
+            realm = self.db['realm'].insert_one({'name': 'realm%03d' % index}).inserted_id
+            hosts = []
+            services = []
+            for host_index in range(hosts_count):
+                active, passive = random.choice(checks)
+                hosts.append({
+                    'name': 'host%05d' % host_index, '_realm': realm,
+                    '_is_template': random.random() < 0.05,
+                    'active_checks_enabled': active, 'passive_checks_enabled': passive,
+                    'ls_state': random.choice(['UP', 'DOWN', 'UNREACHABLE']),
+                    'ls_state_type': random.choice(['HARD', 'SOFT']),
+                    'ls_acknowledged': random.random() < 0.1,
+                    'ls_downtimed': random.random() < 0.1
+                })
+                for service_index in range(services_count):
+                    active, passive = random.choice(checks)
+                    services.append({
+                        'name': 'service%03d' % service_index, '_realm': realm,
+                        '_is_template': random.random() < 0.05,
+                        'active_checks_enabled': active, 'passive_checks_enabled': passive,
+                        'ls_state': random.choice(['OK', 'WARNING', 'CRITICAL', 'UNKNOWN',
+                                                   'UNREACHABLE']),
+                        'ls_state_type': random.choice(['HARD', 'SOFT']),
+                        'ls_acknowledged': random.random() < 0.1,
+                        'ls_downtimed': random.random() < 0.1
+                    })
+            self.db['host'].insert_many(hosts)
+            if services:
+                self.db['service'].insert_many(services)
+
+    def count(self, type_check, realm):
+        """Compute the live synthesis counters of a realm with a request for each counter
+
+        This is the former live synthesis recalculation, used as a reference
+
+        :param type_check: hosts | services
+        :type type_check: str
+        :param realm: realm identifier
+        :type realm: ObjectId
+        :return: live synthesis counters
+        :rtype: dict
+        """
+        collection = self.db['host' if type_check == 'hosts' else 'service']
+        monitored = [{'active_checks_enabled': True}, {'passive_checks_enabled': True}]
+        data = {
+            '%s_total' % type_check: collection.count({'_is_template': False, '_realm': realm}),
+            '%s_not_monitored' % type_check: collection.count({
+                '_is_template': False, '_realm': realm,
+                'active_checks_enabled': False, 'passive_checks_enabled': False
+            })
+        }
+        for state_type in ['hard', 'soft']:
+            for state in Livesynthesis.states[type_check]:
+                data['%s_%s_%s' % (type_check, state, state_type)] = collection.count({
+                    '_is_template': False, '_realm': realm, '$or': monitored,
+                    'ls_state': state.upper(), 'ls_state_type': state_type.upper(),
+                    'ls_acknowledged': False
+                })
+        data['%s_acknowledged' % type_check] = collection.count({
+            '_is_template': False, '_realm': realm, '$or': monitored, 'ls_acknowledged': True
+        })
+        data['%s_in_downtime' % type_check] = collection.count({
+            '_is_template': False, '_realm': realm, '$or': monitored, 'ls_downtimed': True
+        })
+        return data
+
+    def test_recalculate(self):
+        """Compare the aggregation requests with a request for each counter
+
+        :return: None
+        """
+        from alignak_backend.app import app
+
+        for realms_count, hosts_count, services_count in [(1, 100, 10), (10, 100, 10),
+                                                          (40, 200, 10)]:
+            self.populate(realms_count, hosts_count, services_count)
+            realms = [realm['_id'] for realm in self.db['realm'].find()]
+
+            start = time.time()
+            expected = {}
+            for realm in realms:
+                expected[realm] = self.count('hosts', realm)
+                expected[realm].update(self.count('services', realm))
+            former = time.time() - start
+
+            with app.test_request_context():
+                start = time.time()
+                hosts = Livesynthesis.aggregate('hosts')
+                services = Livesynthesis.aggregate('services')
+                duration = time.time() - start
+
+                for realm in realms:
+                    data = hosts.get(realm, Livesynthesis.get_new_counters('hosts'))
+                    data.update(services.get(realm, Livesynthesis.get_new_counters('services')))
+                    self.assertEqual(data, expected[realm])
+
+                Livesynthesis.recalculate()
+
+            for realm in realms:
+                live = self.db['livesynthesis'].find_one({'_realm': realm})
+                for counter, value in expected[realm].items():
+                    self.assertEqual(live[counter], value)
+
+            print("%d realms, %d hosts, %d services: counters computed in %.3f seconds, "
+                  "formerly in %.3f seconds"
+                  % (realms_count, realms_count * hosts_count,
+                     realms_count * hosts_count * services_count, duration, former))
+
+    def populate_tree(self, depth, leaves):
+        """Create a deep realms tree: each realm has a child realm and some leaf realms, with
+        random live synthesis counters
+
+        The realms and the live synthesis are directly created in the database.
+
+        :param depth: number of levels of the tree
+        :type depth: int
+        :param leaves: number of leaf realms of each level
+        :type leaves: int
+        :return: the top level realm identifier
+        :rtype: ObjectId
+        """
+        realms = []
+        parents = []
+        for level in range(depth):
+            realm = {'name': 'deep%03d' % level, '_level': level, '_children': [],
+                     '_all_children': [], '_tree_parents': list(parents),
+                     '_parent': parents[-1] if parents else None}
+            realm['_id'] = self.db['realm'].insert_one(realm).inserted_id
+            realms.append(realm)
+            for index in range(leaves):
+                leaf = {'name': 'deep%03d-%03d' % (level, index), '_level': level + 1,
+                        '_children': [], '_all_children': [],
+                        '_tree_parents': parents + [realm['_id']], '_parent': realm['_id']}
+                leaf['_id'] = self.db['realm'].insert_one(leaf).inserted_id
+                realms.append(leaf)
+            parents.append(realm['_id'])
+
+        for realm in realms:
+            for parent in realm['_tree_parents']:
+                if parent == realm['_parent']:
+                    self.db['realm'].update_one({'_id': parent},
+                                                {'$push': {'_children': realm['_id']}})
+                self.db['realm'].update_one({'_id': parent},
+                                            {'$push': {'_all_children': realm['_id']}})
+
+            live = Livesynthesis.get_new_livesynthesis()
+            for counter in live:
+                live[counter] = random.randint(0, 100)
+            live['_realm'] = realm['_id']
+            self.db['livesynthesis'].insert_one(live)
+        return realms[0]['_id']
+
+    def test_concatenate(self):
+        """Compare the concatenated live synthesis got from the subtree counters with the sum
+        of the live synthesis of all the children realms
+
+        :return: None
+        """
+        from alignak_backend.app import app
+
+        reads = 100
+        for depth, leaves in [(5, 2), (20, 5), (50, 10)]:
+            # Delete the formerly created realms
+            realms = [realm['_id']
+                      for realm in self.db['realm'].find({'name': {'$regex': '^deep'}})]
+            self.db['livesynthesis'].delete_many({'_realm': {'$in': realms}})
+            self.db['realm'].delete_many({'_id': {'$in': realms}})
+
+            top = self.populate_tree(depth, leaves)
+            all_children = self.db['realm'].find_one({'_id': top})['_all_children']
+
+            # Former concatenation: the live synthesis of all the children are summed
+            start = time.time()
+            for _ in range(reads):
+                expected = self.db['livesynthesis'].find_one({'_realm': top})
+                for lives in self.db['livesynthesis'].find({'_realm': {'$in': all_children}}):
+                    for prop in [x for x in lives if not x.startswith('_')]:
+                        expected[prop] += lives[prop]
+            former = time.time() - start
+
+            with app.test_request_context():
+                RealmTree.invalidate()
+                Livesynthesis.rollup()
+
+                start = time.time()
+                for _ in range(reads):
+                    counters = Livesynthesis.concatenate(top, all_children)
+                duration = time.time() - start
+                for counter, value in counters.items():
+                    self.assertEqual(value, expected[counter], counter)
+
+                # Only a part of the tree
+                middle = all_children[len(all_children) // 2]
+                realms = [middle, all_children[-1]]
+                counters = Livesynthesis.concatenate(top, realms)
+                for counter, value in counters.items():
+                    total = sum([lives[counter] for lives in self.db['livesynthesis'].find(
+                        {'_realm': {'$in': realms + [top]}})])
+                    self.assertEqual(value, total, counter)
+
+                # The subtree counters of all the parents are incremented
+                deepest = all_children[-1]
+                Livesynthesis.update_counters(deepest, {'hosts_total': 2, 'services_ok_hard': -1})
+                counters = Livesynthesis.concatenate(top, all_children)
+                self.assertEqual(counters['hosts_total'], expected['hosts_total'] + 2)
+                self.assertEqual(counters['services_ok_hard'], expected['services_ok_hard'] - 1)
+
+            print("%d realms: concatenated live synthesis got %d times in %.3f seconds, "
+                  "formerly in %.3f seconds" % (len(all_children) + 1, reads, duration, former))
+
+    def test_history_concatenate(self):
+        """Measure the concatenated history of a deep realms tree
+
+        Some realms miss the most recent samples, so that the histories are not aligned
+
+        :return: None
+        """
+        from alignak_backend.app import app
+
+        # Delete the formerly created realms
+        realms = [realm['_id'] for realm in self.db['realm'].find({'name': {'$regex': '^deep'}})]
+        self.db['livesynthesis'].delete_many({'_realm': {'$in': realms}})
+        self.db['realm'].delete_many({'_id': {'$in': realms}})
+
+        top = self.populate_tree(20, 5)
+        all_children = self.db['realm'].find_one({'_id': top})['_all_children']
+        lives = list(self.db['livesynthesis'].find({'_realm': {'$in': [top] + all_children}}))
+        counters = list(Livesynthesis.get_new_livesynthesis())
+
+        # 2 hours of history, a sample each minute
+        now = int(time.time()) // 60 * 60
+        expected = {}
+        self.db['livesynthesisretention'].delete_many({})
+        for index, live in enumerate(lives):
+            buckets = {}
+            missing = index % 4
+            for minute in reversed(range(missing, 120)):
+                date = datetime.utcfromtimestamp(now - 60 * minute)
+                bucket = buckets.setdefault(
+                    (now - 60 * minute) // 3600,
+                    dict([('dates', [])] + [(counter, []) for counter in counters]))
+                bucket['dates'].append(date)
+                sample = expected.setdefault(date, dict((counter, 0) for counter in counters))
+                for counter in counters:
+                    value = random.randint(0, 100)
+                    bucket[counter].append(value)
+                    sample[counter] += value
+            for hour, bucket in buckets.items():
+                bucket['livesynthesis'] = live['_id']
+                bucket['bucket'] = datetime.utcfromtimestamp(hour * 3600)
+                self.db['livesynthesisretention'].insert_one(bucket)
+
+        with app.test_request_context():
+            start = time.time()
+            history = Livesynthesis.get_history([live['_id'] for live in lives])
+            duration = time.time() - start
+
+            self.assertEqual(len(history), 120)
+            for sample in history:
+                date = sample.pop('_created').replace(tzinfo=None)
+                self.assertEqual(sample, expected[date])
+
+            # The most recent sample of each 10 minutes period
+            history = Livesynthesis.get_history([live['_id'] for live in lives],
+                                                history_from=now - 3600, history_step=600)
+            self.assertEqual(len(history), 7)
+
+        print("%d realms: history concatenated in %.3f seconds" % (len(lives), duration))
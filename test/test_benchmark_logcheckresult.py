@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test measures the data read from the database when posting log checks results
+"""
+
+from __future__ import print_function
+import os
+import json
+import time
+import shlex
+import subprocess
+from calendar import timegm
+from datetime import datetime
+import requests
+import unittest2
+from bson import BSON
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+# Fields read when a log check result is posted, see alignak_backend.app.LCR_LIVESTATE_FIELDS
+LCR_LIVESTATE_FIELDS = ['name', 'host', '_realm', 'ls_state', 'ls_state_type', 'ls_acknowledged',
+                        'ls_downtimed', 'ls_last_check']
+
+
+class TestBenchmarkLogcheckresult(unittest2.TestCase):
+    """This class measures the log checks results posting"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This method:
+          * deletes mongodb database
+          * starts the backend with uwsgi
+          * logs in the backend and get the token
+          * gets the default realm and creates an host and a service
+
+        :return: None
+        """
+        # Set test mode for Alignak backend
+        os.environ['ALIGNAK_BACKEND_TEST'] = '1'
+        os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'] = 'alignak-backend-test'
+        os.environ['ALIGNAK_BACKEND_CONFIGURATION_FILE'] = './cfg/settings/settings.json'
+
+        # Delete used mongo DBs
+        exit_code = subprocess.call(
+            shlex.split(
+                'mongo %s --eval "db.dropDatabase()"' % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'])
+        )
+        assert exit_code == 0
+
+        cls.p = subprocess.Popen(['uwsgi', '--plugin', 'python', '-w', 'alignak_backend.app:app',
+                                  '--socket', '0.0.0.0:5000',
+                                  '--protocol=http', '--enable-threads', '--pidfile',
+                                  '/tmp/uwsgi.pid'])
+        time.sleep(3)
+
+        cls.endpoint = 'http://127.0.0.1:5000'
+        cls.mongo = MongoClient('localhost', 27017)
+        cls.db = cls.mongo[os.environ['ALIGNAK_BACKEND_MONGO_DBNAME']]
+
+        headers = {'Content-Type': 'application/json'}
+        params = {'username': 'admin', 'password': 'admin', 'action': 'generate'}
+        # get token
+        response = requests.post(cls.endpoint + '/login', json=params, headers=headers)
+        resp = response.json()
+        cls.token = resp['token']
+        cls.auth = requests.auth.HTTPBasicAuth(cls.token, '')
+
+        # Get default realm
+        response = requests.get(cls.endpoint + '/realm', auth=cls.auth)
+        resp = response.json()
+        cls.realm_all = resp['_items'][0]['_id']
+
+        # Add command
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = cls.realm_all
+        requests.post(cls.endpoint + '/command', json=data, headers=headers, auth=cls.auth)
+        response = requests.get(cls.endpoint + '/command?where={"name":"ping"}', auth=cls.auth)
+        resp = response.json()
+        rc = resp['_items']
+
+        # Add an host with some custom variables and a service
+        data = json.loads(open('cfg/host_srv001.json').read())
+        data['check_command'] = rc[0]['_id']
+        if 'realm' in data:
+            del data['realm']
+        data['_realm'] = cls.realm_all
+        data['customs'] = dict(('_VAR%d' % index, 'value %d' % index) for index in range(50))
+        response = requests.post(cls.endpoint + '/host', json=data, headers=headers, auth=cls.auth)
+        resp = response.json()
+        cls.host = resp['_id']
+
+        data = json.loads(open('cfg/service_srv001_ping.json').read())
+        data['host'] = cls.host
+        data['check_command'] = rc[0]['_id']
+        data['_realm'] = cls.realm_all
+        response = requests.post(cls.endpoint + '/service', json=data, headers=headers,
+                                 auth=cls.auth)
+        resp = response.json()
+        cls.service = resp['_id']
+
+    @classmethod
+    def tearDownClass(cls):
+        """Kill uwsgi
+
+        :return: None
+        """
+        subprocess.call(['uwsgi', '--stop', '/tmp/uwsgi.pid'])
+        time.sleep(2)
+
+    def get_bytes_out(self):
+        """Get the number of bytes sent by the database server
+
+        :return: bytes count
+        :rtype: int
+        """
+        status = self.mongo['admin'].command('serverStatus')
+        return status['network']['bytesOut']
+
+    def test_projected_reads(self):
+        """Measure the data read from the database for each posted log check result
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        # Size of the documents formerly read for each check result, and of the projected ones
+        for resource, _id in [('host', self.host), ('service', self.service)]:
+            full = len(BSON.encode(self.db[resource].find_one({'_id': ObjectId(_id)})))
+            projected = len(BSON.encode(self.db[resource].find_one(
+                {'_id': ObjectId(_id)}, projection=LCR_LIVESTATE_FIELDS)))
+            print("%s document: %d bytes, projected: %d bytes" % (resource, full, projected))
+            self.assertLess(projected * 4, full)
+
+        count = 100
+        now = timegm(datetime.utcnow().timetuple())
+        bytes_out = self.get_bytes_out()
+        start = time.time()
+        for index in range(count):
+            data = {
+                "last_check": now + index,
+                "host": self.host,
+                "service": self.service,
+                'acknowledged': False,
+                'state_id': 0,
+                'state': 'OK',
+                'state_type': 'HARD',
+                'last_state_id': 0,
+                'last_state': 'OK',
+                'last_state_type': 'HARD',
+                'state_changed': False,
+                'output': 'Check output %d' % index,
+                'perf_data': 'rta=0.049000ms;2.000000;3.000000;0.000000 pl=0%;50;80;0'
+            }
+            response = requests.post(
+                self.endpoint + '/logcheckresult', json=data, headers=headers, auth=self.auth
+            )
+            resp = response.json()
+            self.assertEqual(resp['_status'], 'OK')
+        duration = time.time() - start
+        bytes_out = self.get_bytes_out() - bytes_out
+        print("Posted %d log checks results in %.3f seconds, %d bytes read from the database "
+              "for each one" % (count, duration, bytes_out // count))
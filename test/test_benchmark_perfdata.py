@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test measures the perfdata parsing with a corpus of monitoring plugins outputs
+"""
+
+from __future__ import print_function
+import time
+import unittest2
+from alignak_backend.cache import Cache
+from alignak_backend.perfdata import PerfDatas, Metric, PERFDATA_SPLIT_PATTERN
+
+
+class RegexMetric(Metric):
+    """Metric parsed with the regular expression only"""
+    # pylint: disable=too-few-public-methods
+
+    def parse(self, string):
+        return False
+
+
+class RegexPerfDatas(PerfDatas):
+    """Perfdata parsed with the regular expression only"""
+    # pylint: disable=too-few-public-methods, super-init-not-called
+
+    def __init__(self, string):
+        self.metrics = {}
+        for elem in PERFDATA_SPLIT_PATTERN.findall(string or ''):
+            metric = RegexMetric(elem)
+            if metric.name is not None:
+                self.metrics[metric.name] = metric
+
+
+class TestBenchmarkPerfdata(unittest2.TestCase):
+    """This class measures the perfdata parsing"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Load the perfdata corpus
+
+        :return: None
+        """
+        with open('cfg/perfdata_corpus.txt') as corpus:
+            cls.corpus = [line.strip() for line in corpus if line.strip()]
+
+    def setUp(self):
+        """Empty the perfdata labels cache
+
+        :return: None
+        """
+        Metric.configure(10000)
+
+    def test_same_metrics(self):
+        """The tokenizer and the regular expression get the same metrics
+
+        :return: None
+        """
+        for perfdata in self.corpus:
+            # Twice to get the cached labels
+            for _ in range(2):
+                metrics = dict((name, metric.__dict__)
+                               for name, metric in PerfDatas(perfdata).metrics.items())
+                reference = dict((name, metric.__dict__)
+                                 for name, metric in RegexPerfDatas(perfdata).metrics.items())
+                self.assertEqual(metrics, reference, perfdata)
+
+        metric = Metric("'C:\\ Used Space %'=38%;80;90;0;100")
+        self.assertEqual(metric.__dict__, {
+            'name': 'C:\\ Used Space %', 'value': 38, 'uom': '%',
+            'warning': 80, 'critical': 90, 'min': 0, 'max': 100
+        })
+        metric = Metric("time=0.072131s;;;0.000000")
+        self.assertEqual(metric.__dict__, {
+            'name': 'time', 'value': 0.072131, 'uom': 's',
+            'warning': None, 'critical': None, 'min': 0, 'max': None
+        })
+
+    def test_cache(self):
+        """The labels thresholds are parsed again when they change
+
+        :return: None
+        """
+        self.assertEqual(Metric('load1=0.15;15;30;0').warning, 15)
+        self.assertEqual(Metric('load1=0.25;15;30;0').value, 0.25)
+        self.assertEqual(Metric('load1=0.25;10;30;0').warning, 10)
+        self.assertEqual(Metric.cache.stats(), {'size': 1, 'maxsize': 10000,
+                                                'hits': 2, 'misses': 1})
+
+        # Cache disabled
+        Metric.cache = Cache(maxsize=0)
+        self.assertEqual(Metric('load1=0.15;15;30;0').warning, 15)
+        self.assertEqual(len(Metric.cache), 0)
+
+    def test_benchmark(self):
+        """Parse the corpus with the tokenizer and with the regular expression
+
+        :return: None
+        """
+        count = 2000
+        results = {}
+        for name, parser in [('tokenizer', PerfDatas), ('regex', RegexPerfDatas)]:
+            start = time.time()
+            for _ in range(count):
+                for perfdata in self.corpus:
+                    parser(perfdata)
+            results[name] = time.time() - start
+        print("%d perfdata parsed in %.3f seconds with the tokenizer and the labels cache, "
+              "%.3f seconds with the regular expression"
+              % (count * len(self.corpus), results['tokenizer'], results['regex']))
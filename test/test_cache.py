@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test checks the internal cache
+"""
+
+from __future__ import print_function
+import time
+import unittest2
+from alignak_backend.cache import Cache
+
+
+class TestCache(unittest2.TestCase):
+    """This class tests the internal cache"""
+
+    def test_lru(self):
+        """Least recently used entries are evicted
+
+        :return: None
+        """
+        cache = Cache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # 'a' is now the most recently used
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a'))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats(), {'size': 0, 'maxsize': 2, 'hits': 3, 'misses': 1})
+
+    def test_ttl(self):
+        """Expired entries are missing
+
+        :return: None
+        """
+        cache = Cache(maxsize=10, ttl=1)
+        cache.set('a', 1)
+        self.assertTrue('a' in cache)
+        time.sleep(1.1)
+        self.assertFalse('a' in cache)
+        self.assertIsNone(cache.get('a'))
+
+    def test_disabled(self):
+        """A cache without size stores nothing
+
+        :return: None
+        """
+        cache = Cache(maxsize=0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test checks the carbon connections pool with a stub carbon daemon
+"""
+
+from __future__ import print_function
+import pickle
+import socket
+import struct
+import threading
+import time
+import unittest2
+from alignak_backend.carbonpool import CarbonPool
+
+
+class StubCarbon(object):
+    """Carbon daemon stub: receives the pickle protocol batches"""
+
+    def __init__(self, port=0):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', port))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        self.batches = []
+        self.connections = 0
+        self.clients = []
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @staticmethod
+    def receive(client, size):
+        """Receive size bytes, None if the connection is closed"""
+        data = b''
+        while len(data) < size:
+            chunk = client.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def handle(self, client):
+        """Decode the batches of a connection"""
+        while True:
+            header = self.receive(client, 4)
+            if header is None:
+                break
+            payload = self.receive(client, struct.unpack("!L", header)[0])
+            if payload is None:
+                break
+            self.batches.append(pickle.loads(payload))
+        client.close()
+
+    def run(self):
+        """Accept the connections"""
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            self.clients.append(client)
+            thread = threading.Thread(target=self.handle, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def metrics(self):
+        """All the received metrics"""
+        return [metric for batch in self.batches for metric in batch]
+
+    def stop(self):
+        """Close the server and the connections"""
+        for client in self.clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.server.close()
+
+
+class TestCarbonPool(unittest2.TestCase):
+    """This class tests the carbon connections pool"""
+
+    def wait_for(self, carbon, count, timeout=5):
+        """Wait until the stub received count metrics"""
+        end = time.time() + timeout
+        while len(carbon.metrics()) < count and time.time() < end:
+            time.sleep(0.05)
+        self.assertEqual(len(carbon.metrics()), count)
+
+    def test_pickle_batches(self):
+        """The metrics are sent by batches on a single connection
+
+        :return: None
+        """
+        carbon = StubCarbon()
+        pool = CarbonPool(batch_size=100, flush_interval=200)
+        metrics = [('srv001.ping.rta', (1500000000 + index, index * 0.5))
+                   for index in range(250)]
+        for index in range(0, 250, 50):
+            self.assertTrue(pool.send('127.0.0.1', carbon.port, metrics[index:index + 50]))
+        self.wait_for(carbon, 250)
+
+        self.assertEqual(carbon.metrics(), metrics)
+        self.assertEqual(carbon.connections, 1)
+        self.assertTrue(all(len(batch) <= 100 for batch in carbon.batches))
+        stats = pool.stats()['127.0.0.1:%d' % carbon.port]
+        self.assertEqual(stats['sent'], 250)
+        self.assertEqual(stats['buffered'], 0)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['batches'], len(carbon.batches))
+
+        # The connection is kept for the next metrics
+        self.assertTrue(pool.send('127.0.0.1', carbon.port, metrics[:10]))
+        self.wait_for(carbon, 260)
+        self.assertEqual(carbon.connections, 1)
+
+        pool.stop()
+        carbon.stop()
+
+    def test_stop_flush(self):
+        """The buffered metrics are sent when the pool is stopped
+
+        :return: None
+        """
+        carbon = StubCarbon()
+        pool = CarbonPool(batch_size=1000, flush_interval=60000)
+        self.assertTrue(pool.send('127.0.0.1', carbon.port, [('a.b', (1500000000, 1))]))
+        time.sleep(0.2)
+        self.assertEqual(carbon.metrics(), [])
+        pool.stop()
+        self.wait_for(carbon, 1)
+        carbon.stop()
+
+    def wait_for_error(self, pool, name, timeout=5):
+        """Wait until a connection of the pool failed"""
+        end = time.time() + timeout
+        while pool.stats()[name]['available'] and time.time() < end:
+            time.sleep(0.05)
+        self.assertFalse(pool.stats()[name]['available'])
+
+    def test_unavailable(self):
+        """The metrics are refused while the carbon daemon is not available, and sent when it
+        is available again
+
+        :return: None
+        """
+        carbon = StubCarbon()
+        port = carbon.port
+        name = '127.0.0.1:%d' % port
+        carbon.stop()
+
+        # The connection is opened by the pool thread, the first metrics are buffered
+        pool = CarbonPool(batch_size=10, flush_interval=100, retry_delay=1)
+        self.assertTrue(pool.send('127.0.0.1', port, [('a.b', (1500000000, 1))]))
+        self.wait_for_error(pool, name)
+        stats = pool.stats()[name]
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['buffered'], 1)
+        # No new connection during the retry delay
+        self.assertFalse(pool.send('127.0.0.1', port, [('a.b', (1500000001, 2))]))
+        self.assertEqual(pool.stats()[name]['errors'], 1)
+
+        # The buffered metrics are sent first
+        carbon = StubCarbon(port)
+        time.sleep(1)
+        self.assertTrue(pool.send('127.0.0.1', port, [('a.b', (1500000002, 3))]))
+        self.wait_for(carbon, 2)
+        self.assertEqual(carbon.metrics(), [('a.b', (1500000000, 1)), ('a.b', (1500000002, 3))])
+        self.assertEqual(pool.stats()[name]['refused'], 1)
+
+        # A new connection is opened when the connection is lost
+        carbon.stop()
+        carbon.thread.join(1)
+        carbon = StubCarbon(port)
+        end = time.time() + 5
+        while len(carbon.metrics()) < 1 and time.time() < end:
+            pool.send('127.0.0.1', port, [('a.b', (1500000003, 4))])
+            time.sleep(0.2)
+        self.assertGreaterEqual(carbon.connections, 1)
+        self.assertIn(('a.b', (1500000003, 4)), carbon.metrics())
+
+        pool.stop()
+        carbon.stop()
+
+    def test_buffer_full(self):
+        """The metrics are refused when the buffer is full
+
+        :return: None
+        """
+        carbon = StubCarbon()
+        pool = CarbonPool(maxsize=5, batch_size=100, flush_interval=60000)
+        self.assertTrue(pool.send('127.0.0.1', carbon.port, [('a.b', (1500000000, 1))] * 5))
+        self.assertFalse(pool.send('127.0.0.1', carbon.port, [('a.b', (1500000001, 1))]))
+        self.assertEqual(pool.stats()['127.0.0.1:%d' % carbon.port]['refused'], 1)
+
+        pool.stop()
+        self.wait_for(carbon, 5)
+        carbon.stop()
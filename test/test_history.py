@@ -566,3 +566,87 @@ class TestHistory(unittest2.TestCase):
         re = resp['_items']
         # No results ...
         self.assertEqual(len(re), 3)
+
+    def test_history_names_cache(self):
+        """Test history: hosts and services names are resolved with the names cache
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        response = requests.get(self.endpoint + '/host', auth=self.auth,
+                                params={'where': json.dumps({'name': 'srv001'})})
+        resp = response.json()
+        host = resp['_items'][0]
+
+        response = requests.get(self.endpoint + '/backendstats')
+        resp = response.json()
+        hits = resp['caches']['names']['hits']
+
+        # Create two events for the same host and service
+        for count in range(2):
+            data = {
+                'host_name': "srv001",
+                'service_name': "ping",
+                'user': None,
+                'type': 'monitoring.alert',
+                'message': "Test event #%d" % count
+            }
+            response = requests.post(self.endpoint + '/history',
+                                     json=data, headers=headers, auth=self.auth)
+            resp = response.json()
+            self.assertEqual('OK', resp['_status'], resp)
+
+        # The second event got the host and the service from the cache
+        response = requests.get(self.endpoint + '/backendstats')
+        resp = response.json()
+        self.assertGreaterEqual(resp['caches']['names']['hits'], hits + 2)
+
+        # Cache the host in this process
+        from bson import ObjectId
+        from alignak_backend.app import app
+        from alignak_backend.names import Names
+        with app.test_request_context():
+            self.assertEqual(Names.get('host', _id=ObjectId(host['_id']))['name'], 'srv001')
+
+        # Rename the host, the cache entries are removed
+        data = {'name': 'srv001-renamed'}
+        headers_patch = {'Content-Type': 'application/json', 'If-Match': host['_etag']}
+        response = requests.patch(self.endpoint + '/host/' + host['_id'], json=data,
+                                  headers=headers_patch, auth=self.auth)
+        resp = response.json()
+        self.assertEqual('OK', resp['_status'], resp)
+
+        with app.test_request_context():
+            # Renamed by the backend (uwsgi process), the cache of this process is cleared too
+            self.assertEqual(Names.get('host', _id=ObjectId(host['_id']))['name'],
+                             'srv001-renamed')
+            self.assertIsNone(Names.get('host', name='srv001'))
+
+        data = {
+            'host': host['_id'],
+            'user': None,
+            'type': 'monitoring.alert',
+            'message': "Test event for the renamed host"
+        }
+        response = requests.post(self.endpoint + '/history',
+                                 json=data, headers=headers, auth=self.auth)
+        resp = response.json()
+        self.assertEqual('OK', resp['_status'], resp)
+
+        response = requests.get(self.endpoint + '/history', params={'sort': '_id'},
+                                auth=self.auth)
+        resp = response.json()
+        re = resp['_items']
+        self.assertEqual(len(re), 3)
+        self.assertEqual(re[0]['host'], host['_id'])
+        self.assertEqual(re[1]['host'], host['_id'])
+        self.assertEqual(re[2]['host_name'], 'srv001-renamed')
+
+        # Restore the host name for the tear down
+        response = requests.get(self.endpoint + '/host/' + host['_id'], auth=self.auth)
+        resp = response.json()
+        data = {'name': 'srv001'}
+        headers_patch = {'Content-Type': 'application/json', 'If-Match': resp['_etag']}
+        requests.patch(self.endpoint + '/host/' + host['_id'], json=data,
+                       headers=headers_patch, auth=self.auth)
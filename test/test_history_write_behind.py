@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test checks the check results history write-behind queue
+"""
+
+from __future__ import print_function
+import os
+import json
+import time
+import shlex
+import subprocess
+from calendar import timegm
+from datetime import datetime
+import requests
+import unittest2
+
+
+class TestHistoryWriteBehind(unittest2.TestCase):
+    """This class tests the check results history write-behind queue"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This method:
+          * deletes mongodb database
+          * starts the backend with uwsgi
+          * logs in the backend and get the token
+          * gets the default realm and creates an host
+
+        :return: None
+        """
+        # Set test mode for Alignak backend
+        os.environ['ALIGNAK_BACKEND_TEST'] = '1'
+        os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'] = 'alignak-backend-test'
+        os.environ['ALIGNAK_BACKEND_CONFIGURATION_FILE'] = \
+            './cfg/settings/settings_history_write_behind.json'
+
+        # Delete used mongo DBs
+        exit_code = subprocess.call(
+            shlex.split(
+                'mongo %s --eval "db.dropDatabase()"' % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'])
+        )
+        assert exit_code == 0
+
+        cls.p = subprocess.Popen(['uwsgi', '--plugin', 'python', '-w', 'alignak_backend.app:app',
+                                  '--socket', '0.0.0.0:5000',
+                                  '--protocol=http', '--enable-threads', '--pidfile',
+                                  '/tmp/uwsgi.pid'])
+        time.sleep(3)
+
+        cls.endpoint = 'http://127.0.0.1:5000'
+
+        headers = {'Content-Type': 'application/json'}
+        params = {'username': 'admin', 'password': 'admin', 'action': 'generate'}
+        # get token
+        response = requests.post(cls.endpoint + '/login', json=params, headers=headers)
+        resp = response.json()
+        cls.token = resp['token']
+        cls.auth = requests.auth.HTTPBasicAuth(cls.token, '')
+
+        # Get default realm
+        response = requests.get(cls.endpoint + '/realm', auth=cls.auth)
+        resp = response.json()
+        cls.realm_all = resp['_items'][0]['_id']
+
+        # Add command
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = cls.realm_all
+        requests.post(cls.endpoint + '/command', json=data, headers=headers, auth=cls.auth)
+        response = requests.get(cls.endpoint + '/command?where={"name":"ping"}', auth=cls.auth)
+        resp = response.json()
+        rc = resp['_items']
+
+        # Add an host
+        data = json.loads(open('cfg/host_srv001.json').read())
+        data['check_command'] = rc[0]['_id']
+        if 'realm' in data:
+            del data['realm']
+        data['_realm'] = cls.realm_all
+        response = requests.post(cls.endpoint + '/host', json=data, headers=headers, auth=cls.auth)
+        resp = response.json()
+        cls.host = resp['_id']
+
+    @classmethod
+    def tearDownClass(cls):
+        """Kill uwsgi
+
+        :return: None
+        """
+        subprocess.call(['uwsgi', '--stop', '/tmp/uwsgi.pid'])
+        time.sleep(2)
+
+    def test_history_write_behind(self):
+        """The check results history events are inserted by a background thread
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        now = timegm(datetime.utcnow().timetuple())
+        for index in range(25):
+            data = {
+                "last_check": now + index,
+                "host": self.host,
+                'acknowledged': False,
+                'state_id': 0,
+                'state': 'UP',
+                'state_type': 'HARD',
+                'last_state_id': 0,
+                'last_state': 'UP',
+                'last_state_type': 'HARD',
+                'state_changed': False,
+                'output': 'Check output %d' % index
+            }
+            response = requests.post(
+                self.endpoint + '/logcheckresult', json=data, headers=headers, auth=self.auth
+            )
+            resp = response.json()
+            self.assertEqual(resp['_status'], 'OK')
+
+        response = requests.get(self.endpoint + '/backendstats')
+        resp = response.json()
+        self.assertEqual(resp['queues']['history']['queued'], 25)
+        self.assertEqual(resp['queues']['history']['dropped'], 0)
+
+        # Wait for the last events insertion
+        time.sleep(1)
+
+        response = requests.get(self.endpoint + '/backendstats')
+        resp = response.json()
+        self.assertEqual(resp['queues']['history']['depth'], 0)
+        self.assertEqual(resp['queues']['history']['flushed'], 25)
+        self.assertGreaterEqual(resp['queues']['history']['flushes'], 3)
+
+        response = requests.get(self.endpoint + '/history', params={'sort': '_id'},
+                                auth=self.auth)
+        resp = response.json()
+        re = resp['_items']
+        self.assertEqual(len(re), 25)
+        self.assertEqual(re[0]['host_name'], 'srv001')
+        self.assertEqual(re[0]['type'], 'check.result')
+        self.assertEqual(re[0]['message'], 'UP[HARD] (False/False): Check output 0')
+        self.assertEqual(re[0]['_realm'], self.realm_all)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test checks the InfluxDB clients pool with a stub InfluxDB HTTP API
+"""
+
+from __future__ import print_function
+import threading
+import time
+import unittest2
+from bson.objectid import ObjectId
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+from alignak_backend.influxdbpool import InfluxdbPool, make_line
+
+
+class StubInfluxdbHandler(BaseHTTPRequestHandler):
+    """InfluxDB HTTP API stub: answers the ping and stores the written lines"""
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """No requests log"""
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Ping"""
+        self.server.pings += 1
+        self.send_response(204)
+        self.send_header('X-Influxdb-Version', '1.5.0')
+        self.end_headers()
+
+    do_HEAD = do_GET
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Write, or reject the points if the server status is set or if a line contains
+        the rejected text"""
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        if self.server.reject is not None and self.server.reject in body:
+            self.server.rejections += 1
+            self.send_response(400)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{"error":"partial write: field type conflict"}')
+            return
+        if self.server.status != 204:
+            self.send_response(self.server.status)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{"error":"unable to parse points"}')
+            return
+        self.server.writes.append(body.splitlines())
+        self.send_response(204)
+        self.end_headers()
+
+
+class TestInfluxdbPool(unittest2.TestCase):
+    """This class tests the InfluxDB clients pool"""
+
+    def setUp(self):
+        """Start the stub InfluxDB
+
+        :return: None
+        """
+        self.server = HTTPServer(('127.0.0.1', 0), StubInfluxdbHandler)
+        self.server.pings = 0
+        self.server.writes = []
+        self.server.status = 204
+        self.server.reject = None
+        self.server.rejections = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.influxdb = {
+            '_id': ObjectId(), 'name': 'influxdb 001', 'address': '127.0.0.1',
+            'port': self.server.server_address[1], 'login': 'alignak', 'password': 'alignak',
+            'database': 'alignak'
+        }
+
+    def tearDown(self):
+        """Stop the stub InfluxDB
+
+        :return: None
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_for(self, count, timeout=5):
+        """Wait until the stub received count points"""
+        end = time.time() + timeout
+        while sum(len(write) for write in self.server.writes) < count and time.time() < end:
+            time.sleep(0.05)
+        self.assertEqual(sum(len(write) for write in self.server.writes), count)
+
+    def test_make_line(self):
+        """Points line protocol, the realm tag is the realms path and the empty tags are ignored
+
+        :return: None
+        """
+        self.assertEqual(
+            make_line('rta', [('host', 'srv001'), ('service', 'ping'), ('realm', 'All.realm A')],
+                      '74.5', 1500000000),
+            'rta,host=srv001,service=ping,realm=All.realm\\ A value=74.5 1500000000000000000')
+        self.assertEqual(
+            make_line('load 1', [('host', 'srv,001'), ('service', ''), ('realm', 'All')],
+                      3, 1500000000),
+            'load\\ 1,host=srv\\,001,realm=All value=3.0 1500000000000000000')
+        # Not finite values are ignored
+        self.assertIsNone(make_line('rta', [('host', 'srv001')], 'nan', 1500000000))
+        self.assertIsNone(make_line('rta', [('host', 'srv001')], float('inf'), 1500000000))
+
+    def test_batches(self):
+        """The points are written by batches with a single client
+
+        :return: None
+        """
+        pool = InfluxdbPool(batch_size=100, flush_interval=200)
+        points = [make_line('rta', [('host', 'srv%03d' % index)], index, 1500000000)
+                  for index in range(250)]
+        for index in range(0, 250, 50):
+            self.assertTrue(pool.send(self.influxdb, points[index:index + 50]))
+        self.wait_for(250)
+
+        self.assertEqual([line for write in self.server.writes for line in write], points)
+        self.assertTrue(all(len(write) <= 100 for write in self.server.writes))
+        self.assertEqual(self.server.pings, 1)
+        stats = pool.stats()['influxdb 001']
+        self.assertEqual(stats['sent'], 250)
+        self.assertEqual(stats['connections'], 1)
+
+        # The client is created again when the influxdb is updated
+        influxdb = dict(self.influxdb, database='alignak2')
+        self.assertTrue(pool.send(influxdb, points[:10]))
+        self.wait_for(260)
+        self.assertEqual(self.server.pings, 2)
+        self.assertEqual(len(pool.stats()), 1)
+
+        pool.stop()
+
+    def test_unavailable(self):
+        """The points are refused while the InfluxDB is not available
+
+        :return: None
+        """
+        pool = InfluxdbPool(batch_size=100, flush_interval=200, retry_delay=60)
+        influxdb = dict(self.influxdb, port=1)
+        # The client is created by the pool thread, the first points are buffered
+        self.assertTrue(pool.send(influxdb, [make_line('rta', [], 1, 1500000000)]))
+        end = time.time() + 5
+        while pool.stats()['influxdb 001']['available'] and time.time() < end:
+            time.sleep(0.05)
+        self.assertFalse(pool.send(influxdb, [make_line('rta', [], 2, 1500000000)]))
+        stats = pool.stats()['influxdb 001']
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['refused'], 1)
+        self.assertEqual(stats['buffered'], 1)
+        self.assertFalse(stats['available'])
+        pool.stop()
+
+    def test_rejected(self):
+        """The points rejected by the InfluxDB are dropped, they are not written again
+
+        :return: None
+        """
+        pool = InfluxdbPool(batch_size=100, flush_interval=200)
+        self.server.status = 400
+        self.assertTrue(pool.send(self.influxdb, [make_line('rta', [], index, 1500000000)
+                                                  for index in range(3)]))
+        end = time.time() + 5
+        while pool.stats()['influxdb 001']['dropped'] < 3 and time.time() < end:
+            time.sleep(0.05)
+        stats = pool.stats()['influxdb 001']
+        self.assertEqual(stats['dropped'], 3)
+        self.assertEqual(stats['buffered'], 0)
+        self.assertEqual(stats['errors'], 0)
+        self.assertTrue(stats['available'])
+
+        # The next points are written with the same client
+        self.server.status = 204
+        self.assertTrue(pool.send(self.influxdb, [make_line('rta', [], 4, 1500000000)]))
+        self.wait_for(1)
+        self.assertEqual(self.server.writes, [[make_line('rta', [], 4, 1500000000)]])
+        self.assertEqual(pool.stats()['influxdb 001']['connections'], 1)
+        pool.stop()
+
+    def test_rejected_lines(self):
+        """Only the rejected points of a batch are dropped, the batch is split to find them
+
+        :return: None
+        """
+        pool = InfluxdbPool(batch_size=100, flush_interval=200)
+        self.server.reject = 'bad'
+        points = [make_line('rta', [('host', 'srv%03d' % index)], index, 1500000000)
+                  for index in range(20)]
+        points[13] = make_line('bad', [('host', 'srv013')], 13, 1500000000)
+        self.assertTrue(pool.send(self.influxdb, points))
+        self.wait_for(19)
+
+        self.assertEqual([line for write in self.server.writes for line in write],
+                         points[:13] + points[14:])
+        stats = pool.stats()['influxdb 001']
+        self.assertEqual(stats['sent'], 19)
+        self.assertEqual(stats['dropped'], 1)
+        self.assertEqual(stats['buffered'], 0)
+        self.assertEqual(stats['errors'], 0)
+        # The batch of 20 points and the halves of 10, 5, 3, 2 and 1 points holding the
+        # rejected point
+        self.assertEqual(self.server.rejections, 6)
+        pool.stop()
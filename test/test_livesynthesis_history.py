@@ -10,11 +10,13 @@ import time
 import shlex
 import subprocess
 import copy
+from calendar import timegm
 from datetime import datetime, timedelta
 from freezegun import freeze_time
 import requests
 import unittest2
-from eve.utils import date_to_str
+from bson.objectid import ObjectId
+from pymongo import MongoClient
 
 
 class TestHookLivesynthesis(unittest2.TestCase):
@@ -56,6 +58,8 @@ class TestHookLivesynthesis(unittest2.TestCase):
         time.sleep(3)
 
         cls.endpoint = 'http://127.0.0.1:5000'
+        cls.mongo = MongoClient('localhost', 27017)
+        cls.db = cls.mongo[os.environ['ALIGNAK_BACKEND_MONGO_DBNAME']]
 
         headers = {'Content-Type': 'application/json'}
         params = {'username': 'admin', 'password': 'admin', 'action': 'generate'}
@@ -141,22 +145,9 @@ class TestHookLivesynthesis(unittest2.TestCase):
 
         # add in mongo some retention elements
         for item in rl:
-            for i in range(15, 20):
-                data = copy.deepcopy(item)
-                data['livesynthesis'] = item['_id']
-                for prop in ['_id', '_etag', '_created', '_updated', '_links', 'history',
-                             '_realm']:
-                    if prop in data:
-                        del data[prop]
-                data['_created'] = date_to_str(datetime.utcnow() - timedelta(minutes=i))
-                jsondata = shlex.split('mongo %s --eval "db.livesynthesisretention.insert'
-                                       '("' % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'])
-                jsondata[-1] = jsondata[-1] + json.dumps(data, separators=(',', ':')) + ")"
-                jsondata[-1] = jsondata[-1].replace('"' + item['_id'] + '"',
-                                                    "ObjectId('%s')" % item['_id'])
+            for i in reversed(range(15, 20)):
+                cls.add_history(item, datetime.utcnow() - timedelta(minutes=i))
                 extra_ls_inserted += 1
-                exit_code = subprocess.call(jsondata)
-                assert exit_code == 0
         # print("Inserted %d retention items" % insert)
 
         # update ls_* in services and hosts
@@ -266,22 +257,9 @@ class TestHookLivesynthesis(unittest2.TestCase):
         rl = resp['_items']
 
         for item in rl:
-            for i in range(2, 15):
-                data = copy.deepcopy(item)
-                data['livesynthesis'] = item['_id']
-                for prop in ['_id', '_etag', '_created', '_updated', '_links', 'history',
-                             '_realm']:
-                    if prop in data:
-                        del data[prop]
-                data['_created'] = date_to_str(datetime.utcnow() - timedelta(minutes=i))
-                jsondata = shlex.split('mongo %s --eval "db.livesynthesisretention.insert'
-                                       '("' % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'])
-                jsondata[-1] = jsondata[-1] + json.dumps(data, separators=(',', ':')) + ")"
-                jsondata[-1] = jsondata[-1].replace('"' + item['_id'] + '"',
-                                                    "ObjectId('%s')" % item['_id'])
+            for i in reversed(range(2, 15)):
+                cls.add_history(item, datetime.utcnow() - timedelta(minutes=i))
                 extra_ls_inserted += 1
-                exit_code = subprocess.call(jsondata)
-                assert exit_code == 0
         # print("Inserted %d retention items" % insert)
 
         datas = {
@@ -311,27 +289,33 @@ class TestHookLivesynthesis(unittest2.TestCase):
         rl = resp['_items']
         # print("Got %d ls items" % len(rl))
         for item in rl:
-            for i in range(1, 2):
-                data = copy.deepcopy(item)
-                data['livesynthesis'] = item['_id']
-                for prop in ['_id', '_etag', '_created', '_updated', '_links', 'history',
-                             '_realm']:
-                    if prop in data:
-                        del data[prop]
-                data['_created'] = date_to_str(datetime.utcnow() - timedelta(seconds=60 * i))
-                jsondata = shlex.split(
-                    'mongo %s --eval "db.livesynthesisretention.insert("'
-                    % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'])
-                jsondata[-1] = jsondata[-1] + json.dumps(data, separators=(',', ':')) + ")"
-                jsondata[-1] = jsondata[-1].replace('"' + item['_id'] + '"',
-                                                    "ObjectId('%s')" % item['_id'])
+            for i in reversed(range(1, 2)):
+                cls.add_history(item, datetime.utcnow() - timedelta(minutes=i))
                 extra_ls_inserted += 1
-                exit_code = subprocess.call(jsondata)
-                assert exit_code == 0
         time.sleep(1.0)
         # Inserted 2x19 extra livesynthesis
         assert extra_ls_inserted == 38
 
+    @classmethod
+    def add_history(cls, item, date):
+        """Add a sample to the history of a live synthesis, as the history cron does
+
+        :param item: the live synthesis
+        :type item: dict
+        :param date: date of the sample
+        :type date: datetime
+        :return: None
+        """
+        timestamp = timegm(date.timetuple())
+        push = {'dates': date}
+        for prop in item:
+            if not prop.startswith('_') and prop != 'schema_version':
+                push[prop] = item[prop]
+        cls.db['livesynthesisretention'].update_one(
+            {'livesynthesis': ObjectId(item['_id']),
+             'bucket': datetime.utcfromtimestamp(timestamp // 3600 * 3600)},
+            {'$push': push}, upsert=True)
+
     @classmethod
     def tearDownClass(cls):
         """
@@ -921,3 +905,75 @@ class TestHookLivesynthesis(unittest2.TestCase):
         resp = response.json()
         self.assertEqual(len(resp['history']), (history_count + 1))
         # self.assertGreater(resp['history'][0]['_created'], last_history_date)
+
+    @freeze_time("2017-06-01 18:30:00")
+    def test_07_get_history_downsampled(self):
+        """
+        Test get the history since a date and with only a sample of each period
+
+        :return: None
+        """
+        response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                params={'history': 1}, auth=self.auth)
+        resp = response.json()
+        ref = [sample for sample in resp['history']
+               if sample['_created'] in ['Thu, 01 Jun 2017 18:29:00 GMT',
+                                         'Thu, 01 Jun 2017 18:24:00 GMT']]
+        self.assertEqual(len(ref), 2)
+
+        # The samples of the last 10 minutes, one sample each 5 minutes
+        history_from = timegm((datetime.utcnow() - timedelta(minutes=10)).timetuple())
+        response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                params={'history': 1, 'history_from': history_from,
+                                        'history_step': 300}, auth=self.auth)
+        resp = response.json()
+        # Ignore the sample added by the cron in the test_06
+        history = [sample for sample in resp['history'] if '2017' in sample['_created']]
+        self.assertEqual(history, ref)
+
+        response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                params={'history': 1, 'history_step': 'hour'}, auth=self.auth)
+        self.assertEqual(response.status_code, 400)
+
+    @freeze_time("2017-06-01 18:30:00")
+    def test_08_migrate_history(self):
+        """
+        Test the history stored with a document per sample is moved to the hourly history
+
+        :return: None
+        """
+        from alignak_backend.app import app
+        from alignak_backend.livesynthesis import Livesynthesis
+
+        # History of a former version, older than the hourly history
+        for minutes in [60, 50, 25]:
+            self.db['livesynthesisretention'].insert_one({
+                'livesynthesis': ObjectId(self.ls_all),
+                'hosts_total': 100 + minutes,
+                'services_total': 200 + minutes,
+                '_created': datetime.utcnow() - timedelta(minutes=minutes)
+            })
+
+        with app.test_request_context():
+            Livesynthesis.migrate_history()
+        self.assertEqual(self.db['livesynthesisretention'].count({'bucket': {'$exists': False}}),
+                         0)
+
+        response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                params={'history': 1}, auth=self.auth)
+        resp = response.json()
+        history = dict((sample['_created'], sample) for sample in resp['history'])
+        for date, minutes in [('Thu, 01 Jun 2017 17:30:00 GMT', 60),
+                              ('Thu, 01 Jun 2017 17:40:00 GMT', 50),
+                              ('Thu, 01 Jun 2017 18:05:00 GMT', 25)]:
+            self.assertEqual(history[date]['hosts_total'], 100 + minutes)
+            self.assertEqual(history[date]['services_total'], 200 + minutes)
+            self.assertEqual(history[date]['hosts_up_hard'], 0)
+
+        # The samples stay sorted by date in each hourly document
+        retention = self.db['livesynthesisretention'].find_one({
+            'livesynthesis': ObjectId(self.ls_all),
+            'bucket': datetime(2017, 6, 1, 18)
+        })
+        self.assertEqual(retention['dates'], sorted(retention['dates']))
+        self.assertEqual(retention['dates'][0], datetime(2017, 6, 1, 18, 5))
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test checks the live synthesis counters when a lot of hosts and services are updated
+concurrently by several backend processes
+"""
+
+from __future__ import print_function
+import os
+import json
+import time
+import shlex
+import random
+import subprocess
+from multiprocessing.pool import ThreadPool
+import mock
+import requests
+import unittest2
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+from alignak_backend.livesynthesis import Livesynthesis
+
+
+class TestLivesynthesisStress(unittest2.TestCase):
+    """This class checks the live synthesis counters with concurrent updates"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This method:
+          * deletes mongodb database
+          * starts the backend with uwsgi and 4 processes
+          * logs in the backend and get the token
+          * gets the default realm and creates some hosts and services
+
+        :return: None
+        """
+        # Set test mode for Alignak backend
+        os.environ['ALIGNAK_BACKEND_TEST'] = '1'
+        os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'] = 'alignak-backend-test'
+        os.environ['ALIGNAK_BACKEND_CONFIGURATION_FILE'] = './cfg/settings/settings.json'
+
+        # Delete used mongo DBs
+        exit_code = subprocess.call(
+            shlex.split(
+                'mongo %s --eval "db.dropDatabase()"' % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'])
+        )
+        assert exit_code == 0
+
+        cls.p = subprocess.Popen(['uwsgi', '--plugin', 'python', '-w', 'alignak_backend.app:app',
+                                  '--socket', '0.0.0.0:5000', '--processes', '4',
+                                  '--protocol=http', '--enable-threads', '--pidfile',
+                                  '/tmp/uwsgi.pid'])
+        time.sleep(3)
+
+        cls.endpoint = 'http://127.0.0.1:5000'
+        cls.mongo = MongoClient('localhost', 27017)
+        cls.db = cls.mongo[os.environ['ALIGNAK_BACKEND_MONGO_DBNAME']]
+
+        headers = {'Content-Type': 'application/json'}
+        params = {'username': 'admin', 'password': 'admin', 'action': 'generate'}
+        # get token
+        response = requests.post(cls.endpoint + '/login', json=params, headers=headers)
+        resp = response.json()
+        cls.token = resp['token']
+        cls.auth = requests.auth.HTTPBasicAuth(cls.token, '')
+
+        # Get default realm
+        response = requests.get(cls.endpoint + '/realm', auth=cls.auth)
+        resp = response.json()
+        cls.realm_all = resp['_items'][0]['_id']
+
+        # Add command
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = cls.realm_all
+        requests.post(cls.endpoint + '/command', json=data, headers=headers, auth=cls.auth)
+        response = requests.get(cls.endpoint + '/command?where={"name":"ping"}', auth=cls.auth)
+        resp = response.json()
+        rc = resp['_items']
+
+        # Add 20 hosts with 5 services
+        cls.elements = []
+        for index in range(20):
+            data = json.loads(open('cfg/host_srv001.json').read())
+            data['name'] = 'srv%03d' % index
+            data['check_command'] = rc[0]['_id']
+            if 'realm' in data:
+                del data['realm']
+            data['_realm'] = cls.realm_all
+            response = requests.post(cls.endpoint + '/host', json=data, headers=headers,
+                                     auth=cls.auth)
+            resp = response.json()
+            host = resp['_id']
+            cls.elements.append(('host', host))
+
+            for service_index in range(5):
+                data = json.loads(open('cfg/service_srv001_ping.json').read())
+                data['name'] = 'ping%d' % service_index
+                data['host'] = host
+                data['check_command'] = rc[0]['_id']
+                data['_realm'] = cls.realm_all
+                response = requests.post(cls.endpoint + '/service', json=data, headers=headers,
+                                         auth=cls.auth)
+                resp = response.json()
+                cls.elements.append(('service', resp['_id']))
+
+    @classmethod
+    def tearDownClass(cls):
+        """Kill uwsgi
+
+        :return: None
+        """
+        subprocess.call(['uwsgi', '--stop', '/tmp/uwsgi.pid'])
+        time.sleep(2)
+
+    def update_elements(self, elements):
+        """Update randomly the live state and the monitoring of some hosts and services
+
+        :param elements: (resource, identifier) of the elements to update
+        :type elements: list
+        :return: None
+        """
+        states = {
+            'host': ['UP', 'DOWN', 'UNREACHABLE'],
+            'service': ['OK', 'WARNING', 'CRITICAL', 'UNKNOWN', 'UNREACHABLE']
+        }
+        for _ in range(50):
+            resource, _id = random.choice(elements)
+            response = requests.get(self.endpoint + '/' + resource + '/' + _id, auth=self.auth)
+            item = response.json()
+
+            data = random.choice([
+                {'ls_state': random.choice(states[resource]),
+                 'ls_state_type': random.choice(['HARD', 'SOFT'])},
+                {'ls_state': random.choice(states[resource])},
+                {'ls_acknowledged': not item['ls_acknowledged']},
+                {'active_checks_enabled': random.choice([True, False])},
+                {'passive_checks_enabled': random.choice([True, False])},
+                {'active_checks_enabled': random.choice([True, False]),
+                 'passive_checks_enabled': random.choice([True, False]),
+                 'ls_state': random.choice(states[resource])}
+            ])
+            headers = {'Content-Type': 'application/json', 'If-Match': item['_etag']}
+            response = requests.patch(self.endpoint + '/' + resource + '/' + _id, json=data,
+                                      headers=headers, auth=self.auth)
+            self.assertEqual(response.status_code, 200, response.text)
+
+    def get_expected(self):
+        """Compute the live synthesis counters from the hosts and services
+
+        :return: live synthesis counters
+        :rtype: dict
+        """
+        expected = {}
+        for resource, type_check in [('host', 'hosts'), ('service', 'services')]:
+            expected.update(Livesynthesis.get_new_counters(type_check))
+            for item in self.db[resource].find({'_is_template': False}):
+                expected['%s_total' % type_check] += 1
+                for counter in Livesynthesis.get_counted(type_check, item):
+                    expected[counter] += 1
+        return expected
+
+    def test_concurrent_updates(self):
+        """Update the hosts and services from several clients and backend processes
+
+        Each client updates its own hosts and services
+
+        :return: None
+        """
+        clients = 8
+        pool = ThreadPool(clients)
+        pool.map(self.update_elements,
+                 [self.elements[index::clients] for index in range(clients)])
+        pool.close()
+        pool.join()
+
+        expected = self.get_expected()
+        live = self.db['livesynthesis'].find_one({'_realm': self.db['realm'].find_one()['_id']})
+        for counter, value in expected.items():
+            self.assertEqual(live[counter], value, counter)
+
+    def test_reconcile(self):
+        """The drifted live synthesis counters are corrected by the reconciliation
+
+        :return: None
+        """
+        realm = self.db['realm'].find_one()['_id']
+        expected = self.get_expected()
+
+        # Some counters drifted
+        self.db['livesynthesis'].update_one({'_realm': realm}, {
+            '$inc': {'hosts_total': 3},
+            '$set': {'services_ok_hard': expected['services_ok_hard'] + 10}
+        })
+
+        # Not reconciled if an host or a service of the realm is written while it is checked
+        from alignak_backend.app import app
+        aggregate = Livesynthesis.aggregate
+
+        def concurrent_write(type_check, realm_id=None):
+            """Increment the realm write generation, as an host or a service write"""
+            self.db['livesynthesis'].update_one({'_realm': realm}, {'$inc': {'_generation': 1}})
+            return aggregate(type_check, realm_id)
+
+        with app.test_request_context():
+            with mock.patch.object(Livesynthesis, 'aggregate', side_effect=concurrent_write):
+                Livesynthesis.reconciled_realm = None
+                self.assertEqual(Livesynthesis.reconcile(), (realm, None))
+        live = self.db['livesynthesis'].find_one({'_realm': realm})
+        self.assertEqual(live['hosts_total'], expected['hosts_total'] + 3)
+
+        response = requests.get(self.endpoint + '/cron_livesynthesis_reconcile')
+        resp = response.json()
+        self.assertEqual(resp['realm'], str(realm))
+        self.assertEqual(resp['drift'], 13)
+
+        live = self.db['livesynthesis'].find_one({'_realm': realm})
+        for counter, value in expected.items():
+            self.assertEqual(live[counter], value, counter)
+
+        # No more drift
+        response = requests.get(self.endpoint + '/cron_livesynthesis_reconcile')
+        resp = response.json()
+        self.assertEqual(resp['drift'], 0)
+
+    def test_unique_realm(self):
+        """There is only one live synthesis for each realm
+
+        :return: None
+        """
+        indexes = self.db['livesynthesis'].index_information()
+        self.assertEqual(indexes['index_realm']['key'], [('_realm', 1)])
+        self.assertTrue(indexes['index_realm']['unique'])
+
+        realm = self.db['realm'].find_one()['_id']
+        self.assertEqual(self.db['livesynthesis'].count({'_realm': realm}), 1)
+        with self.assertRaises(DuplicateKeyError):
+            self.db['livesynthesis'].insert_one({'_realm': realm})
+
+    def test_upgrade_duplicates(self):
+        """The duplicated live synthesis of a former version are removed when the backend starts
+
+        :return: None
+        """
+        realm = self.db['realm'].find_one()['_id']
+        expected = self.get_expected()
+
+        # Stop the backend and get a database of a former version
+        subprocess.call(['uwsgi', '--stop', '/tmp/uwsgi.pid'])
+        time.sleep(2)
+        self.db['livesynthesis'].drop_index('index_realm')
+        live = self.db['livesynthesis'].find_one({'_realm': realm})
+        self.db['livesynthesis'].update_one({'_id': live['_id']}, {'$inc': {'hosts_total': 5}})
+        duplicate = dict(live)
+        del duplicate['_id']
+        duplicate_id = self.db['livesynthesis'].insert_one(duplicate).inserted_id
+        self.db['livesynthesisretention'].insert_one({'livesynthesis': duplicate_id,
+                                                      'bucket': 0, 'hosts_total': [1]})
+        self.assertEqual(self.db['livesynthesis'].count({'_realm': realm}), 2)
+
+        self.p = subprocess.Popen(['uwsgi', '--plugin', 'python', '-w',
+                                   'alignak_backend.app:app',
+                                   '--socket', '0.0.0.0:5000', '--processes', '4',
+                                   '--protocol=http', '--enable-threads', '--pidfile',
+                                   '/tmp/uwsgi.pid'])
+        time.sleep(3)
+
+        # Only the first live synthesis is kept, with its history and recalculated counters
+        self.assertEqual(self.db['livesynthesis'].count({'_realm': realm}), 1)
+        live = self.db['livesynthesis'].find_one({'_realm': realm})
+        self.assertEqual(live['_id'], min(live['_id'], duplicate_id))
+        for counter, value in expected.items():
+            self.assertEqual(live[counter], value, counter)
+        self.assertEqual(self.db['livesynthesisretention'].count({'livesynthesis': duplicate_id}),
+                         0)
+        self.assertEqual(self.db['livesynthesisretention'].count({'livesynthesis': live['_id'],
+                                                                  'bucket': 0}), 1)
+
+        indexes = self.db['livesynthesis'].index_information()
+        self.assertTrue(indexes['index_realm']['unique'])
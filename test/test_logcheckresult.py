@@ -21,6 +21,8 @@ import unittest2
 class TestLogcheckresult(unittest2.TestCase):
     """This class tests the logchekresult features"""
 
+    settings_file = './cfg/settings/settings.json'
+
     @classmethod
     def setUpClass(cls):
         """This method:
@@ -34,7 +36,7 @@ class TestLogcheckresult(unittest2.TestCase):
         # Set test mode for Alignak backend
         os.environ['ALIGNAK_BACKEND_TEST'] = '1'
         os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'] = 'alignak-backend-test'
-        os.environ['ALIGNAK_BACKEND_CONFIGURATION_FILE'] = './cfg/settings/settings.json'
+        os.environ['ALIGNAK_BACKEND_CONFIGURATION_FILE'] = cls.settings_file
 
         # Delete used mongo DBs
         exit_code = subprocess.call(
@@ -755,3 +757,142 @@ class TestLogcheckresult(unittest2.TestCase):
         self.assertEqual(re[1]['type'], "check.result")
         self.assertEqual(re[1]['message'], "UP[HARD] (False/False): Check output 2")
         self.assertEqual(re[1]['logcheckresult'], check_id)
+
+        # 3 -------------------------------------------
+        # Add several check results in the same request: an old one for the host and
+        # a recent one for the service
+        now = timegm(datetime.utcnow().timetuple())
+        data = [
+            {
+                "last_check": now - 10,
+                "host": rh[0]['_id'],
+                'acknowledged': False,
+                'state_id': 1,
+                'state': 'DOWN',
+                'state_type': 'HARD',
+                'last_state_id': 0,
+                'last_state': 'UP',
+                'last_state_type': 'HARD',
+                'state_changed': True,
+                'output': 'Check output 3',
+                "_realm": self.realm_all
+            },
+            {
+                "last_check": now,
+                "host": rh[0]['_id'],
+                "service": rs[0]['_id'],
+                'acknowledged': False,
+                'state_id': 2,
+                'state': 'CRITICAL',
+                'state_type': 'SOFT',
+                'last_state_id': 0,
+                'last_state': 'OK',
+                'last_state_type': 'HARD',
+                'state_changed': True,
+                'output': 'Check output 4',
+                "_realm": self.realm_all
+            }
+        ]
+        response = requests.post(
+            self.endpoint + '/logcheckresult', json=data, headers=headers, auth=self.auth
+        )
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+
+        # The host live state did not get updated
+        response = requests.get(self.endpoint + '/host/' + rh[0]['_id'], auth=self.auth)
+        host = response.json()
+        self.assertNotEqual(host['ls_output'], 'Check output 3')
+        self.assertEqual(host['ls_state'], 'UP')
+
+        # The service live state got updated
+        response = requests.get(self.endpoint + '/service/' + rs[0]['_id'], auth=self.auth)
+        service = response.json()
+        self.assertEqual(service['ls_last_check'], now)
+        self.assertEqual(service['ls_output'], 'Check output 4')
+        self.assertEqual(service['ls_state'], 'CRITICAL')
+
+        # Both check results are stored in the history
+        response = requests.get(self.endpoint + '/history', params=sort_id, auth=self.auth)
+        resp = response.json()
+        self.assertEqual(len(resp['_items']), 4)
+
+    def test_logcheckresult_history_policy(self):
+        """
+        Test log checks results - history events only for the state changes
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        # Only record the state changes in the history for the default realm
+        response = requests.get(self.endpoint + '/realm/' + self.realm_all, auth=self.auth)
+        resp = response.json()
+        headers_patch = {'Content-Type': 'application/json', 'If-Match': resp['_etag']}
+        response = requests.patch(self.endpoint + '/realm/' + self.realm_all,
+                                  json={'history_check_result': 'state_change'},
+                                  headers=headers_patch, auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+
+        response = requests.get(self.endpoint + '/host', auth=self.auth,
+                                params={'where': json.dumps({'name': 'srv001'})})
+        resp = response.json()
+        rh = resp['_items']
+
+        # The host is UP, UP, then DOWN
+        now = timegm(datetime.utcnow().timetuple())
+        data = []
+        for index, state in enumerate(['UP', 'UP', 'DOWN']):
+            data.append({
+                "last_check": now + index,
+                "host": rh[0]['_id'],
+                'acknowledged': False,
+                'state_id': 0 if state == 'UP' else 1,
+                'state': state,
+                'state_type': 'HARD',
+                'last_state_id': 0,
+                'last_state': 'UP',
+                'last_state_type': 'HARD',
+                'state_changed': False,
+                'output': 'Check output %d' % index
+            })
+        response = requests.post(
+            self.endpoint + '/logcheckresult', json=data, headers=headers, auth=self.auth
+        )
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+
+        # All the check results are stored
+        response = requests.get(self.endpoint + '/logcheckresult', auth=self.auth)
+        resp = response.json()
+        self.assertEqual(len(resp['_items']), 3)
+
+        # Only the state changes are in the history
+        response = requests.get(self.endpoint + '/history', params={'sort': '_id'},
+                                auth=self.auth)
+        resp = response.json()
+        re = resp['_items']
+        self.assertEqual(len(re), 2)
+        self.assertEqual(re[0]['message'], "UP[HARD] (False/False): Check output 0")
+        self.assertEqual(re[1]['message'], "DOWN[HARD] (False/False): Check output 2")
+
+        # The live state got updated with the last check result
+        response = requests.get(self.endpoint + '/host/' + rh[0]['_id'], auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['ls_state'], 'DOWN')
+        self.assertEqual(resp['ls_output'], 'Check output 2')
+
+        # Restore the default policy
+        response = requests.get(self.endpoint + '/realm/' + self.realm_all, auth=self.auth)
+        resp = response.json()
+        headers_patch = {'Content-Type': 'application/json', 'If-Match': resp['_etag']}
+        requests.patch(self.endpoint + '/realm/' + self.realm_all,
+                       json={'history_check_result': 'all'},
+                       headers=headers_patch, auth=self.auth)
+
+
+class TestLogcheckresultBulkIngestion(TestLogcheckresult):
+    """This class tests the logchekresult features with the bulk livestate updates"""
+
+    settings_file = './cfg/settings/settings_lcr_bulk.json'
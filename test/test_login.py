@@ -78,3 +78,31 @@ class Test_Login(unittest2.TestCase):
         response = requests.post(self.endpoint + '/login', json=params, headers=headers)
         resp = response.json()
         assert token != resp['token']
+
+    def test_1(self):
+        """
+        Test a token regenerated by another process is no more accepted from the rights cache
+
+        :return: None
+        """
+        from alignak_backend.app import app, auth_cache
+
+        headers = {'Content-Type': 'application/json'}
+        params = {'username': 'admin', 'password': 'admin'}
+        response = requests.post(self.endpoint + '/login', json=params, headers=headers)
+        token = response.json()['token']
+
+        with app.test_request_context():
+            self.assertTrue(app.auth.check_auth(token, [], 'host', 'GET'))
+        self.assertIn(token, auth_cache)
+
+        # Generate a new token with the backend (uwsgi process)
+        params['action'] = 'generate'
+        response = requests.post(self.endpoint + '/login', json=params, headers=headers)
+        new_token = response.json()['token']
+        self.assertNotEqual(token, new_token)
+
+        with app.test_request_context():
+            # The cache version changed, the cached rights of the former token are dropped
+            self.assertFalse(app.auth.check_auth(token, [], 'host', 'GET'))
+            self.assertTrue(app.auth.check_auth(new_token, [], 'host', 'GET'))
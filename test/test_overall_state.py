@@ -12,6 +12,7 @@ import subprocess
 import copy
 import requests
 import unittest2
+from pymongo import MongoClient
 from alignak_backend.livesynthesis import Livesynthesis
 
 
@@ -725,6 +726,16 @@ class TestOverallState(unittest2.TestCase):
         new_updated = ls_host['_updated']
         self.assertEqual(updated, new_updated)
 
+        # The host services overall states counters are updated by the services hooks
+        response = requests.get(self.endpoint + '/service', auth=self.auth,
+                                params={'where': json.dumps({'host': ls_host['_id']})})
+        counters = [0, 0, 0, 0, 0]
+        for service in response.json()['_items']:
+            if service['ls_state_type'] == 'HARD' and 0 <= service['_overall_state_id'] < 5:
+                counters[service['_overall_state_id']] += 1
+        self.assertEqual(ls_host['_overall_services'], counters)
+        self.assertEqual(counters[2], 1)
+
     def test_create_service(self):
         """Test service overall state computation when creating a service
 
@@ -1251,3 +1262,102 @@ class TestOverallState(unittest2.TestCase):
         ls_host = response.json()
         # _overall_state_id field is 2 (at least one service is problem and downtimed)
         self.assertEqual(2, ls_host['_overall_state_id'])
+
+    def test_update_services_batch(self):
+        """Test host overall state computation when a batch of services checks results is posted
+
+        The host overall state is computed and written once, at the end of the request
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+        sort_id = {'sort': '_id'}
+
+        # Add command
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = self.realm_all
+        requests.post(self.endpoint + '/command', json=data, headers=headers, auth=self.auth)
+        response = requests.get(self.endpoint + '/command', params=sort_id, auth=self.auth)
+        resp = response.json()
+        rc = resp['_items']
+
+        # Add host
+        data = json.loads(open('cfg/host_srv001.json').read())
+        data['check_command'] = rc[2]['_id']
+        if 'realm' in data:
+            del data['realm']
+        data['_realm'] = self.realm_all
+        response = requests.post(self.endpoint + '/host', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        host_id = resp['_id']
+
+        # Add 20 services
+        data = []
+        for index in range(20):
+            service = json.loads(open('cfg/service_srv001_ping.json').read())
+            service['name'] = 'ping%02d' % index
+            service['host'] = host_id
+            service['check_command'] = rc[2]['_id']
+            service['_realm'] = self.realm_all
+            data.append(service)
+        response = requests.post(self.endpoint + '/service', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        services = [item['_id'] for item in resp['_items']]
+
+        # Host is UP
+        response = requests.get(self.endpoint + '/host/' + host_id, auth=self.auth)
+        ls_host = response.json()
+        data = {
+            'ls_state': 'UP',
+            'ls_state_id': 0,
+            'ls_state_type': 'HARD',
+            'ls_acknowledged': False,
+        }
+        headers_patch = {
+            'Content-Type': 'application/json',
+            'If-Match': ls_host['_etag']
+        }
+        requests.patch(self.endpoint + '/host/' + host_id, json=data,
+                       headers=headers_patch, auth=self.auth)
+
+        # All the services are CRITICAL
+        data = []
+        for service in services:
+            data.append({
+                'host': host_id,
+                'service': service,
+                'last_check': int(time.time()),
+                'acknowledged': False,
+                'state_id': 2,
+                'state': 'CRITICAL',
+                'state_type': 'HARD',
+                'last_state_id': 0,
+                'last_state': 'OK',
+                'last_state_type': 'HARD',
+                'state_changed': True,
+                'output': 'CRITICAL'
+            })
+        mongo = MongoClient('localhost', 27017)
+        collection = '%s.host' % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME']
+        host_updates = mongo['admin'].command('top')['totals'][collection]['update']['count']
+        response = requests.post(self.endpoint + '/logcheckresult', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+        host_updates = \
+            mongo['admin'].command('top')['totals'][collection]['update']['count'] - host_updates
+
+        # Only one host update for all its services
+        self.assertEqual(host_updates, 1)
+
+        response = requests.get(self.endpoint + '/service', auth=self.auth,
+                                params={'where': json.dumps({'host': host_id})})
+        resp = response.json()
+        for service in resp['_items']:
+            self.assertEqual(4, service['_overall_state_id'])
+
+        response = requests.get(self.endpoint + '/host/' + host_id, auth=self.auth)
+        ls_host = response.json()
+        self.assertEqual(4, ls_host['_overall_state_id'])
@@ -11,6 +11,7 @@ import shlex
 import subprocess
 import copy
 import requests
+from bson.objectid import ObjectId
 import unittest2
 
 
@@ -570,3 +571,51 @@ class TestRealms(unittest2.TestCase):
         self.assertEqual(len(re), 1)
         self.assertEqual(re[0]['_children'], [])
         self.assertEqual(re[0]['_all_children'], [])
+
+    def test_realm_tree(self):
+        """
+        test the realms tree snapshot is rebuilt when a realm is modified by another process
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        from alignak_backend.app import app
+        from alignak_backend.realmtree import RealmTree
+
+        data = {"name": "All A", "_parent": self.realmAll_id}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realm_a = ObjectId(response.json()['_id'])
+
+        data = {"name": "All A1", "_parent": str(realm_a)}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realm_a1 = ObjectId(response.json()['_id'])
+
+        with app.test_request_context():
+            self.assertEqual(RealmTree.get_realm(realm_a1)['prefix'], 'All.All A.All A1')
+            self.assertEqual(RealmTree.get_tree_parents(realm_a1),
+                             [ObjectId(self.realmAll_id), realm_a])
+            self.assertEqual(RealmTree.get_all_children(ObjectId(self.realmAll_id)),
+                             [realm_a, realm_a1])
+            version = RealmTree.version
+
+        # Add a realm with the backend (uwsgi process)
+        data = {"name": "All A2", "_parent": str(realm_a)}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realm_a2 = ObjectId(response.json()['_id'])
+
+        with app.test_request_context():
+            # The snapshot version changed, the snapshot is rebuilt
+            self.assertEqual(sorted(RealmTree.get_all_children(realm_a)),
+                             sorted([realm_a1, realm_a2]))
+            self.assertNotEqual(RealmTree.version, version)
+            self.assertEqual(RealmTree.get_realm(realm_a2)['prefix'], 'All.All A.All A2')
+
+        with app.test_request_context():
+            # An unknown realm does not rebuild the snapshot while its version is unchanged
+            realms = RealmTree.get_realms()
+            self.assertIsNone(RealmTree.get_realm(ObjectId()))
+            self.assertIs(RealmTree.realms, realms)
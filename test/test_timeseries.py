@@ -120,6 +120,22 @@ class TestTimeseries(unittest2.TestCase):
         for resource in ['host', 'service', 'grafana', 'graphite', 'influxdb']:
             requests.delete(cls.endpoint + '/' + resource, auth=cls.auth)
 
+    @staticmethod
+    def set_tsdb_unavailable(export, *args):
+        """Export some metrics and try to send them at once. The TSDB of the tests are not
+        available: the connections fail, then the next metrics are refused and stored in the
+        timeseries retention for the connections retry delay. The retention is emptied.
+
+        :param export: metrics export function
+        :type export: function
+        :return: None
+        """
+        from alignak_backend.app import current_app
+        export(*args)
+        Timeseries.carbon.flush(force=True)
+        Timeseries.influxdb.flush(force=True)
+        current_app.data.driver.db['timeseriesretention'].drop()
+
     def test_prepare_data(self):
         """Prepare timeseries from a web perfdata
 
@@ -543,6 +559,44 @@ class TestTimeseries(unittest2.TestCase):
         }
         self.assertItemsEqual(reference['data'], ret['data'])
 
+    def test_sanitize_name_cache(self):
+        """The sanitized names are cached
+
+        :return: None
+        """
+        Timeseries.configure(2)
+        self.assertEqual(Timeseries.sanitize_name(" /var/log used %"), "_var-log_used__pct")
+        self.assertEqual(Timeseries.sanitize_name(" /var/log used %"), "_var-log_used__pct")
+        self.assertEqual(Timeseries.sanitize_name("C:\\ Used+Space"), "C_Used_Space")
+        self.assertEqual(Timeseries.names, {" /var/log used %": "_var-log_used__pct",
+                                            "C:\\ Used+Space": "C_Used_Space"})
+
+        # The cache is emptied when it is full
+        self.assertEqual(Timeseries.sanitize_name("srv 001"), "srv_001")
+        self.assertEqual(Timeseries.names, {"srv 001": "srv_001"})
+
+        # Cache disabled
+        Timeseries.configure(0)
+        self.assertEqual(Timeseries.sanitize_name("srv 001"), "srv_001")
+        self.assertEqual(len(Timeseries.names), 0)
+        Timeseries.configure(100000)
+
+    def test_export_deleted_items(self):
+        """The log checks results of the deleted hosts and services are ignored
+
+        :return: None
+        """
+        items = [{
+            'host': ObjectId(), 'service': None, '_realm': ObjectId(self.realm_all),
+            'last_check': int(time.time()), 'state_id': 0, 'perf_data': 'rta=1.5ms;100;110;0'
+        }, {
+            'host': ObjectId(), 'service': ObjectId(), '_realm': ObjectId(self.realm_all),
+            'last_check': int(time.time()), 'state_id': 0, 'perf_data': 'rta=1.5ms;100;110;0'
+        }]
+        from alignak_backend.app import app
+        with app.test_request_context():
+            Timeseries.export(items)
+
     def test_generate_realm_prefix(self):
         """Test generate realm prefix when have many levels
 
@@ -732,6 +786,7 @@ class TestTimeseries(unittest2.TestCase):
             # each tries send to timeseries)
             # Plus some time because the former test (test_sanitized) also has some TSDB ...
             # so 12 seconds
+            self.set_tsdb_unavailable(Timeseries.after_inserted_logcheckresult, [item])
             time_begin = time.time()
             Timeseries.after_inserted_logcheckresult([item])
             execution_time = time.time() - time_begin
@@ -871,6 +926,7 @@ class TestTimeseries(unittest2.TestCase):
             # test with timeseries not available, it must be quick (< 3 seconds), because have
             # 2 graphites and 1 influx, so (2 + 1) * 1 second timeout * 2 (code execution between
             # each tries send to timeseries)
+            self.set_tsdb_unavailable(Timeseries.after_inserted_logcheckresult, [item])
             time_begin = time.time()
             Timeseries.after_inserted_logcheckresult([item])
             execution_time = time.time() - time_begin
@@ -1018,6 +1074,7 @@ class TestTimeseries(unittest2.TestCase):
             # test with timeseries not available, it must be quick (< 3 seconds), because have
             # 2 graphites and 1 influx, so (2 + 1) * 1 second timeout * 2 (code execution between
             # each tries send to timeseries)
+            self.set_tsdb_unavailable(Timeseries.after_inserted_logcheckresult, [item])
             time_begin = time.time()
             Timeseries.after_inserted_logcheckresult([item])
             execution_time = time.time() - time_begin
@@ -1132,6 +1189,7 @@ class TestTimeseries(unittest2.TestCase):
             # test with timeseries not available, it must be quick (< 3 seconds), because have
             # 3 graphites and 1 influx, so (3 + 1) * 1 second timeout * 2 (code execution
             # between each tries send to timeseries)
+            self.set_tsdb_unavailable(Timeseries.after_inserted_logcheckresult, [item])
             time_begin = time.time()
             Timeseries.after_inserted_logcheckresult([item])
             execution_time = time.time() - time_begin
@@ -1329,6 +1387,7 @@ class TestTimeseries(unittest2.TestCase):
             # test with timeseries not available, it must be quick (< 3 seconds), because have
             # 2 graphites and 1 influx, so (2 + 1) * 1 second timeout * 2 (code execution between
             # each tries send to timeseries)
+            self.set_tsdb_unavailable(Timeseries.after_inserted_logcheckresult, [item])
             time_begin = time.time()
             Timeseries.after_inserted_logcheckresult([item])
             execution_time = time.time() - time_begin
@@ -1832,3 +1891,70 @@ class TestTimeseries(unittest2.TestCase):
             assert retentions.count() == 0
 
             timeseriesretention_db.drop()
+
+    def test_livesynthesis_snapshot(self):
+        """Test the live synthesis metrics of all the realms sent with one write per TSDB
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        # add graphite 001, realm All and its sub-realms
+        data = {
+            'name': 'graphite 001',
+            'carbon_address': '192.168.0.101',
+            'graphite_address': '192.168.0.101',
+            'prefix': 'graphite1',
+            '_realm': self.realm_all,
+            '_sub_realm': True
+        }
+        response = requests.post(self.endpoint + '/graphite', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual('OK', resp['_status'], resp)
+        graphite_001 = resp['_id']
+
+        # add graphite 002, realm All A, no sub-realms
+        data = {
+            'name': 'graphite 002',
+            'carbon_address': '192.168.0.102',
+            'graphite_address': '192.168.0.102',
+            'prefix': '',
+            '_realm': self.realm_all_A,
+            '_sub_realm': False
+        }
+        response = requests.post(self.endpoint + '/graphite', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual('OK', resp['_status'], resp)
+        graphite_002 = resp['_id']
+
+        from alignak_backend.app import app, current_app
+        from alignak_backend.livesynthesis import Livesynthesis
+        with app.test_request_context():
+            timeseriesretention_db = current_app.data.driver.db['timeseriesretention']
+            timeseriesretention_db.drop()
+
+            # The graphites are not available, the metrics are stored in the retention
+            self.set_tsdb_unavailable(Livesynthesis.publish_metrics)
+            realms = current_app.data.driver.db['realm'].count()
+            self.assertEqual(Livesynthesis.publish_metrics(), realms)
+            counters = len(Livesynthesis.get_new_livesynthesis())
+
+            # All the realms for graphite 001
+            retentions = list(timeseriesretention_db.find({'graphite': ObjectId(graphite_001)}))
+            self.assertEqual(len(retentions), realms * counters)
+            prefixes = set([retention['realm'] for retention in retentions])
+            self.assertEqual(len(prefixes), realms)
+            for prefix in ['All', 'All.All A', 'All.All A.All A1', 'All.All B',
+                           'All.All B.All B1']:
+                self.assertIn(prefix, prefixes)
+
+            retentions = list(timeseriesretention_db.find({'graphite': ObjectId(graphite_002)}))
+            self.assertEqual(len(retentions), counters)
+            self.assertEqual(set([retention['realm'] for retention in retentions]),
+                             set(['All.All A']))
+            for retention in retentions:
+                self.assertEqual(retention['host'], 'alignak_livesynthesis')
+
+            timeseriesretention_db.drop()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test checks the timeseries export write-behind queue
+"""
+
+from __future__ import print_function
+import os
+import json
+import time
+import shlex
+import subprocess
+from calendar import timegm
+from datetime import datetime
+import requests
+import unittest2
+from pymongo import MongoClient
+
+
+class TestTimeseriesWriteBehind(unittest2.TestCase):
+    """This class tests the timeseries export write-behind queue"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This method:
+          * deletes mongodb database
+          * starts the backend with uwsgi
+          * logs in the backend and get the token
+          * gets the default realm and creates an host and a graphite
+
+        :return: None
+        """
+        # Set test mode for Alignak backend
+        os.environ['ALIGNAK_BACKEND_TEST'] = '1'
+        os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'] = 'alignak-backend-test'
+        os.environ['ALIGNAK_BACKEND_CONFIGURATION_FILE'] = \
+            './cfg/settings/settings_timeseries_write_behind.json'
+
+        # Delete used mongo DBs
+        exit_code = subprocess.call(
+            shlex.split(
+                'mongo %s --eval "db.dropDatabase()"' % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'])
+        )
+        assert exit_code == 0
+
+        cls.p = subprocess.Popen(['uwsgi', '--plugin', 'python', '-w', 'alignak_backend.app:app',
+                                  '--socket', '0.0.0.0:5000',
+                                  '--protocol=http', '--enable-threads', '--pidfile',
+                                  '/tmp/uwsgi.pid'])
+        time.sleep(3)
+
+        cls.endpoint = 'http://127.0.0.1:5000'
+        cls.mongo = MongoClient('localhost', 27017)
+        cls.db = cls.mongo[os.environ['ALIGNAK_BACKEND_MONGO_DBNAME']]
+
+        headers = {'Content-Type': 'application/json'}
+        params = {'username': 'admin', 'password': 'admin', 'action': 'generate'}
+        # get token
+        response = requests.post(cls.endpoint + '/login', json=params, headers=headers)
+        resp = response.json()
+        cls.token = resp['token']
+        cls.auth = requests.auth.HTTPBasicAuth(cls.token, '')
+
+        # Get default realm
+        response = requests.get(cls.endpoint + '/realm', auth=cls.auth)
+        resp = response.json()
+        cls.realm_all = resp['_items'][0]['_id']
+
+        # Add command
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = cls.realm_all
+        requests.post(cls.endpoint + '/command', json=data, headers=headers, auth=cls.auth)
+        response = requests.get(cls.endpoint + '/command?where={"name":"ping"}', auth=cls.auth)
+        resp = response.json()
+        rc = resp['_items']
+
+        # Add an host
+        data = json.loads(open('cfg/host_srv001.json').read())
+        data['check_command'] = rc[0]['_id']
+        if 'realm' in data:
+            del data['realm']
+        data['_realm'] = cls.realm_all
+        response = requests.post(cls.endpoint + '/host', json=data, headers=headers, auth=cls.auth)
+        resp = response.json()
+        cls.host = resp['_id']
+
+        # Add a graphite, its carbon daemon is not available
+        data = {
+            'name': 'graphite 001',
+            'carbon_address': '127.0.0.1',
+            'carbon_port': 1,
+            'graphite_address': '127.0.0.1',
+            'prefix': '',
+            '_realm': cls.realm_all,
+            '_sub_realm': True
+        }
+        response = requests.post(cls.endpoint + '/graphite', json=data, headers=headers,
+                                 auth=cls.auth)
+        resp = response.json()
+        cls.graphite = resp['_id']
+
+        # The carbon connection is opened by the carbon pool thread: the metrics of a first log
+        # check result are buffered and the connection fails, then the next metrics are refused
+        # and stored in the timeseries retention
+        data = {
+            "last_check": timegm(datetime.utcnow().timetuple()) - 3600,
+            "host": cls.host,
+            'state_id': 0,
+            'state': 'UP',
+            'state_type': 'HARD',
+            'output': 'Check output',
+            'perf_data': 'rta=0.5ms;100;110;0'
+        }
+        requests.post(cls.endpoint + '/logcheckresult', json=data, headers=headers,
+                      auth=cls.auth)
+        time.sleep(3)
+        cls.db['timeseriesretention'].drop()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Kill uwsgi
+
+        :return: None
+        """
+        subprocess.call(['uwsgi', '--stop', '/tmp/uwsgi.pid'])
+        time.sleep(2)
+
+    def test_timeseries_write_behind(self):
+        """The log checks results metrics are sent by a background thread
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        response = requests.get(self.endpoint + '/backendstats')
+        queue = response.json()['queues']['timeseries']
+
+        now = timegm(datetime.utcnow().timetuple())
+        for index in range(25):
+            data = {
+                "last_check": now + index,
+                "host": self.host,
+                'acknowledged': False,
+                'state_id': 0,
+                'state': 'UP',
+                'state_type': 'HARD',
+                'last_state_id': 0,
+                'last_state': 'UP',
+                'last_state_type': 'HARD',
+                'state_changed': False,
+                'output': 'Check output %d' % index,
+                'perf_data': 'rta=%d.5ms;100;110;0 pl=0%%;10;;0' % index
+            }
+            response = requests.post(
+                self.endpoint + '/logcheckresult', json=data, headers=headers, auth=self.auth
+            )
+            resp = response.json()
+            self.assertEqual(resp['_status'], 'OK')
+
+        response = requests.get(self.endpoint + '/backendstats')
+        resp = response.json()
+        self.assertEqual(resp['queues']['timeseries']['queued'] - queue['queued'], 25)
+        self.assertEqual(resp['queues']['timeseries']['dropped'], 0)
+
+        # Wait for the last metrics export
+        time.sleep(1)
+
+        response = requests.get(self.endpoint + '/backendstats')
+        resp = response.json()
+        self.assertEqual(resp['queues']['timeseries']['depth'], 0)
+        self.assertEqual(resp['queues']['timeseries']['flushed'] - queue['flushed'], 25)
+        self.assertEqual(resp['queues']['timeseries']['errors'], 0)
+        self.assertGreaterEqual(resp['queues']['timeseries']['flushes'], 3)
+
+        # The carbon daemon is not available, the metrics are in the timeseries retention
+        retentions = list(self.db['timeseriesretention'].find({'name': 'rta'}).sort('timestamp'))
+        self.assertEqual(len(retentions), 25)
+        self.assertEqual(retentions[0]['host'], 'srv001')
+        self.assertEqual(retentions[0]['service'], '')
+        self.assertEqual(retentions[0]['realm'], 'All')
+        self.assertEqual(retentions[0]['value'], '0.5')
+        self.assertEqual(retentions[0]['timestamp'], now)
+        self.assertEqual(str(retentions[0]['graphite']), self.graphite)
+        # rta and pl values, thresholds and limits, state and overall state
+        self.assertEqual(self.db['timeseriesretention'].count({'timestamp': now}), 10)